@@ -1,4 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import router
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import exports, search
 from .models import (
     VisitorSession,
     PageView,
@@ -6,51 +16,316 @@ from .models import (
     ClickEvent,
     FreeLessonLead,
     FailedLead,
+    HourlyPageStat,
+    HourlySectionStat,
+    HourlyClickStat,
 )
 
 
+@admin.action(description="Выгрузить в CSV")
+def export_csv(modeladmin, request, queryset):
+    return exports.streaming_response(queryset, fmt="csv")
+
+
+@admin.action(description="Выгрузить в NDJSON")
+def export_ndjson(modeladmin, request, queryset):
+    return exports.streaming_response(queryset, fmt="ndjson")
+
+
+class IndexedSearchMixin:
+    """
+    Поиск в админке по FTS-индексу (analytics/search.py) вместо LIKE '%...%'.
+    exact_search_fields — дешёвые точные совпадения по индексу (ключ сессии).
+    Если индекса нет или слова короче 3 символов — обычный поиск Django.
+    """
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        pks = search.matching_pks(queryset.model, search_term, queryset.db)
+        if pks is None:
+            return super().get_search_results(request, queryset, search_term)
+
+        condition = Q(pk__in=pks)
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: search_term.strip()})
+        return queryset.filter(condition), False
+
+
 @admin.register(VisitorSession)
-class VisitorSessionAdmin(admin.ModelAdmin):
+class VisitorSessionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "session_key",
         "first_visit",
         "last_visit",
         "visit_count",
+        "device_type",
+        "in_app_browser",
         "utm_source",
         "utm_medium",
         "utm_campaign",
     )
     search_fields = ("session_key", "user_agent", "ip_address")
-    list_filter = ("utm_source", "utm_medium", "utm_campaign", "last_visit")
-    readonly_fields = ("first_visit", "last_visit", "visit_count")
+    list_filter = (
+        "device_type",
+        "os_family",
+        "browser_family",
+        "in_app_browser",
+        "utm_source",
+        "utm_medium",
+        "utm_campaign",
+        "last_visit",
+    )
+    readonly_fields = (
+        "first_visit",
+        "last_visit",
+        "visit_count",
+        "device_type",
+        "os_family",
+        "browser_family",
+        "in_app_browser",
+    )
+
+
+# ===== БОЛЬШИЕ ТАБЛИЦЫ СОБЫТИЙ =====
+
+CURSOR_VAR = "before"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Без полного COUNT(*):
+    - без фильтров — оценка по MAX(id) - MIN(id) (два чтения индекса),
+      дырки от архивации только завышают её
+    - с фильтрами — точный счёт, но не дальше EXACT_LIMIT строк
+    """
+    EXACT_LIMIT = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            bounds = queryset.model._default_manager.using(queryset.db).aggregate(
+                low=Min("pk"), high=Max("pk")
+            )
+            if bounds["high"] is None:
+                return 0
+            return bounds["high"] - bounds["low"] + 1
+        return queryset.order_by()[: self.EXACT_LIMIT].count()
+
+
+def encode_cursor(obj):
+    return f"{obj.created_at.isoformat()}_{obj.pk}"
+
+
+def decode_cursor(value):
+    created_at, _, pk = (value or "").rpartition("_")
+    created_at = parse_datetime(created_at) if created_at else None
+    if created_at is None or not pk.isdigit():
+        return None
+    return created_at, int(pk)
+
+
+def older_than(created_at, pk):
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+
+
+def newer_than(created_at, pk):
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Листание по (created_at, id) вместо OFFSET:
+    ?before=<created_at>_<id> — строки старее этой (без before — первая,
+    самая новая страница). Ссылка «новее» ведёт на предыдущую страницу:
+    её before ищется одним запросом по индексу от первой строки текущей.
+    Глубина листания не влияет на скорость — всегда поиск по индексу.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = decode_cursor(request.GET.get(CURSOR_VAR))
+        self.uncursored_queryset = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if exclude_parameters is None:
+            # с фильтрами и поиском, но без курсора — от него ищем предыдущую страницу
+            self.uncursored_queryset = queryset
+        if self.cursor:
+            queryset = queryset.filter(older_than(*self.cursor))
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.newest_query_string = self.get_query_string({CURSOR_VAR: None})
+        self.newer_query_string = self.older_query_string = None
+        # keyset работает только при сортировке по умолчанию (новые сверху)
+        if ORDER_VAR in self.params:
+            return
+
+        rows = list(self.result_list)
+        if self.cursor:
+            self.newer_query_string = self.get_query_string({CURSOR_VAR: self.newer_cursor(rows)})
+        # полная страница ещё не значит, что дальше что-то есть
+        if len(rows) >= self.list_per_page and self.queryset.filter(
+            older_than(rows[-1].created_at, rows[-1].pk)
+        ).exists():
+            self.older_query_string = self.get_query_string({CURSOR_VAR: encode_cursor(rows[-1])})
+
+    def newer_cursor(self, rows):
+        """before предыдущей страницы или None, если она первая."""
+        if not rows:
+            return None
+        first = rows[0]
+        # list_per_page строк новее первой — предыдущая страница, следующая за ними — её курсор
+        boundary = list(
+            self.uncursored_queryset
+            .filter(newer_than(first.created_at, first.pk))
+            .order_by("created_at", "pk")[self.list_per_page:self.list_per_page + 1]
+        )
+        return encode_cursor(boundary[0]) if boundary else None
+
+
+def cached_choices(source, field, model):
+    """
+    Значения поля для фильтра. Берём из почасовых агрегатов (analytics/rollups.py):
+    там строка на (час, значение), а не на событие, и DISTINCT идёт по индексу.
+    Пока агрегатов нет вовсе (update_rollups ещё не запускали) — DISTINCT
+    по самим событиям model: у всех полей фильтров есть индекс, а LIMIT
+    останавливает проход на MAX_CHOICES значениях.
+    """
+    key = f"analytics:admin-choices:{source._meta.model_name}:{field}"
+    values = cache.get(key)
+    if values is None:
+        table = source if source.objects.exists() else model
+        values = list(
+            table.objects
+            .order_by(field)
+            .values_list(field, flat=True)
+            .distinct()[:CachedChoicesFilter.MAX_CHOICES]
+        )
+        cache.set(key, values, getattr(settings, "ANALYTICS_ADMIN_CHOICES_TTL", 3600))
+    return values
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """Фильтр по точному значению поля; варианты — из cached_choices, без DISTINCT по событиям."""
+    MAX_CHOICES = 200
+    source = None
+
+    def lookups(self, request, model_admin):
+        return [
+            (value, value)
+            for value in cached_choices(self.source, self.parameter_name, model_admin.model)
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+def choices_filter(field, source):
+    return type(
+        f"{field.title().replace('_', '')}Filter",
+        (CachedChoicesFilter,),
+        {
+            "title": source._meta.get_field(field).verbose_name,
+            "parameter_name": field,
+            "source": source,
+        },
+    )
+
+
+class EventModelAdmin(admin.ModelAdmin):
+    """
+    База для админок сырых событий (миллионы строк):
+    - без полного COUNT(*) (EstimatedCountPaginator, show_full_result_count = False)
+    - листание «старее» / «новее» по created_at вместо OFFSET (KeysetChangeList)
+    - фильтры по значениям через choices_filter(), без SELECT DISTINCT по таблице
+    - колонка session без запроса на строку
+
+    События лежат в отдельной базе (analytics/routers.py), поэтому
+    session__session_key через JOIN искать нельзя: ключ сессии ищем
+    в default и добавляем совпадения по session_id.
+    По той же причине session подгружаем prefetch'ем (один запрос
+    в default на страницу); select_related — только если база одна.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-created_at", "-id")
+    change_list_template = "admin/analytics/event_change_list.html"
+    actions = (export_csv, export_ndjson)
+
+    def sessions_in_same_db(self):
+        return router.db_for_read(self.model) == router.db_for_read(VisitorSession)
+
+    def get_list_select_related(self, request):
+        return ("session",) if self.sessions_in_same_db() else ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.sessions_in_same_db():
+            return queryset
+        return queryset.prefetch_related("session")
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        search_term = search_term.strip()
+        if search_term:
+            session_ids = list(
+                VisitorSession.objects.filter(session_key=search_term).values_list("pk", flat=True)
+            )
+            if session_ids:
+                results |= queryset.filter(session_id__in=session_ids)
+        return results, may_have_duplicates
 
 
 @admin.register(PageView)
-class PageViewAdmin(admin.ModelAdmin):
+class PageViewAdmin(EventModelAdmin):
     list_display = ("page_path", "session", "created_at")
-    list_filter = ("page_path", "created_at")
-    search_fields = ("page_path", "session__session_key")
+    list_filter = (choices_filter("page_path", HourlyPageStat), "created_at")
+    search_fields = ("page_path",)
     readonly_fields = ("created_at",)
 
 
 @admin.register(SectionView)
-class SectionViewAdmin(admin.ModelAdmin):
+class SectionViewAdmin(EventModelAdmin):
     list_display = ("page_path", "section_id", "visible_ratio", "session", "created_at")
-    list_filter = ("page_path", "section_id", "created_at")
-    search_fields = ("section_id", "page_path", "session__session_key")
+    list_filter = (
+        choices_filter("page_path", HourlySectionStat),
+        choices_filter("section_id", HourlySectionStat),
+        "created_at",
+    )
+    search_fields = ("section_id", "page_path")
     readonly_fields = ("created_at",)
 
 
 @admin.register(ClickEvent)
-class ClickEventAdmin(admin.ModelAdmin):
+class ClickEventAdmin(EventModelAdmin):
     list_display = ("event_id", "page_path", "session", "created_at")
-    list_filter = ("event_id", "page_path", "created_at")
-    search_fields = ("event_id", "page_path", "session__session_key")
+    list_filter = (
+        choices_filter("event_id", HourlyClickStat),
+        choices_filter("page_path", HourlyClickStat),
+        "created_at",
+    )
+    search_fields = ("event_id", "page_path")
     readonly_fields = ("created_at",)
 
 
 @admin.register(FreeLessonLead)
-class FreeLessonLeadAdmin(admin.ModelAdmin):
+class FreeLessonLeadAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "full_name",
         "phone",
@@ -62,11 +337,13 @@ class FreeLessonLeadAdmin(admin.ModelAdmin):
     )
     list_filter = ("course_slug", "source", "is_valid_number", "created_at")
     search_fields = ("full_name", "phone", "session__session_key")
-    readonly_fields = ("id", "created_at")
+    exact_search_fields = ("session__session_key",)
+    readonly_fields = ("id", "created_at", "phone_normalized", "duplicate_of")
+    actions = (export_csv, export_ndjson)
 
 
 @admin.register(FailedLead)
-class FailedLeadAdmin(admin.ModelAdmin):
+class FailedLeadAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "full_name",
         "phone",
@@ -77,4 +354,6 @@ class FailedLeadAdmin(admin.ModelAdmin):
     )
     list_filter = ("course_slug", "event", "created_at")
     search_fields = ("full_name", "phone", "session__session_key")
-    readonly_fields = ("id", "created_at")
+    exact_search_fields = ("session__session_key",)
+    readonly_fields = ("id", "created_at", "phone_normalized")
+    actions = (export_csv, export_ndjson)
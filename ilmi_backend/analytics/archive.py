@@ -0,0 +1,174 @@
+"""
+Архив сырых событий по месяцам.
+
+Структура ANALYTICS_ARCHIVE_DIR:
+    index.json
+    pageview/2025-01.ndjson.gz
+    sectionview/2025-01.ndjson.gz
+    clickevent/2025-01.ndjson.gz
+
+Сегменты только дописываются: каждая пачка — отдельный gzip member,
+а gzip/zcat читают такие файлы целиком. Месяц считаем по UTC.
+
+index.json:
+{
+  "pageview": {
+    "max_id": 123456,             # максимальный id во всём архиве (справочно)
+    "months": {"2025-01": {"rows": 1000, "min_id": 1, "max_id": 1000,
+                           "first": "...", "last": "...", "bytes": 12345}}
+  }
+}
+
+id событий не растут вместе с created_at (у базы событий своя
+последовательность, move_events_to_store переносит старые строки со
+старыми или новыми id), поэтому «уже в архиве» решает только сам сегмент
+месяца (та же строка с тем же id): индекс лишь подсказывает, когда его стоит читать (may_contain).
+"""
+import datetime
+import gzip
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from .models import PageView, SectionView, ClickEvent
+
+
+ARCHIVED_MODELS = {model._meta.model_name: model for model in (PageView, SectionView, ClickEvent)}
+
+INDEX_NAME = "index.json"
+
+
+def archive_dir():
+    return Path(getattr(settings, "ANALYTICS_ARCHIVE_DIR", settings.BASE_DIR.parent / "archive"))
+
+
+def month_key(value):
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m")
+
+
+def segment_path(root, model_name, month):
+    return Path(root) / model_name / f"{month}.ndjson.gz"
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """Как DjangoJSONEncoder, но даты без обрезки микросекунд — архив должен восстанавливаться 1:1."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dumps(row):
+    return json.dumps(row, cls=ArchiveJSONEncoder, ensure_ascii=False)
+
+
+def row_fields(model):
+    """Колонки, которые кладём в архив: все конкретные поля по attname (session_id, а не session)."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class ArchiveIndex:
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.path = self.root / INDEX_NAME
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text())
+        else:
+            self.data = {}
+
+    def model(self, model_name):
+        return self.data.setdefault(model_name, {"max_id": 0, "months": {}})
+
+    def max_id(self, model_name):
+        return self.model(model_name)["max_id"]
+
+    def record(self, model_name, month, rows):
+        entry = self.model(model_name)
+        stats = entry["months"].setdefault(
+            month, {"rows": 0, "min_id": None, "max_id": None, "first": None, "last": None}
+        )
+        ids = [row["id"] for row in rows]
+        times = [row["created_at"].isoformat() for row in rows]
+        stats["rows"] += len(rows)
+        stats["min_id"] = min(ids) if stats["min_id"] is None else min(stats["min_id"], *ids)
+        stats["max_id"] = max(ids) if stats["max_id"] is None else max(stats["max_id"], *ids)
+        stats["first"] = min(t for t in [stats["first"], *times] if t)
+        stats["last"] = max(t for t in [stats["last"], *times] if t)
+        stats["bytes"] = segment_path(self.root, model_name, month).stat().st_size
+        entry["max_id"] = max(entry["max_id"], stats["max_id"])
+
+    def may_contain(self, model_name, month, ids):
+        """
+        Могут ли строки с такими id уже лежать в сегменте месяца: id попадает
+        в диапазон месяца или размер файла расходится с индексом (прошлый
+        запуск дописал сегмент и упал до index.save()).
+        """
+        path = segment_path(self.root, model_name, month)
+        if not path.exists():
+            return False
+        stats = self.model(model_name)["months"].get(month)
+        if stats is None or stats.get("bytes") != path.stat().st_size:
+            return True
+        return any(stats["min_id"] <= pk <= stats["max_id"] for pk in ids)
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, indent=2, sort_keys=True))
+        os.replace(tmp, self.path)
+
+
+def append_rows(root, model_name, rows):
+    """
+    Дописывает пачку строк (dict из .values()) в месячные сегменты.
+    Возвращает {месяц: [строки]} — что куда легло.
+    """
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_key(row["created_at"]), []).append(row)
+
+    for month, month_rows in by_month.items():
+        path = segment_path(root, model_name, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(dumps(row) + "\n" for row in month_rows).encode("utf-8")
+        with open(path, "ab") as fh:
+            fh.write(gzip.compress(payload))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    return by_month
+
+
+def iter_segment(root, model_name, month):
+    """Построчно читает сегмент, не распаковывая его в память целиком."""
+    path = segment_path(root, model_name, month)
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def segment_rows(root, model_name, month):
+    """{id: строка} сегмента месяца в том виде, как она записана (пусто, если сегмента нет)."""
+    if not segment_path(root, model_name, month).exists():
+        return {}
+    return {row["id"]: row for row in iter_segment(root, model_name, month)}
+
+
+def as_archived(row):
+    """Строка из .values() в том виде, в каком она читается из сегмента."""
+    return json.loads(dumps(row))
+
+
+def row_to_instance(model, row):
+    values = dict(row)
+    for field in model._meta.concrete_fields:
+        if field.get_internal_type() == "DateTimeField" and isinstance(values.get(field.attname), str):
+            values[field.attname] = parse_datetime(values[field.attname])
+    return model(**values)
@@ -0,0 +1,197 @@
+"""
+Async-версии трекинга и лидов — для ASGI (uvicorn-воркер, см. gunicorn.conf.py).
+
+Под WSGI каждый запрос держит поток sync-воркера целиком: и пока медленный
+мобильный клиент досылает тело, и пока SQLite ждёт лок на запись. Под ASGI
+тело дочитывает event loop, а вьюхи ниже ходят в базу async ORM
+(aupsert, acreate, aupdate, afirst) — соединение с клиентом, пока ждёт, стоит
+только корутину.
+
+Разбор запроса, проверки и ответы — общие helpers из views.py, здесь
+только await'ы к базе; запросов к базе столько же, сколько у синхронных.
+Какие вьюхи смотрят в urls.py, решает ANALYTICS_ASYNC_VIEWS (включается
+в asgi.py): под WSGI остаются синхронные, потому что async-вьюха
+там выполнялась бы через async_to_sync с отдельным event loop на каждый запрос.
+"""
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import buffer, session_cache
+from .ingest import PAGE_VIEW, SECTION_VIEW, CLICK_EVENT, abulk_write
+from .models import (
+    VisitorSession,
+    PageView,
+    SectionView,
+    ClickEvent,
+    FreeLessonLead,
+    FailedLead,
+)
+from .phones import normalize_phone
+from .views import (
+    batch_error,
+    batch_response,
+    batch_session_fields,
+    buffered_event,
+    build_batch,
+    click_event_fields,
+    failed_lead_fields,
+    get_json,
+    lead_fields,
+    lead_response,
+    page_view_fields,
+    queued_response,
+    register_session_fields,
+    section_view_fields,
+)
+
+
+# ===== UTILS =====
+
+async def aget_session(session_key: str, *, increment_visit: bool = False, **fields):
+    """get_session() из views.py: один upsert, сессия — в session_cache."""
+    if not session_key:
+        return None
+
+    session = await VisitorSession.objects.aupsert(
+        session_key,
+        increment_visit=increment_visit,
+        **fields,
+    )
+    session_cache.remember(session)
+    return session
+
+
+async def acreate_for_session(model, session_key: str, **fields):
+    pk = await session_cache.asession_pk(session_key)
+    if pk is None:
+        return None
+    return await model.objects.acreate(session_id=pk, **fields)
+
+
+async def _queued(session_id, objects=(), **session_fields):
+    if session_id:
+        await buffer.asubmit(session_id, objects, **session_fields)
+    return queued_response()
+
+
+# ===== API: TRACKING =====
+
+@csrf_exempt
+@require_POST
+async def api_register_session(request):
+    data = get_json(request)
+    session_id = data.get("session_id")
+    session_fields = register_session_fields(request, data)
+
+    if buffer.enabled():
+        return await _queued(session_id, **session_fields)
+
+    await aget_session(session_id, **session_fields)
+
+    return JsonResponse({"success": True})
+
+
+@csrf_exempt
+@require_POST
+async def api_page_view(request):
+    data = get_json(request)
+    session_id = data.get("session_id")
+    page, session_fields = page_view_fields(data)
+
+    if buffer.enabled():
+        objects, error = buffered_event(data, PAGE_VIEW)
+        return error or await _queued(session_id, objects, **session_fields)
+
+    session = await aget_session(session_id, **session_fields)
+    if session:
+        await PageView.objects.acreate(session=session, page_path=page)
+
+    return JsonResponse({"success": True})
+
+
+@csrf_exempt
+@require_POST
+async def api_section_view(request):
+    data = get_json(request)
+    session_id = data.get("session_id")
+
+    if buffer.enabled():
+        objects, error = buffered_event(data, SECTION_VIEW)
+        return error or await _queued(session_id, objects)
+
+    await acreate_for_session(SectionView, session_id, **section_view_fields(data))
+
+    return JsonResponse({"success": True})
+
+
+@csrf_exempt
+@require_POST
+async def api_click_event(request):
+    data = get_json(request)
+    session_id = data.get("session_id")
+
+    if buffer.enabled():
+        objects, error = buffered_event(data, CLICK_EVENT)
+        return error or await _queued(session_id, objects)
+
+    await acreate_for_session(ClickEvent, session_id, **click_event_fields(data))
+
+    return JsonResponse({"success": True})
+
+
+@csrf_exempt
+@require_POST
+async def api_batch(request):
+    data = get_json(request)
+    session_id = data.get("session_id")
+    events = data.get("events")
+
+    error = batch_error(session_id, events)
+    if error:
+        return error
+
+    session_fields = batch_session_fields(events)
+    session = None if buffer.enabled() else await aget_session(session_id, **session_fields)
+    objects, results = build_batch(session, events)
+
+    if buffer.enabled():
+        await buffer.asubmit(session_id, objects, **session_fields)
+        return batch_response(results, queued=True)
+
+    await abulk_write(objects)
+
+    return batch_response(results)
+
+
+# ===== API: LEADS =====
+
+@csrf_exempt
+@require_POST
+async def api_free_lesson_lead(request):
+    data = get_json(request)
+
+    session = None
+    if data.get("session_id"):
+        session = await aget_session(data["session_id"], increment_visit=False)
+
+    fields = lead_fields(data)
+    original_id = await FreeLessonLead.objects.aoriginal_id_for(normalize_phone(fields["phone"]))
+
+    lead = await FreeLessonLead.objects.acreate(session=session, duplicate_of_id=original_id, **fields)
+
+    return lead_response(lead)
+
+
+@csrf_exempt
+@require_POST
+async def api_failed_lead(request):
+    data = get_json(request)
+
+    session = None
+    if data.get("session_id"):
+        session = await aget_session(data["session_id"], increment_visit=False)
+
+    await FailedLead.objects.acreate(session=session, **failed_lead_fields(data))
+
+    return JsonResponse({"success": True})
@@ -0,0 +1,334 @@
+"""
+Нагрузочный прогон трекинга и заявок: python manage.py bench_ingest
+
+Трафик — как у лендинга (static/js/script.js): на каждого посетителя
+page-view при загрузке, section-view по мере прокрутки воронки
+(ANALYTICS_FUNNEL_SECTIONS, каждая следующая — с вероятностью continue_rate),
+клики ANALYTICS_FUNNEL_CLICKS и изредка заявка (иногда с тем же номером
+повторно). У посетителя свой session_id, IP и User-Agent. План целиком
+определяется seed — два прогона с одним seed шлют одни и те же запросы.
+
+Где гоняем:
+- in-process (по умолчанию): django.test.Client через все middleware,
+  на временных базах (файлы SQLite с продакшн-профилем или :memory:),
+  запросы к базе считаются на каждый HTTP-запрос (metrics.recording)
+- in-process --asgi: AsyncClient через ASGIHandler, посетители
+  параллельно (--concurrency). Async-вьюхи — если ANALYTICS_ASYNC_VIEWS
+  (ILMI_ASGI=1, как в asgi.py), иначе sync-вьюхи под ASGI через поток.
+  Сравнение с sync-путём:
+      python manage.py bench_ingest --output wsgi.json
+      ILMI_ASGI=1 python manage.py bench_ingest --asgi --concurrency 32 --output asgi.json
+- --url: живой сервер (gunicorn), посетители параллельно (--concurrency);
+  запросы к базе — по разнице /metrics до и после, если он доступен
+  (METRICS_ENDPOINT_ENABLED, один воркер — иначе видно только один процесс)
+
+Результат — dict (и JSON через --output): по эндпоинтам число запросов,
+ошибки, запросов в секунду, p50/p95/p99 в мс, SQL на запрос. Бюджеты
+ANALYTICS_BENCH_QUERY_BUDGETS — максимум SQL на запрос в среднем; превышение
+валит прогон (ненулевой код выхода), чтобы регрессии были видны в CI.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.test import AsyncClient, Client
+
+from ilmi_backend import metrics
+from ilmi_backend.metrics import QueryRecorder
+
+
+ENDPOINTS = {
+    "api_page_view": "/api/track/page-view/",
+    "api_section_view": "/api/track/section-view/",
+    "api_click_event": "/api/track/event/",
+    "api_free_lesson_lead": "/api/leads/free-lesson/",
+}
+
+USER_AGENTS = (
+    "Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.6099.144 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Mobile/15E148 Instagram 312.0.0.32.112",
+    "Mozilla/5.0 (Linux; Android 12; Redmi Note 11) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Version/4.0 Chrome/119.0.6045.193 Mobile Safari/537.36 Telegram-Android/10.5.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36",
+)
+
+FIRST_NAMES = ("Азиз", "Дилноза", "Жасур", "Малика", "Шахзод", "Нилуфар", "Бобур", "Зарина")
+LAST_NAMES = ("Каримов", "Юсупова", "Рахимов", "Тошматова", "Алиев", "Эргашева")
+
+
+@dataclass
+class Mix:
+    continue_rate: float = 0.7   # вероятность доскроллить до следующей секции
+    click_rate: float = 0.25     # вероятность каждого клика из ANALYTICS_FUNNEL_CLICKS
+    lead_rate: float = 0.05      # доля посетителей, оставивших заявку
+    repeat_lead_rate: float = 0.1  # заявка с уже отправленным номером
+
+
+@dataclass
+class Visitor:
+    session_id: str
+    ip: str
+    user_agent: str
+    steps: list = field(default_factory=list)   # [(имя URL, payload)]
+
+
+def _phone(rng):
+    return f"+998 9{rng.randint(0, 9)} {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+
+
+def build_plan(visitors, seed=0, mix=None):
+    """Список посетителей со своими запросами, детерминированно по seed."""
+    mix = mix or Mix()
+    rng = random.Random(seed)
+    sections = list(getattr(settings, "ANALYTICS_FUNNEL_SECTIONS", ()))
+    clicks = list(getattr(settings, "ANALYTICS_FUNNEL_CLICKS", ()))
+    phones = []
+    plan = []
+    for index in range(visitors):
+        visitor = Visitor(
+            session_id=f"bench-{seed}-{index:07d}",
+            ip=f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+            user_agent=rng.choice(USER_AGENTS),
+        )
+        visitor.steps.append(("api_page_view", {
+            "session_id": visitor.session_id,
+            "page_path": "/",
+            "user_agent": visitor.user_agent,
+        }))
+        for section in sections:
+            visitor.steps.append(("api_section_view", {
+                "session_id": visitor.session_id,
+                "page_path": "/",
+                "section_id": section,
+                "visible_ratio": round(rng.uniform(0.5, 1.0), 2),
+            }))
+            if rng.random() > mix.continue_rate:
+                break
+        for event_id in clicks:
+            if rng.random() < mix.click_rate:
+                visitor.steps.append(("api_click_event", {
+                    "session_id": visitor.session_id,
+                    "page_path": "/",
+                    "event_id": event_id,
+                }))
+        if rng.random() < mix.lead_rate:
+            if phones and rng.random() < mix.repeat_lead_rate:
+                phone = rng.choice(phones)
+            else:
+                phone = _phone(rng)
+                phones.append(phone)
+            visitor.steps.append(("api_free_lesson_lead", {
+                "session_id": visitor.session_id,
+                "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "phone": phone,
+                "course_slug": "pulni-boshqarish-sanhati",
+            }))
+        plan.append(visitor)
+    return plan
+
+
+# ----- замеры -----
+
+@dataclass
+class Sample:
+    endpoint: str
+    status: int
+    seconds: float
+    queries: int = None
+
+
+def percentile(sorted_values, fraction):
+    """Ближайший ранг: p50 / p95 / p99 по отсортированному списку."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(fraction * len(sorted_values) + 0.5 - 1e-9))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, wall_seconds, queries_by_endpoint=None):
+    endpoints = {}
+    for name in sorted({sample.endpoint for sample in samples}):
+        own = [sample for sample in samples if sample.endpoint == name]
+        latencies = sorted(sample.seconds * 1000 for sample in own)
+        counted = [sample.queries for sample in own if sample.queries is not None]
+        queries = None
+        if counted:
+            queries = {"mean": round(sum(counted) / len(counted), 3), "max": max(counted)}
+        elif queries_by_endpoint and name in queries_by_endpoint:
+            queries = {"mean": round(queries_by_endpoint[name], 3), "max": None}
+        endpoints[name] = {
+            "requests": len(own),
+            "errors": sum(1 for sample in own if sample.status >= 400),
+            "throughput_rps": round(len(own) / wall_seconds, 1) if wall_seconds else None,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 3),
+                "p95": round(percentile(latencies, 0.95), 3),
+                "p99": round(percentile(latencies, 0.99), 3),
+                "max": round(latencies[-1], 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+            },
+            "queries_per_request": queries,
+        }
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample.status >= 400),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(samples) / wall_seconds, 1) if wall_seconds else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3) if latencies else None,
+            "p95": round(percentile(latencies, 0.95), 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99), 3) if latencies else None,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def check_budgets(summary, budgets=None):
+    """Нарушения бюджетов SQL на запрос: ["api_page_view: 3.0 > 2", ...]."""
+    if budgets is None:
+        budgets = getattr(settings, "ANALYTICS_BENCH_QUERY_BUDGETS", {})
+    violations = []
+    for name, budget in sorted(budgets.items()):
+        queries = (summary["endpoints"].get(name) or {}).get("queries_per_request")
+        if queries and queries["mean"] > budget:
+            violations.append(f"{name}: {queries['mean']} > {budget}")
+    return violations
+
+
+# ----- in-process -----
+
+def run_in_process(plan):
+    """Все запросы последовательно через django.test.Client. Возвращает (samples, секунды)."""
+    metrics.install()
+    client = Client()
+    samples = []
+    started = time.perf_counter()
+    for visitor in plan:
+        for endpoint, payload in visitor.steps:
+            body = json.dumps(payload)
+            with metrics.recording(QueryRecorder(keep_sql=False)) as recorder:
+                start = time.perf_counter()
+                response = client.post(
+                    ENDPOINTS[endpoint], body, content_type="application/json",
+                    HTTP_USER_AGENT=visitor.user_agent, REMOTE_ADDR=visitor.ip,
+                )
+                elapsed = time.perf_counter() - start
+            samples.append(Sample(endpoint, response.status_code, elapsed, recorder.count))
+    return samples, time.perf_counter() - started
+
+
+def run_in_process_async(plan, concurrency=16):
+    """
+    Через ASGIHandler (AsyncClient): до concurrency посетителей одновременно,
+    запросы одного посетителя — по порядку. Возвращает (samples, секунды).
+    """
+    metrics.install()
+
+    async def main():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def visit(visitor):
+            async with slots:
+                for endpoint, payload in visitor.steps:
+                    # у каждой задачи свой контекст — счётчики запросов не смешиваются
+                    with metrics.recording(QueryRecorder(keep_sql=False)) as recorder:
+                        start = time.perf_counter()
+                        response = await client.post(
+                            ENDPOINTS[endpoint], json.dumps(payload), content_type="application/json",
+                            headers={"user-agent": visitor.user_agent, "x-forwarded-for": visitor.ip},
+                        )
+                        elapsed = time.perf_counter() - start
+                    samples.append(Sample(endpoint, response.status_code, elapsed, recorder.count))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(visit(visitor) for visitor in plan))
+        return samples, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+# ----- живой сервер -----
+
+METRIC_LINE_RE = re.compile(r'^(ilmi_db_queries_total|ilmi_http_requests_total)\{view="([^"]+)"[^}]*\} (\S+)$')
+
+
+def scrape_queries(base_url, timeout):
+    """{view: [запросов к базе, HTTP-запросов]} из /metrics или None."""
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/metrics", timeout=timeout) as response:
+            text = response.read().decode("utf-8")
+    except (urllib.error.URLError, OSError):
+        return None
+    totals = {}
+    for line in text.splitlines():
+        match = METRIC_LINE_RE.match(line)
+        if match:
+            metric, view, value = match.groups()
+            slot = 0 if metric == "ilmi_db_queries_total" else 1
+            totals.setdefault(view, [0.0, 0.0])[slot] += float(value)
+    return totals
+
+
+def run_http(plan, base_url, concurrency=16, timeout=10):
+    """Посетители параллельно, запросы одного посетителя — по порядку."""
+    base_url = base_url.rstrip("/")
+    samples = []
+    lock = threading.Lock()
+
+    def visit(visitor):
+        own = []
+        for endpoint, payload in visitor.steps:
+            request = urllib.request.Request(
+                base_url + ENDPOINTS[endpoint],
+                data=json.dumps(payload).encode("utf-8"),
+                headers={
+                    "Content-Type": "application/json",
+                    "User-Agent": visitor.user_agent,
+                    "X-Forwarded-For": visitor.ip,
+                },
+                method="POST",
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as exc:
+                status = exc.code
+            except (urllib.error.URLError, OSError):
+                status = 599
+            own.append(Sample(endpoint, status, time.perf_counter() - start))
+        with lock:
+            samples.extend(own)
+
+    before = scrape_queries(base_url, timeout)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(visit, plan))
+    wall = time.perf_counter() - started
+    after = scrape_queries(base_url, timeout)
+
+    queries_by_endpoint = None
+    if before is not None and after is not None:
+        queries_by_endpoint = {}
+        for view, (queries, requests) in after.items():
+            old_queries, old_requests = before.get(view, (0.0, 0.0))
+            if requests > old_requests:
+                queries_by_endpoint[view] = (queries - old_queries) / (requests - old_requests)
+    return samples, wall, queries_by_endpoint
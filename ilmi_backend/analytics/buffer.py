@@ -0,0 +1,357 @@
+"""
+Write-behind буфер для трекинга.
+
+Включается настройкой ANALYTICS_WRITE_BEHIND = True.
+Вьюхи проверяют payload, кладут запись в ограниченную очередь и сразу
+отвечают 202. Фоновый поток (один на воркер) забирает очередь каждые
+ANALYTICS_FLUSH_INTERVAL_MS миллисекунд или по ANALYTICS_FLUSH_BATCH записей
+и пишет их пачкой: один upsert на сессию + bulk_create на модель.
+
+Если очередь полна, запрос ждёт ANALYTICS_BUFFER_PUT_TIMEOUT секунд,
+а потом пишет свою запись сам — синхронно. Так мы тормозим клиента,
+но ничего не теряем.
+
+Пачка пишется в два шага (write_batch): upsert сессий, потом события.
+Каждый шаг повторяется до FLUSH_RETRIES раз отдельно, так что визиты не
+засчитываются повторно, если упала только запись событий. Не помогло —
+записи пишутся по одной (битая запись не тянет за собой остальные), а те,
+что не записались и так, дописываются в ANALYTICS_BUFFER_DEAD_LETTER
+(NDJSON). Вернуть их в базу: python manage.py replay_dead_letters.
+
+При остановке воркера drain() дописывает всё, что осталось в очереди
+(вызывается из atexit и из хука worker_exit в gunicorn.conf.py). После
+drain() буфер закрыт: поздние submit() пишут синхронно, новый поток
+не запускается.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import serializers
+from django.db import OperationalError, close_old_connections, connections, router, transaction
+
+from .ingest import bulk_write
+from .models import VisitorSession
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_RETRIES = 3
+
+
+def enabled():
+    return getattr(settings, "ANALYTICS_WRITE_BEHIND", False)
+
+
+def _merge_session_fields(target, fields):
+    """
+    Склеивает поля upsert'а от нескольких запросов одной сессии.
+    Визиты суммируются, остальные непустые значения — последний выигрывает.
+    """
+    visits = int(fields.get("increment_visit", False))
+    if "initial_visits" not in target:
+        # как в синхронном режиме: если сессию создаст не визит,
+        # она стартует с 1 и каждый следующий визит добавит ещё по одному
+        target["initial_visits"] = 0 if visits else 1
+    target["increment_visit"] += visits
+    target["initial_visits"] += visits
+
+    user_agent = fields.get("user_agent")
+    if user_agent:
+        if fields.get("replace_user_agent"):
+            target["user_agent"] = user_agent
+            target["replace_user_agent"] = True
+        elif not target.get("user_agent"):
+            target["user_agent"] = user_agent
+
+    if fields.get("ip_address"):
+        target["ip_address"] = fields["ip_address"]
+
+    for name, value in (fields.get("utm") or {}).items():
+        if value:
+            target.setdefault("utm", {})[name] = value
+
+
+def upsert_sessions(records):
+    """
+    Один upsert на уникальную сессию пачки записей (session_key, session_fields, objects)
+    и session у всех их событий. Все upsert'ы — одна транзакция: если она
+    упала, визиты не засчитаны и её можно повторить целиком.
+    """
+    sessions = {}
+    for session_key, fields, objects in records:
+        group = sessions.setdefault(
+            session_key, {"fields": {"increment_visit": 0}, "objects": []}
+        )
+        _merge_session_fields(group["fields"], fields)
+        group["objects"].extend(objects)
+
+    with transaction.atomic(using=router.db_for_write(VisitorSession)):
+        for session_key, group in sessions.items():
+            session = VisitorSession.objects.upsert(session_key, **group["fields"])
+            for obj in group["objects"]:
+                obj.session = session
+
+
+def write_events(records):
+    """bulk_create событий записей, у которых session уже проставлен."""
+    bulk_write([obj for _, _, objects in records for obj in objects])
+
+
+def write_records(records):
+    """
+    Пишет пачку записей без повторов: upsert сессий, потом bulk_create
+    на каждую модель событий. Для синхронной записи в потоке запроса.
+    """
+    upsert_sessions(records)
+    write_events(records)
+
+
+def _attempt(what, write, items, retries, delay):
+    """write(items) с повтором на OperationalError (занятая база). True — записано."""
+    for attempt in range(1, retries + 1):
+        try:
+            write(items)
+            return True
+        except OperationalError:
+            if attempt == retries:
+                logger.exception(
+                    "analytics buffer: %s of %d records failed %d times", what, len(items), attempt
+                )
+                return False
+            time.sleep(delay * attempt)
+        except Exception:
+            logger.exception("analytics buffer: %s of %d records failed", what, len(items))
+            return False
+
+
+def _each(write, items):
+    """write() по одному элементу: битый не тянет за собой остальные. (записанные, незаписанные)."""
+    written, failed = [], []
+    for item in items:
+        try:
+            write([item])
+            written.append(item)
+        except Exception:
+            failed.append(item)
+    return written, failed
+
+
+def write_batch(records, retries=FLUSH_RETRIES, delay=0.0):
+    """
+    Пишет пачку в два шага, повторяя каждый отдельно: сессии (базу default)
+    и события (базу событий). Визиты засчитываются ровно один раз — если
+    упал bulk_create, повторяется только он.
+
+    Возвращает записи, которые записать не удалось, — для dead letter.
+    У тех, чьи сессии уже обновлены, поля сессии пустые: при replay
+    визиты не засчитаются второй раз.
+    """
+    if _attempt("sessions", upsert_sessions, records, retries, delay):
+        upserted, failed = records, []
+    else:
+        upserted, failed = _each(upsert_sessions, records)
+
+    # визиты уже засчитаны: дальше поля сессии не нужны ни повтору, ни dead letter
+    upserted = [(session_key, {}, objects) for session_key, _, objects in upserted]
+    if not _attempt("events", write_events, upserted, retries, delay):
+        failed += _each(write_events, upserted)[1]
+    return failed
+
+
+# ----- dead letter -----
+
+_dead_letter_lock = threading.Lock()
+
+
+def dead_letter_path():
+    return getattr(settings, "ANALYTICS_BUFFER_DEAD_LETTER", None)
+
+
+def dump_record(record):
+    session_key, fields, objects = record
+    return json.dumps({
+        "session_key": session_key,
+        "fields": fields,
+        "objects": json.loads(serializers.serialize("json", objects)),
+    }, ensure_ascii=False, default=str)
+
+
+def load_record(line):
+    data = json.loads(line)
+    objects = [item.object for item in serializers.deserialize("json", json.dumps(data["objects"]))]
+    return data["session_key"], data["fields"], objects
+
+
+def dead_letter(records):
+    """Дописывает записи в файл dead letter. Без настройки — только лог."""
+    path = dead_letter_path()
+    if not path:
+        logger.error("analytics buffer: dropped %d records, ANALYTICS_BUFFER_DEAD_LETTER not set", len(records))
+        return
+    lines = "".join(dump_record(record) + "\n" for record in records)
+    with _dead_letter_lock, open(path, "a", encoding="utf-8") as file:
+        file.write(lines)
+    logger.error("analytics buffer: %d records written to %s", len(records), path)
+
+
+class EventBuffer:
+
+    def __init__(self, max_size, flush_interval, flush_batch, put_timeout):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.put_timeout = put_timeout
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._closed = False
+
+    # ----- producer side -----
+
+    def submit(self, session_key, objects=(), **session_fields):
+        """
+        Кладёт запись в очередь. Возвращает False, если очередь так и не
+        освободилась — тогда запись уже записана синхронно в этом потоке.
+        """
+        record = (session_key, session_fields, list(objects))
+        if not self._ensure_started():
+            # после drain(): поток уже не запустится, пишем сами
+            write_records([record])
+            return False
+        try:
+            self.queue.put(record, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            logger.warning("analytics buffer full, writing synchronously")
+            write_records([record])
+            return False
+
+    def offer(self, session_key, objects=(), **session_fields):
+        """Кладёт запись, только если в очереди есть место. Не ждёт — для async-вьюх."""
+        if not self._ensure_started():
+            return False
+        try:
+            self.queue.put_nowait((session_key, session_fields, list(objects)))
+            return True
+        except queue.Full:
+            return False
+
+    def _ensure_started(self):
+        """Запускает поток, если он не работает. False — буфер закрыт drain()."""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._closed:
+                return False
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            self._thread = threading.Thread(
+                target=self._run, name="analytics-flusher", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    # ----- consumer side -----
+
+    def _take(self):
+        """Ждёт первую запись, потом добирает до flush_batch или до конца окна."""
+        try:
+            first = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _take_nowait(self):
+        batch = []
+        while len(batch) < self.flush_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        failed = write_batch(batch, FLUSH_RETRIES, self.flush_interval)
+        if failed:
+            dead_letter(failed)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take()
+            if batch:
+                close_old_connections()
+                self._flush(batch)
+        connections.close_all()
+
+    def drain(self, timeout=10):
+        """Останавливает поток, закрывает буфер и дописывает всё, что осталось в очереди."""
+        with self._lock:
+            self._closed = True
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        while True:
+            batch = self._take_nowait()
+            if not batch:
+                break
+            self._flush(batch)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = EventBuffer(
+                    max_size=getattr(settings, "ANALYTICS_BUFFER_MAX_SIZE", 10_000),
+                    flush_interval=getattr(settings, "ANALYTICS_FLUSH_INTERVAL_MS", 500) / 1000,
+                    flush_batch=getattr(settings, "ANALYTICS_FLUSH_BATCH", 500),
+                    put_timeout=getattr(settings, "ANALYTICS_BUFFER_PUT_TIMEOUT", 0.5),
+                )
+    return _buffer
+
+
+def submit(session_key, objects=(), **session_fields):
+    return get_buffer().submit(session_key, objects, **session_fields)
+
+
+async def asubmit(session_key, objects=(), **session_fields):
+    """
+    submit() для async-вьюх: место в очереди есть — кладём прямо из event loop,
+    нет — обычный submit() (ожидание и запись сами) в потоке.
+    """
+    if get_buffer().offer(session_key, objects, **session_fields):
+        return True
+    return await sync_to_async(submit)(session_key, objects, **session_fields)
+
+
+def drain():
+    if _buffer is not None:
+        _buffer.drain()
+
+
+atexit.register(drain)
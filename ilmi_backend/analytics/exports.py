@@ -0,0 +1,175 @@
+"""
+Потоковая выгрузка лидов и событий в CSV / NDJSON.
+
+Строки читаются .values_list(...).iterator(chunk_size) и сразу уходят
+в ответ (StreamingHttpResponse) или в файл, поэтому память не растёт
+с числом строк.
+
+Колонки сессии (session_key, utm_*, разобранный user_agent):
+- лиды лежат в одной базе с VisitorSession — берём их JOIN'ом
+  в том же запросе (как select_related), без запроса на строку
+- события лежат в базе событий (analytics/routers.py), JOIN невозможен —
+  на каждую пачку строк один запрос в default по session_id
+"""
+import csv
+import datetime
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import (
+    USER_AGENT_FIELDS,
+    UTM_FIELDS,
+    VisitorSession,
+    PageView,
+    SectionView,
+    ClickEvent,
+    FreeLessonLead,
+    FailedLead,
+)
+from .reports import day_range
+
+
+EXPORT_MODELS = {
+    model._meta.model_name: model
+    for model in (FreeLessonLead, FailedLead, PageView, SectionView, ClickEvent)
+}
+
+SESSION_COLUMNS = ("session_key", *UTM_FIELDS, *USER_AGENT_FIELDS)
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class ExportError(ValueError):
+    """Неизвестная модель, колонка или формат."""
+
+
+def chunk_size():
+    return getattr(settings, "ANALYTICS_EXPORT_CHUNK_SIZE", 2000)
+
+
+def get_model(name):
+    try:
+        return EXPORT_MODELS[name.lower()]
+    except KeyError:
+        raise ExportError(f"неизвестная модель: {name}, есть: {', '.join(EXPORT_MODELS)}")
+
+
+def available_columns(model):
+    return [field.attname for field in model._meta.concrete_fields] + list(SESSION_COLUMNS)
+
+
+def parse_columns(value):
+    """Колонки из строки через запятую ("created_at, phone") без пробелов и пустых."""
+    return [column.strip() for column in (value or "").split(",") if column.strip()]
+
+
+def resolve_columns(model, columns=None):
+    """Проверяет список колонок; пустой список — все колонки модели и сессии."""
+    available = available_columns(model)
+    if not columns:
+        return available
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ExportError(f"неизвестные колонки: {', '.join(unknown)}, есть: {', '.join(available)}")
+    return list(columns)
+
+
+def filter_dates(queryset, date_from=None, date_to=None):
+    """Дни включительно, по created_at (индекс есть у всех выгружаемых моделей)."""
+    if date_from:
+        queryset = queryset.filter(created_at__gte=day_range(date_from, date_from)[0])
+    if date_to:
+        queryset = queryset.filter(created_at__lt=day_range(date_to, date_to)[1])
+    return queryset
+
+
+def iter_rows(queryset, columns, size=None):
+    """Кортежи значений в порядке columns, по одному запросу на пачку."""
+    size = size or chunk_size()
+    queryset = queryset.prefetch_related(None)
+    joined = [column for column in columns if column in SESSION_COLUMNS]
+
+    if not joined:
+        yield from queryset.values_list(*columns).iterator(chunk_size=size)
+        return
+
+    if router.db_for_read(queryset.model) == router.db_for_read(VisitorSession):
+        lookups = [f"session__{column}" if column in joined else column for column in columns]
+        yield from queryset.values_list(*lookups).iterator(chunk_size=size)
+        return
+
+    own = [column for column in columns if column not in joined]
+    rows = queryset.values_list("session_id", *own).iterator(chunk_size=size)
+    empty = (None,) * len(joined)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        sessions = {
+            pk: values
+            for pk, *values in VisitorSession.objects
+            .filter(pk__in={row[0] for row in chunk if row[0]})
+            .values_list("pk", *joined)
+        }
+        for session_id, *values in chunk:
+            own_values = dict(zip(own, values))
+            session_values = dict(zip(joined, sessions.get(session_id, empty)))
+            yield tuple(
+                session_values[column] if column in session_values else own_values[column]
+                for column in columns
+            )
+
+
+# ----- форматы -----
+
+class Echo:
+    """Псевдо-файл для csv.writer: write() просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def ndjson_lines(rows, columns):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def render(queryset, columns, fmt="csv", size=None):
+    """Генератор строк выгрузки в нужном формате."""
+    if fmt not in FORMATS:
+        raise ExportError(f"неизвестный формат: {fmt}, есть: {', '.join(FORMATS)}")
+    rows = iter_rows(queryset, columns, size)
+    return csv_lines(rows, columns) if fmt == "csv" else ndjson_lines(rows, columns)
+
+
+def streaming_response(queryset, columns=None, fmt="csv"):
+    columns = resolve_columns(queryset.model, columns)
+    lines = render(queryset, columns, fmt)
+    filename = f"{queryset.model._meta.model_name}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,130 @@
+"""
+Разбор и пакетная запись событий трекинга.
+
+Одно событие из батча — это dict с полем "type":
+- page_view     {page_path, user_agent}
+- section_view  {page_path, section_id, visible_ratio}
+- event         {page_path, event_id, meta}
+
+build_event() проверяет элемент и собирает несохранённый объект модели,
+bulk_write() пишет всё одним bulk_create на модель в одной транзакции.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router, transaction
+
+from .models import PageView, SectionView, ClickEvent
+
+
+PAGE_VIEW = "page_view"
+SECTION_VIEW = "section_view"
+CLICK_EVENT = "event"
+
+EVENT_MODELS = {
+    PAGE_VIEW: PageView,
+    SECTION_VIEW: SectionView,
+    CLICK_EVENT: ClickEvent,
+}
+
+
+def max_batch_size():
+    return getattr(settings, "ANALYTICS_BATCH_MAX_EVENTS", 100)
+
+
+class InvalidEvent(ValueError):
+    """Элемент батча не прошёл проверку — отклоняем только его."""
+
+
+def _clean_str(item, key, max_length, *, default="", required=False):
+    value = item.get(key, default)
+    if value is None:
+        value = default
+    if not isinstance(value, str):
+        raise InvalidEvent(f"{key}: ожидается строка")
+    value = value.strip()
+    if required and not value:
+        raise InvalidEvent(f"{key}: обязательное поле")
+    if len(value) > max_length:
+        raise InvalidEvent(f"{key}: длиннее {max_length} символов")
+    return value
+
+
+def _clean_ratio(item):
+    value = item.get("visible_ratio")
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise InvalidEvent("visible_ratio: ожидается число")
+    if not 0 <= value <= 1:
+        raise InvalidEvent("visible_ratio: вне диапазона 0–1")
+    return float(value)
+
+
+def _clean_meta(item):
+    value = item.get("meta")
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise InvalidEvent("meta: ожидается объект")
+    return value
+
+
+def build_event(session, item):
+    """
+    Собирает объект PageView / SectionView / ClickEvent из элемента батча.
+    Ничего не пишет в базу. Бросает InvalidEvent, если элемент битый.
+    """
+    if not isinstance(item, dict):
+        raise InvalidEvent("событие должно быть объектом")
+
+    kind = item.get("type")
+    page_path = _clean_str(item, "page_path", 255, default="/") or "/"
+
+    if kind == PAGE_VIEW:
+        return PageView(session=session, page_path=page_path)
+
+    if kind == SECTION_VIEW:
+        return SectionView(
+            session=session,
+            page_path=page_path,
+            section_id=_clean_str(item, "section_id", 64, required=True),
+            visible_ratio=_clean_ratio(item),
+        )
+
+    if kind == CLICK_EVENT:
+        return ClickEvent(
+            session=session,
+            page_path=page_path,
+            event_id=_clean_str(item, "event_id", 64, required=True),
+            meta=_clean_meta(item),
+        )
+
+    raise InvalidEvent(f"неизвестный type: {kind!r}")
+
+
+def bulk_write(objects):
+    """
+    Пишет собранные объекты: один bulk_create на модель, всё в одной транзакции.
+    Возвращает {модель: количество}.
+    """
+    by_model = {}
+    for obj in objects:
+        by_model.setdefault(type(obj), []).append(obj)
+
+    if not by_model:
+        return {}
+
+    using = router.db_for_write(PageView)
+    with transaction.atomic(using=using):
+        for model, rows in by_model.items():
+            model.objects.using(using).bulk_create(rows)
+
+    return {model: len(rows) for model, rows in by_model.items()}
+
+
+async def abulk_write(objects):
+    """
+    bulk_write() для async-вьюх. transaction.atomic в async-коде нет,
+    а пачка должна лечь одной транзакцией, поэтому целиком — одним переходом в поток.
+    """
+    return await sync_to_async(bulk_write)(objects)
@@ -0,0 +1,108 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics.archive import (
+    ARCHIVED_MODELS,
+    ArchiveIndex,
+    append_rows,
+    archive_dir as default_archive_dir,
+    as_archived,
+    month_key,
+    row_fields,
+    segment_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит события старше --before в месячные архивы gzip NDJSON "
+        "и удаляет их из базы небольшими пачками."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", required=True, help="YYYY-MM-DD, архивируем всё раньше этой даты")
+        parser.add_argument(
+            "--models",
+            default=",".join(ARCHIVED_MODELS),
+            help="Через запятую: " + ", ".join(ARCHIVED_MODELS),
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.05,
+            help="Пауза между пачками, сек — чтобы не держать лок на запись подряд",
+        )
+        parser.add_argument("--archive-dir", default=None)
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать строки")
+
+    def handle(self, *args, before, models, batch_size, sleep, archive_dir, dry_run, **options):
+        day = parse_date(before)
+        if day is None:
+            raise CommandError("--before: ожидается дата YYYY-MM-DD")
+        cutoff = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+        root = archive_dir or default_archive_dir()
+        index = ArchiveIndex(root)
+
+        for name in [m.strip() for m in models.split(",") if m.strip()]:
+            if name not in ARCHIVED_MODELS:
+                raise CommandError(f"Неизвестная модель: {name}")
+            model = ARCHIVED_MODELS[name]
+            old = model.objects.filter(created_at__lt=cutoff)
+
+            if dry_run:
+                self.stdout.write(f"{name}: {old.count()} строк до {day}")
+                continue
+
+            fields = row_fields(model)
+            # строки, уже лежащие в сегменте месяца: читаем сегмент, только
+            # если индекс говорит, что строки пачки могут там быть
+            known = {}
+            last_pk = 0
+            total = 0
+            while True:
+                rows = list(
+                    old.filter(pk__gt=last_pk).order_by("pk").values(*fields)[:batch_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1]["id"]
+
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(month_key(row["created_at"]), []).append(row)
+
+                fresh = []
+                for month, month_rows in by_month.items():
+                    ids = [row["id"] for row in month_rows]
+                    if month not in known and index.may_contain(name, month, ids):
+                        known[month] = segment_rows(root, name, month)
+                    archived = known.get(month, {})
+                    fresh.extend(
+                        row for row in month_rows
+                        if archived.get(row["id"]) != as_archived(row)
+                    )
+
+                if fresh:
+                    for month, month_rows in append_rows(root, name, fresh).items():
+                        index.record(name, month, month_rows)
+                        if month in known:
+                            known[month].update((row["id"], as_archived(row)) for row in month_rows)
+                    index.save()
+
+                # удаляем только то, что записано сейчас или уже найдено в сегменте
+                with transaction.atomic(using=old.db):
+                    model.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+
+                total += len(rows)
+                self.stdout.write(f"{name}: {total}", ending="\r")
+                if sleep:
+                    time.sleep(sleep)
+
+            self.stdout.write(self.style.SUCCESS(f"{name}: в архив {total} строк"))
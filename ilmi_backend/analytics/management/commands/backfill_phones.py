@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics.models import FreeLessonLead, FailedLead
+from analytics.phones import normalize_phone
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет phone_normalized у старых FreeLessonLead / FailedLead пачками. "
+        "С --all нормализует заново все номера (после правок analytics/phones.py). "
+        "С --link-duplicates заодно проставляет duplicate_of у повторных заявок."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--all", action="store_true", help="Не только пустые phone_normalized")
+        parser.add_argument("--link-duplicates", action="store_true")
+
+    def handle(self, *args, batch_size, all, link_duplicates, **options):
+        for model in (FreeLessonLead, FailedLead):
+            updated = self.backfill(model, batch_size, all)
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: обновлено {updated}"))
+
+        if link_duplicates:
+            linked = self.link_duplicates(batch_size)
+            self.stdout.write(self.style.SUCCESS(f"FreeLessonLead: отмечено дублей {linked}"))
+
+    def backfill(self, model, batch_size, all=False):
+        # keyset по pk: строки, для которых номер не нормализуется, не зацикливают проход
+        queryset = model.objects.exclude(phone="").order_by("pk")
+        if not all:
+            queryset = queryset.filter(phone_normalized="")
+        updated = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch.only("pk", "phone", "phone_normalized")[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+
+            changed = []
+            for row in rows:
+                normalized = normalize_phone(row.phone)
+                if normalized != row.phone_normalized:
+                    row.phone_normalized = normalized
+                    changed.append(row)
+            with transaction.atomic():
+                model.objects.bulk_update(changed, ["phone_normalized"])
+
+            updated += len(changed)
+            self.stdout.write(f"{model.__name__}: {updated}", ending="\r")
+        return updated
+
+    def link_duplicates(self, batch_size):
+        queryset = (
+            FreeLessonLead.objects
+            .filter(duplicate_of=None)
+            .exclude(phone_normalized="")
+            .order_by("created_at", "pk")
+        )
+        linked = 0
+        for lead in queryset.only("pk", "phone_normalized", "created_at").iterator(chunk_size=batch_size):
+            original_id = FreeLessonLead.objects.original_id_for(
+                lead.phone_normalized, before=lead.created_at
+            )
+            if original_id:
+                FreeLessonLead.objects.filter(pk=lead.pk).update(duplicate_of_id=original_id)
+                linked += 1
+        return linked
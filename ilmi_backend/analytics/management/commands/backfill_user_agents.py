@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics.models import USER_AGENT_FIELDS, VisitorSession
+from analytics.useragents import parse_user_agent
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет device_type / os_family / browser_family / in_app_browser "
+        "у старых VisitorSession пачками. С --all разбирает заново все сессии "
+        "(после правок analytics/useragents.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--all", action="store_true", help="Не только пустые, а все сессии с user_agent")
+
+    def handle(self, *args, batch_size, all, **options):
+        queryset = VisitorSession.objects.exclude(user_agent="").order_by("pk")
+        if not all:
+            queryset = queryset.filter(device_type="")
+
+        # keyset по pk: строки, которые разбор оставляет как есть, не зацикливают проход
+        checked = updated = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch.only("pk", "user_agent", *USER_AGENT_FIELDS)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+
+            changed = []
+            for row in rows:
+                parsed = parse_user_agent(row.user_agent)._asdict()
+                if any(getattr(row, name) != value for name, value in parsed.items()):
+                    for name, value in parsed.items():
+                        setattr(row, name, value)
+                    changed.append(row)
+            with transaction.atomic():
+                VisitorSession.objects.bulk_update(changed, USER_AGENT_FIELDS)
+
+            checked += len(rows)
+            updated += len(changed)
+            self.stdout.write(f"VisitorSession: {updated} / {checked}", ending="\r")
+
+        self.stdout.write(self.style.SUCCESS(f"VisitorSession: обновлено {updated} из {checked}"))
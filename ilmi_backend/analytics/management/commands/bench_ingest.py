@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from analytics import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон трекинга и заявок: смесь page-view / section-view / "
+        "кликов / заявок, p50/p95/p99 и SQL на запрос по эндпоинтам. "
+        "Без --url — в процессе на временных базах, с --url — против живого сервера."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visitors", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=0, help="Один seed — одинаковый трафик")
+        parser.add_argument("--url", default=None, help="http://127.0.0.1:8000 — гонять по HTTP")
+        parser.add_argument("--concurrency", type=int, default=16, help="Параллельных посетителей с --url / --asgi")
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="In-process через ASGIHandler; async-вьюхи — с ILMI_ASGI=1",
+        )
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="In-process: базы в памяти вместо временных файлов с продакшн-профилем",
+        )
+        parser.add_argument("--lead-rate", type=float, default=bench.Mix.lead_rate)
+        parser.add_argument("--click-rate", type=float, default=bench.Mix.click_rate)
+        parser.add_argument("--continue-rate", type=float, default=bench.Mix.continue_rate)
+        parser.add_argument("--output", default=None, help="Куда записать JSON с результатом")
+        parser.add_argument("--no-budgets", action="store_true", help="Не проверять ANALYTICS_BENCH_QUERY_BUDGETS")
+
+    def handle(self, *args, visitors, seed, url, concurrency, asgi, memory, lead_rate, click_rate,
+               continue_rate, output, no_budgets, **options):
+        mix = bench.Mix(continue_rate=continue_rate, click_rate=click_rate, lead_rate=lead_rate)
+        plan = bench.build_plan(visitors, seed=seed, mix=mix)
+
+        if url:
+            samples, wall, queries = bench.run_http(plan, url, concurrency=concurrency)
+            if queries is None:
+                self.stderr.write("/metrics недоступен — SQL на запрос не посчитан")
+            mode = "http"
+        else:
+            if asgi and not settings.ANALYTICS_ASYNC_VIEWS:
+                self.stderr.write("ANALYTICS_ASYNC_VIEWS выключен — sync-вьюхи под ASGI (ILMI_ASGI=1 для async)")
+            samples, wall = self.run_in_process(plan, memory, concurrency if asgi else None)
+            queries = None
+            mode = "memory" if memory else "file"
+
+        summary = bench.summarize(samples, wall, queries)
+        summary["run"] = {
+            "mode": mode,
+            "url": url,
+            "visitors": visitors,
+            "seed": seed,
+            "concurrency": concurrency if url or asgi else 1,
+            "handler": "http" if url else "asgi" if asgi else "wsgi",
+            "async_views": bool(settings.ANALYTICS_ASYNC_VIEWS) if not url else None,
+            "mix": vars(mix),
+        }
+        violations = [] if no_budgets else bench.check_budgets(summary)
+        summary["budget_violations"] = violations
+
+        self.report(summary)
+        if output:
+            with open(output, "w", encoding="utf-8") as fh:
+                json.dump(summary, fh, ensure_ascii=False, indent=2, sort_keys=True)
+            self.stdout.write(f"JSON: {output}")
+        if violations:
+            raise CommandError("Превышены бюджеты SQL на запрос: " + "; ".join(violations))
+
+    def run_in_process(self, plan, memory, concurrency):
+        """Временные базы как у тестов: рабочие не трогаем. concurrency — через ASGI."""
+        tmp = None
+        if not memory:
+            tmp = tempfile.TemporaryDirectory()
+            for alias in connections:
+                connections.settings[alias].setdefault("TEST", {})["NAME"] = os.path.join(
+                    tmp.name, f"{alias}.sqlite3"
+                )
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            if concurrency:
+                return bench.run_in_process_async(plan, concurrency)
+            return bench.run_in_process(plan)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if tmp is not None:
+                tmp.cleanup()
+
+    def report(self, summary):
+        self.stdout.write(
+            f"{summary['requests']} запросов за {summary['wall_seconds']} с, "
+            f"{summary['throughput_rps']} в секунду, ошибок {summary['errors']}"
+        )
+        self.stdout.write(f"{'эндпоинт':<22} {'запр.':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL':>6}")
+        for name, row in summary["endpoints"].items():
+            latency = row["latency_ms"]
+            queries = row["queries_per_request"]
+            self.stdout.write(
+                f"{name:<22} {row['requests']:>6} {latency['p50']:>8} {latency['p95']:>8} "
+                f"{latency['p99']:>8} {queries['mean'] if queries else '-':>6}"
+            )
@@ -0,0 +1,60 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from analytics import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоковая выгрузка лидов или событий в CSV / NDJSON "
+        "(память не зависит от числа строк)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help=", ".join(exports.EXPORT_MODELS))
+        parser.add_argument("--format", dest="fmt", choices=list(exports.FORMATS), default="csv")
+        parser.add_argument("--columns", default="", help="Через запятую, по умолчанию все")
+        parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD включительно")
+        parser.add_argument("--output", help="Файл, по умолчанию stdout")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument(
+            "--list-columns",
+            action="store_true",
+            help="Показать доступные колонки и выйти",
+        )
+
+    def handle(self, *args, model, fmt, columns, date_from, date_to, output, chunk_size,
+               list_columns, **options):
+        try:
+            model = exports.get_model(model)
+            if list_columns:
+                self.stdout.write("\n".join(exports.available_columns(model)))
+                return
+            columns = exports.resolve_columns(model, exports.parse_columns(columns))
+        except exports.ExportError as exc:
+            raise CommandError(str(exc))
+
+        queryset = exports.filter_dates(
+            model.objects.order_by("created_at"),
+            self._date(date_from, "--from"),
+            self._date(date_to, "--to"),
+        )
+        lines = exports.render(queryset, columns, fmt, chunk_size)
+
+        if output:
+            with open(output, "w", encoding="utf-8", newline="") as fh:
+                fh.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"{model.__name__}: выгружено в {output}"))
+        else:
+            sys.stdout.writelines(lines)
+
+    def _date(self, value, name):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{name}: ожидается дата YYYY-MM-DD")
+        return day
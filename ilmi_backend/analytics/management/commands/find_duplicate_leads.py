@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analytics.reports import duplicate_phone_groups, recovered_failed_leads
+
+
+class Command(BaseCommand):
+    help = (
+        "Повторные заявки с одним номером (в любом формате) и незавершённые "
+        "заявки, после которых человек всё-таки оставил лид."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="За сколько последних дней")
+        parser.add_argument("--limit", type=int, default=100)
+
+    def handle(self, *args, days, limit, **options):
+        since = timezone.now() - datetime.timedelta(days=days)
+
+        groups = duplicate_phone_groups(since)[:limit]
+        self.stdout.write(f"Номера с повторными заявками за {days} дн.:")
+        for group in groups:
+            self.stdout.write(
+                f"  {group['phone_normalized']:<16} заявок: {group['leads']:<4} "
+                f"{group['first']:%Y-%m-%d %H:%M} — {group['last']:%Y-%m-%d %H:%M}"
+            )
+
+        recovered = recovered_failed_leads(since)
+        self.stdout.write(f"\nНезавершённые заявки, ставшие лидами: {recovered.count()}")
+        for failed in recovered.only("phone", "event", "created_at")[:limit]:
+            self.stdout.write(f"  {failed.phone:<20} {failed.event:<20} {failed.created_at:%Y-%m-%d %H:%M}")
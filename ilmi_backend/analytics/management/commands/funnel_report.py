@@ -0,0 +1,69 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics.models import UTM_FIELDS
+from analytics.reports import funnel_report
+
+
+def _pct(value):
+    return "—" if value is None else f"{value * 100:.1f}%"
+
+
+class Command(BaseCommand):
+    help = "Воронка лендинга по секциям и конверсия кликов в лиды за период."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD, по умолчанию 7 дней назад")
+        parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD включительно, по умолчанию сегодня")
+        for name in UTM_FIELDS:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+        parser.add_argument("--json", dest="as_json", action="store_true", help="Вывести как JSON")
+        parser.add_argument("--no-cache", action="store_true")
+
+    def handle(self, *args, date_from, date_to, as_json, no_cache, **options):
+        date_to = self._date(date_to, "--to") if date_to else timezone.localdate()
+        date_from = self._date(date_from, "--from") if date_from else date_to - datetime.timedelta(days=6)
+        utm = {name: options[name] for name in UTM_FIELDS if options.get(name)}
+
+        report = funnel_report(date_from, date_to, utm, use_cache=not no_cache)
+        if as_json:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"{report['date_from']} — {report['date_to']}  utm={report['utm'] or '-'}  "
+            f"источник: {report['source']}"
+        )
+        self.stdout.write("сессий — уникальные за каждый час, сложенные по часам")
+        pages = report["page_views"]
+        self.stdout.write(f"просмотры страниц: {pages['views']}, сессий: {pages['sessions']}\n")
+
+        self.stdout.write(f"{'секция':<16}{'сессий':>10}{'от первой':>12}{'от пред.':>12}")
+        for step in report["sections"]:
+            self.stdout.write(
+                f"{step['section_id']:<16}{step['sessions']:>10}"
+                f"{_pct(step['from_first']):>12}{_pct(step['from_previous']):>12}"
+            )
+
+        self.stdout.write(f"\n{'клик':<20}{'сессий':>10}{'с лидом':>10}{'конверсия':>12}")
+        for row in report["clicks"]:
+            self.stdout.write(
+                f"{row['event_id']:<20}{row['sessions']:>10}"
+                f"{row['sessions_with_lead']:>10}{_pct(row['lead_rate']):>12}"
+            )
+
+        leads = report["leads"]
+        self.stdout.write(
+            f"\nлидов: {leads['count']}, сессий с лидом: {leads['sessions']} "
+            f"({_pct(leads['from_page_sessions'])} от сессий)"
+        )
+
+    def _date(self, value, name):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{name}: ожидается дата YYYY-MM-DD")
+        return day
@@ -0,0 +1,80 @@
+import json
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from analytics import rollups, synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетические сессии, просмотры, секции, клики и лиды "
+        "для проверки админки и отчётов на больших объёмах (пачками, с seed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=100_000)
+        parser.add_argument("--days", type=int, default=90, help="Период, который покрывают данные (до сейчас)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Сессий в пачке")
+        parser.add_argument("--profile", default=None, help="JSON с распределениями поверх DEFAULT_PROFILE")
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="Снять индексы и триггеры поиска на время загрузки, построить в конце",
+        )
+        parser.add_argument("--rebuild-rollups", action="store_true", help="Пересчитать почасовые агрегаты")
+        parser.add_argument("--force", action="store_true", help="Разрешить при DEBUG = False")
+
+    def handle(self, *args, sessions, days, seed, batch_size, profile, defer_indexes,
+               rebuild_rollups, force, **options):
+        if not settings.DEBUG and not force:
+            raise CommandError("DEBUG = False: похоже на рабочую базу. Если точно нужно — --force")
+        if sessions < 1 or days < 1 or batch_size < 1:
+            raise CommandError("--sessions, --days и --batch-size должны быть больше 0")
+
+        overrides = None
+        if profile:
+            with open(profile, encoding="utf-8") as fh:
+                overrides = json.load(fh)
+        try:
+            generator = synthetic.Generator(
+                sessions, days, seed=seed, profile=synthetic.load_profile(overrides)
+            )
+        except (KeyError, ValueError) as exc:
+            raise CommandError(f"Профиль: {exc!r}")
+
+        started = time.monotonic()
+
+        def progress(totals):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"сессий {totals.sessions}/{sessions}, строк {totals.rows}, "
+                f"{totals.rows / elapsed:,.0f} строк/с",
+                ending="\r",
+            )
+
+        deferred = synthetic.defer_indexes(log=self.stdout.write) if defer_indexes else nullcontext()
+        try:
+            with deferred:
+                totals = generator.run(batch_size=batch_size, progress=progress)
+        except IntegrityError as exc:
+            raise CommandError(f"{exc} — этот seed уже загружен? Возьми другой --seed")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Сессий {totals.sessions}, просмотров {totals.page_views}, секций {totals.section_views}, "
+            f"кликов {totals.clicks}, лидов {totals.leads}, брошенных форм {totals.failed_leads} — "
+            f"{totals.rows} строк за {elapsed:.1f} с"
+        ))
+
+        if rebuild_rollups:
+            for rollup in rollups.ROLLUPS:
+                rows = rollups.rebuild(rollup)
+                self.stdout.write(self.style.SUCCESS(f"{rollup.name}: агрегатов {rows}"))
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from analytics.models import PageView, SectionView, ClickEvent
+from analytics.routers import event_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит старые PageView / SectionView / ClickEvent из default "
+        "в отдельную базу событий пачками, сохраняя id. Если id уже занят "
+        "другим событием (база событий нумерует новые с 1), строка получает "
+        "новый id; из default удаляется только то, что записано в базу событий. "
+        "Перед запуском: python manage.py migrate --database=events"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Не удалять перенесённые строки из default",
+        )
+
+    def handle(self, *args, batch_size, keep, **options):
+        target = event_database()
+        if target == DEFAULT_DB_ALIAS:
+            raise CommandError("ANALYTICS_EVENT_DATABASE не настроена — переносить некуда")
+
+        existing = set(connections[DEFAULT_DB_ALIAS].introspection.table_names())
+
+        for model in (PageView, SectionView, ClickEvent):
+            if model._meta.db_table not in existing:
+                self.stdout.write(f"{model.__name__}: в default таблицы нет, пропускаем")
+                continue
+
+            source = model.objects.using(DEFAULT_DB_ALIAS).order_by("pk")
+            moved = renumbered = 0
+            last_pk = 0
+            while True:
+                rows = list(source.filter(pk__gt=last_pk)[:batch_size])
+                if not rows:
+                    break
+                last_pk = rows[-1].pk
+                pks = [row.pk for row in rows]
+
+                fresh, clashing = self.split(model, target, rows)
+                for row in clashing:
+                    row.pk = None
+                try:
+                    # без ignore_conflicts: конфликт (живая запись заняла id между
+                    # проверкой и вставкой) откатывает пачку, из default ничего не удаляем
+                    with transaction.atomic(using=target):
+                        model.objects.using(target).bulk_create(fresh + clashing)
+                except IntegrityError as exc:
+                    raise CommandError(
+                        f"{model.__name__}: конфликт id в {target} после pk={pks[0]} ({exc}), "
+                        f"перенесено {moved} — запустите ещё раз"
+                    )
+                if not keep:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        model.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=pks).delete()
+
+                moved += len(rows)
+                renumbered += len(clashing)
+                self.stdout.write(f"{model.__name__}: {moved}", ending="\r")
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{model.__name__}: перенесено {moved}, с новым id {renumbered}"
+            ))
+
+    @staticmethod
+    def split(model, target, rows):
+        """
+        (вставить как есть, вставить с новым id). Строки, которые уже лежат
+        в базе событий с тем же id и теми же значениями (прошлый запуск упал
+        до удаления из default), пропускаем — повторный запуск ничего не дублирует.
+        """
+        fields = [field.attname for field in model._meta.concrete_fields]
+        existing = {
+            values[0]: values
+            for values in model.objects.using(target)
+            .filter(pk__in=[row.pk for row in rows])
+            .values_list(*fields)
+        }
+        fresh, clashing = [], []
+        for row in rows:
+            taken = existing.get(row.pk)
+            if taken is None:
+                fresh.append(row)
+            elif taken != tuple(getattr(row, name) for name in fields):
+                clashing.append(row)
+        return fresh, clashing
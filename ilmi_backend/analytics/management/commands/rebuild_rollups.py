@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics.rollups import ROLLUPS, rebuild
+
+
+def _day(value, name):
+    day = parse_date(value)
+    if day is None:
+        raise CommandError(f"{name}: ожидается дата YYYY-MM-DD")
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает почасовые агрегаты с нуля за диапазон дат (UTC) — для бэкфилла. "
+        "Без --since/--until пересчитывает всё и выставляет чекпоинты."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="YYYY-MM-DD включительно")
+        parser.add_argument("--until", help="YYYY-MM-DD не включительно")
+        parser.add_argument(
+            "--only",
+            choices=[rollup.name for rollup in ROLLUPS],
+            help="Только один источник",
+        )
+
+    def handle(self, *args, since, until, only, **options):
+        since = _day(since, "--since") if since else None
+        until = _day(until, "--until") if until else None
+
+        for rollup in ROLLUPS:
+            if only and rollup.name != only:
+                continue
+            rows = rebuild(rollup, since, until)
+            self.stdout.write(self.style.SUCCESS(f"{rollup.name}: {rows} строк агрегата"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from analytics import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает полнотекстовый индекс (FTS5) сессий и лидов для поиска в админке. "
+        "С --recreate заново создаёт таблицы индекса и триггеры."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            default="",
+            help="Через запятую: visitorsession, freelessonlead, failedlead (по умолчанию все)",
+        )
+        parser.add_argument("--recreate", action="store_true")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, models, recreate, database, **options):
+        connection = connections[database]
+        if not search.supported(connection):
+            raise CommandError("Нужен SQLite 3.34+ с FTS5 — поиск останется на LIKE")
+
+        by_name = {model._meta.model_name: model for model in search.SEARCH_INDEXES}
+        names = [name.strip().lower() for name in models.split(",") if name.strip()]
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise CommandError(f"Неизвестные модели: {', '.join(unknown)}")
+        selected = [by_name[name] for name in names] or list(by_name.values())
+
+        if recreate:
+            search.drop(connection)
+            search.create(connection)
+            selected = list(by_name.values())
+
+        search.rebuild(database, selected)
+        for model in selected:
+            index = search.SEARCH_INDEXES[model]
+            self.stdout.write(self.style.SUCCESS(
+                f"{model.__name__}: {model.objects.using(database).count()} строк -> {index.table}"
+            ))
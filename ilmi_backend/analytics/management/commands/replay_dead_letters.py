@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Дописывает в базу записи write-behind буфера, которые он не смог записать "
+        "(ANALYTICS_BUFFER_DEAD_LETTER). Что не записалось и сейчас — остаётся в файле."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, batch_size, **options):
+        path = buffer.dead_letter_path()
+        if not path:
+            raise CommandError("ANALYTICS_BUFFER_DEAD_LETTER не настроен")
+        if not os.path.exists(path):
+            self.stdout.write("Записей нет")
+            return
+
+        # воркеры продолжают дописывать в path — разбираем переименованную копию
+        replaying = f"{path}.replaying"
+        os.replace(path, replaying)
+        with open(replaying, encoding="utf-8") as file:
+            records = [buffer.load_record(line) for line in file if line.strip()]
+
+        # как во флашере: сессии и события по отдельности, визиты — один раз
+        written, failed = 0, []
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            batch_failed = buffer.write_batch(batch, retries=1)
+            if batch_failed:
+                self.stderr.write(f"пачка с {start}: не записано {len(batch_failed)}")
+            written += len(batch) - len(batch_failed)
+            failed.extend(batch_failed)
+
+        if failed:
+            buffer.dead_letter(failed)
+        os.remove(replaying)
+        self.stdout.write(self.style.SUCCESS(f"Записано {written}, осталось в файле {len(failed)}"))
@@ -0,0 +1,82 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from analytics.archive import (
+    ARCHIVED_MODELS,
+    ArchiveIndex,
+    archive_dir as default_archive_dir,
+    dumps,
+    iter_segment,
+    row_to_instance,
+    segment_path,
+)
+from analytics.utils import keep_timestamps
+
+
+class Command(BaseCommand):
+    help = (
+        "Читает архивный месяц потоком: возвращает строки в живые таблицы (--into-live) "
+        "или выгружает их в NDJSON (--output, по умолчанию stdout)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(ARCHIVED_MODELS))
+        parser.add_argument("month", help="YYYY-MM")
+        parser.add_argument("--into-live", action="store_true")
+        parser.add_argument("--output", default="-", help="Файл NDJSON или - для stdout")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--archive-dir", default=None)
+
+    def handle(self, *args, model, month, into_live, output, batch_size, archive_dir, **options):
+        root = archive_dir or default_archive_dir()
+        if not segment_path(root, model, month).exists():
+            known = ", ".join(sorted(ArchiveIndex(root).model(model)["months"])) or "нет"
+            raise CommandError(f"Нет архива {model} за {month}. Есть: {known}")
+
+        rows = iter_segment(root, model, month)
+        if into_live:
+            restored, skipped = self.restore(ARCHIVED_MODELS[model], rows, batch_size)
+            self.stderr.write(self.style.SUCCESS(
+                f"{model} {month}: восстановлено {restored}, уже были в базе {skipped}"
+            ))
+            return
+
+        out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+        try:
+            count = 0
+            for row in rows:
+                out.write(dumps(row) + "\n")
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f"{model} {month}: выгружено {count}"))
+
+    def restore(self, model, rows, batch_size):
+        """(вставлено, пропущено как уже существующие)."""
+        restored = skipped = 0
+        batch = []
+        with keep_timestamps(model):
+            for row in rows:
+                batch.append(row_to_instance(model, row))
+                if len(batch) >= batch_size:
+                    inserted = self.flush(model, batch)
+                    restored, skipped = restored + inserted, skipped + len(batch) - inserted
+                    batch = []
+            if batch:
+                inserted = self.flush(model, batch)
+                restored, skipped = restored + inserted, skipped + len(batch) - inserted
+        return restored, skipped
+
+    def flush(self, model, batch):
+        """
+        id сохраняются, уже существующие строки пропускаем (ignore_conflicts).
+        Возвращает, сколько строк реально вставлено: считаем занятые id
+        в той же транзакции, до вставки.
+        """
+        with transaction.atomic(using=model.objects.db):
+            existing = model.objects.filter(pk__in=[obj.pk for obj in batch]).count()
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch) - existing
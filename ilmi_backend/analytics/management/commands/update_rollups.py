@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import ROLLUPS, catch_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Догоняет почасовые агрегаты по новым событиям после чекпоинта. "
+        "Запускать по крону, например раз в 5 минут."
+    )
+
+    def handle(self, *args, **options):
+        for rollup in ROLLUPS:
+            checkpoint, hours = catch_up(rollup)
+            self.stdout.write(f"{rollup.name}: пересчитано часов {hours}, чекпоинт id={checkpoint}")
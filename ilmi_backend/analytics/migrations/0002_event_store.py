@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clickevent',
+            name='session',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='click_events', to='analytics.visitorsession'),
+        ),
+        migrations.AlterField(
+            model_name='pageview',
+            name='session',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='page_views', to='analytics.visitorsession'),
+        ),
+        migrations.AlterField(
+            model_name='sectionview',
+            name='session',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='section_views', to='analytics.visitorsession'),
+        ),
+    ]
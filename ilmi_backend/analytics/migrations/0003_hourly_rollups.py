@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_event_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Чекпоинт агрегатов',
+                'verbose_name_plural': 'Чекпоинты агрегатов',
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyClickStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('page_path', models.CharField(max_length=255)),
+                ('event_id', models.CharField(max_length=64)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Клики по часам',
+                'verbose_name_plural': 'Клики по часам',
+                'ordering': ('-hour',),
+                'indexes': [models.Index(fields=['event_id', 'hour'], name='analytics_h_event_i_07ff7a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'page_path', 'event_id'), name='uniq_hourly_click')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyPageStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('page_path', models.CharField(max_length=255)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Просмотры страниц по часам',
+                'verbose_name_plural': 'Просмотры страниц по часам',
+                'ordering': ('-hour',),
+                'indexes': [models.Index(fields=['page_path', 'hour'], name='analytics_h_page_pa_119c58_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'page_path'), name='uniq_hourly_page')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('page_path', models.CharField(max_length=255)),
+                ('section_id', models.CharField(max_length=64)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Просмотры секций по часам',
+                'verbose_name_plural': 'Просмотры секций по часам',
+                'ordering': ('-hour',),
+                'indexes': [models.Index(fields=['section_id', 'hour'], name='analytics_h_section_45a2e0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'page_path', 'section_id'), name='uniq_hourly_section')],
+            },
+        ),
+    ]
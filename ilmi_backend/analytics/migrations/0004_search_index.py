@@ -0,0 +1,131 @@
+from django.db import migrations
+
+from ._search import SearchSQL
+
+
+# DDL на момент миграции (см. analytics/search.py): FTS5-таблицы с триггерами
+# и первичное наполнение из существующих строк
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS analytics_visitorsession_fts USING fts5(session_key, user_agent, ip_address, tokenize='trigram')",
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_ai AFTER INSERT"
+        " ON analytics_visitorsession"
+        " BEGIN INSERT INTO analytics_visitorsession_fts(rowid, session_key, user_agent, ip_address)"
+        " VALUES (new.id, new.session_key, new.user_agent, new.ip_address);"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_ad AFTER DELETE"
+        " ON analytics_visitorsession BEGIN DELETE"
+        " FROM analytics_visitorsession_fts WHERE rowid = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_au AFTER UPDATE OF session_key, user_agent, ip_address"
+        " ON analytics_visitorsession"
+        " WHEN old.session_key IS NOT new.session_key OR old.user_agent IS NOT new.user_agent OR old.ip_address IS NOT new.ip_address"
+        " BEGIN DELETE FROM analytics_visitorsession_fts WHERE rowid = old.id"
+        "; INSERT INTO analytics_visitorsession_fts(rowid, session_key, user_agent, ip_address)"
+        " VALUES (new.id, new.session_key, new.user_agent, new.ip_address);"
+        " END"
+    ),
+    "CREATE VIRTUAL TABLE IF NOT EXISTS analytics_freelessonlead_fts USING fts5(pk UNINDEXED, full_name, phone, digits, tokenize='trigram')",
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_ai AFTER INSERT"
+        " ON analytics_freelessonlead"
+        " BEGIN INSERT INTO analytics_freelessonlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_ad AFTER DELETE"
+        " ON analytics_freelessonlead BEGIN DELETE"
+        " FROM analytics_freelessonlead_fts WHERE pk = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_au AFTER UPDATE OF full_name, phone"
+        " ON analytics_freelessonlead"
+        " WHEN old.full_name IS NOT new.full_name OR old.phone IS NOT new.phone"
+        " BEGIN DELETE FROM analytics_freelessonlead_fts WHERE pk = old.id"
+        "; INSERT INTO analytics_freelessonlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    "CREATE VIRTUAL TABLE IF NOT EXISTS analytics_failedlead_fts USING fts5(pk UNINDEXED, full_name, phone, digits, tokenize='trigram')",
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_ai AFTER INSERT"
+        " ON analytics_failedlead"
+        " BEGIN INSERT INTO analytics_failedlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_ad AFTER DELETE"
+        " ON analytics_failedlead BEGIN DELETE"
+        " FROM analytics_failedlead_fts WHERE pk = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_au AFTER UPDATE OF full_name, phone"
+        " ON analytics_failedlead"
+        " WHEN old.full_name IS NOT new.full_name OR old.phone IS NOT new.phone"
+        " BEGIN DELETE FROM analytics_failedlead_fts WHERE pk = old.id"
+        "; INSERT INTO analytics_failedlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    "DELETE FROM analytics_visitorsession_fts",
+    (
+        "INSERT INTO analytics_visitorsession_fts(rowid, session_key, user_agent, ip_address)"
+        " SELECT id, session_key, user_agent, ip_address"
+        " FROM analytics_visitorsession"
+    ),
+    (
+        "INSERT INTO analytics_visitorsession_fts(analytics_visitorsession_fts)"
+        " VALUES ('optimize')"
+    ),
+    "DELETE FROM analytics_freelessonlead_fts",
+    (
+        "INSERT INTO analytics_freelessonlead_fts(pk, full_name, phone, digits)"
+        " SELECT id, full_name, phone, replace(replace(replace(replace(replace(replace(replace(phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', '')"
+        " FROM analytics_freelessonlead"
+    ),
+    (
+        "INSERT INTO analytics_freelessonlead_fts(analytics_freelessonlead_fts)"
+        " VALUES ('optimize')"
+    ),
+    "DELETE FROM analytics_failedlead_fts",
+    (
+        "INSERT INTO analytics_failedlead_fts(pk, full_name, phone, digits)"
+        " SELECT id, full_name, phone, replace(replace(replace(replace(replace(replace(replace(phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', '')"
+        " FROM analytics_failedlead"
+    ),
+    (
+        "INSERT INTO analytics_failedlead_fts(analytics_failedlead_fts)"
+        " VALUES ('optimize')"
+    ),
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS analytics_visitorsession_fts_ai",
+    "DROP TRIGGER IF EXISTS analytics_visitorsession_fts_ad",
+    "DROP TRIGGER IF EXISTS analytics_visitorsession_fts_au",
+    "DROP TABLE IF EXISTS analytics_visitorsession_fts",
+    "DROP TRIGGER IF EXISTS analytics_freelessonlead_fts_ai",
+    "DROP TRIGGER IF EXISTS analytics_freelessonlead_fts_ad",
+    "DROP TRIGGER IF EXISTS analytics_freelessonlead_fts_au",
+    "DROP TABLE IF EXISTS analytics_freelessonlead_fts",
+    "DROP TRIGGER IF EXISTS analytics_failedlead_fts_ai",
+    "DROP TRIGGER IF EXISTS analytics_failedlead_fts_ad",
+    "DROP TRIGGER IF EXISTS analytics_failedlead_fts_au",
+    "DROP TABLE IF EXISTS analytics_failedlead_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0003_hourly_rollups"),
+    ]
+
+    operations = [
+        SearchSQL(CREATE_SQL, DROP_SQL),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._search import SearchSQL
+
+
+# SQLite пересоздаёт таблицу при AddField с default — её триггеры
+# FTS (0004_search_index) пропадают вместе со старой таблицей
+SEARCH_TRIGGERS_SQL = [
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_ai AFTER INSERT"
+        " ON analytics_freelessonlead"
+        " BEGIN INSERT INTO analytics_freelessonlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_ad AFTER DELETE"
+        " ON analytics_freelessonlead BEGIN DELETE"
+        " FROM analytics_freelessonlead_fts WHERE pk = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_freelessonlead_fts_au AFTER UPDATE OF full_name, phone"
+        " ON analytics_freelessonlead"
+        " WHEN old.full_name IS NOT new.full_name OR old.phone IS NOT new.phone"
+        " BEGIN DELETE FROM analytics_freelessonlead_fts WHERE pk = old.id"
+        "; INSERT INTO analytics_freelessonlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_ai AFTER INSERT"
+        " ON analytics_failedlead"
+        " BEGIN INSERT INTO analytics_failedlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_ad AFTER DELETE"
+        " ON analytics_failedlead BEGIN DELETE"
+        " FROM analytics_failedlead_fts WHERE pk = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_failedlead_fts_au AFTER UPDATE OF full_name, phone"
+        " ON analytics_failedlead"
+        " WHEN old.full_name IS NOT new.full_name OR old.phone IS NOT new.phone"
+        " BEGIN DELETE FROM analytics_failedlead_fts WHERE pk = old.id"
+        "; INSERT INTO analytics_failedlead_fts(pk, full_name, phone, digits)"
+        " VALUES (new.id, new.full_name, new.phone, replace(replace(replace(replace(replace(replace(replace(new.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''));"
+        " END"
+    ),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='failedlead',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='freelessonlead',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='analytics.freelessonlead'),
+        ),
+        migrations.AddField(
+            model_name='freelessonlead',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='failedlead',
+            index=models.Index(fields=['phone_normalized', 'created_at'], name='analytics_f_phone_n_34481a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='freelessonlead',
+            index=models.Index(fields=['phone_normalized', 'created_at'], name='analytics_f_phone_n_43f0bf_idx'),
+        ),
+        SearchSQL(SEARCH_TRIGGERS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+from ._search import SearchSQL
+
+
+# как в 0005: SQLite пересоздаёт таблицу сессий, триггеры FTS пропадают
+SEARCH_TRIGGERS_SQL = [
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_ai AFTER INSERT"
+        " ON analytics_visitorsession"
+        " BEGIN INSERT INTO analytics_visitorsession_fts(rowid, session_key, user_agent, ip_address)"
+        " VALUES (new.id, new.session_key, new.user_agent, new.ip_address);"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_ad AFTER DELETE"
+        " ON analytics_visitorsession BEGIN DELETE"
+        " FROM analytics_visitorsession_fts WHERE rowid = old.id; END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS analytics_visitorsession_fts_au AFTER UPDATE OF session_key, user_agent, ip_address"
+        " ON analytics_visitorsession"
+        " WHEN old.session_key IS NOT new.session_key OR old.user_agent IS NOT new.user_agent OR old.ip_address IS NOT new.ip_address"
+        " BEGIN DELETE FROM analytics_visitorsession_fts WHERE rowid = old.id"
+        "; INSERT INTO analytics_visitorsession_fts(rowid, session_key, user_agent, ip_address)"
+        " VALUES (new.id, new.session_key, new.user_agent, new.ip_address);"
+        " END"
+    ),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_lead_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorsession',
+            name='browser_family',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='браузер'),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='device_type',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='устройство'),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='in_app_browser',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='in-app браузер'),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='os_family',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='ОС'),
+        ),
+        SearchSQL(SEARCH_TRIGGERS_SQL, migrations.RunSQL.noop),
+    ]
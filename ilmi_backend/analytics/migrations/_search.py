@@ -0,0 +1,31 @@
+"""
+Общее для миграций полнотекстового индекса (0004 и пересоздание триггеров
+в 0005, 0006). Сам DDL заморожен в миграциях строками: analytics.search
+меняется вместе с кодом, а миграция должна делать то же, что и в день,
+когда её написали.
+
+Загрузчик миграций пропускает модули с "_" в начале имени.
+"""
+from django.db import migrations
+
+
+def fts5_trigram(connection):
+    """SQLite с FTS5 и токенизатором trigram (3.34+); иначе поиск остаётся на LIKE."""
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5'), sqlite_version()")
+        fts5, version = cursor.fetchone()
+    return bool(fts5) and tuple(int(part) for part in version.split(".")) >= (3, 34)
+
+
+class SearchSQL(migrations.RunSQL):
+    """RunSQL, который молча пропускается там, где индекс не поддерживается."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if fts5_trigram(schema_editor.connection):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if fts5_trigram(schema_editor.connection):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
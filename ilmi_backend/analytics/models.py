@@ -1,5 +1,109 @@
+import datetime
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import connections, models, router
+from django.utils import timezone
+
+from .phones import normalize_phone
+from .useragents import parse_user_agent
+
+
+UTM_FIELDS = ("utm_source", "utm_medium", "utm_campaign", "utm_content", "utm_term")
+USER_AGENT_FIELDS = ("device_type", "os_family", "browser_family", "in_app_browser")
+
+
+class VisitorSessionManager(models.Manager):
+
+    def upsert(self, session_key: str, **kwargs):
+        """
+        Создаёт или обновляет сессию одним запросом
+        INSERT ... ON CONFLICT(session_key) DO UPDATE ... RETURNING.
+
+        - новая сессия: visit_count = 1
+        - существующая: visit_count + 1 только при increment_visit,
+          счёт идёт на стороне базы, поэтому параллельные воркеры не теряют визиты
+        - increment_visit может быть числом (write-behind склеивает несколько
+          визитов одной сессии): новая сессия получит max(n, 1), старая + n;
+          initial_visits переопределяет значение для новой сессии
+        - last_visit обновляется всегда
+        - user_agent: при replace_user_agent перезаписываем,
+          иначе заполняем только если он ещё пустой;
+          USER_AGENT_FIELDS (analytics/useragents.py) меняются вместе с ним
+        - ip_address перезаписываем, если передан
+        - utm_*: непустые значения перезаписывают старые, пустые не трогают
+
+        Работает на SQLite >= 3.35 и PostgreSQL.
+        """
+        return list(self._upsert_query(session_key, **kwargs))[0]
+
+    async def aupsert(self, session_key: str, **kwargs):
+        """upsert() для async-вьюх: тот же запрос, RawQuerySet умеет async for."""
+        async for session in self._upsert_query(session_key, **kwargs):
+            return session
+
+    def _upsert_query(
+        self,
+        session_key,
+        *,
+        increment_visit=False,
+        initial_visits=None,
+        user_agent=None,
+        replace_user_agent=False,
+        ip_address=None,
+        utm=None,
+    ):
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        table = qn(opts.db_table)
+
+        def prep(name, value):
+            return opts.get_field(name).get_db_prep_save(value, connection)
+
+        visits = int(increment_visit)
+        now = timezone.now()
+        values = {
+            "session_key": session_key,
+            "first_visit": now,
+            "last_visit": now,
+            "visit_count": initial_visits or max(visits, 1),
+            "user_agent": user_agent or "",
+            **parse_user_agent(user_agent)._asdict(),
+            "ip_address": ip_address or None,
+        }
+        for name in UTM_FIELDS:
+            values[name] = (utm or {}).get(name) or ""
+
+        updates = [f"{qn('last_visit')} = excluded.{qn('last_visit')}"]
+        if visits:
+            updates.append(f"{qn('visit_count')} = {table}.{qn('visit_count')} + {visits:d}")
+        if user_agent:
+            current = f"{table}.{qn('user_agent')}"
+            for col in map(qn, ("user_agent", *USER_AGENT_FIELDS)):
+                # справа от SET — старые значения строки, условие одно на все колонки
+                if replace_user_agent:
+                    updates.append(f"{col} = excluded.{col}")
+                else:
+                    updates.append(
+                        f"{col} = CASE WHEN {current} = '' "
+                        f"THEN excluded.{col} ELSE {table}.{col} END"
+                    )
+        if ip_address:
+            updates.append(f"{qn('ip_address')} = excluded.{qn('ip_address')}")
+        for name in UTM_FIELDS:
+            if values[name]:
+                updates.append(f"{qn(name)} = excluded.{qn(name)}")
+
+        columns = list(values)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({qn('session_key')}) DO UPDATE SET {', '.join(updates)} "
+            f"RETURNING *"
+        )
+        params = [prep(name, value) for name, value in values.items()]
+        return self.raw(sql, params).using(db)
 
 
 class VisitorSession(models.Model):
@@ -16,6 +120,14 @@ class VisitorSession(models.Model):
     user_agent = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
 
+    # разобранный user_agent (analytics/useragents.py), заполняется в upsert() и save();
+    # отдельные индексы, а не (колонка, last_visit): upsert на каждом хите
+    # меняет last_visit, и составные индексы пришлось бы переписывать
+    device_type = models.CharField("устройство", max_length=16, blank=True, editable=False, db_index=True)
+    os_family = models.CharField("ОС", max_length=16, blank=True, editable=False, db_index=True)
+    browser_family = models.CharField("браузер", max_length=16, blank=True, editable=False, db_index=True)
+    in_app_browser = models.CharField("in-app браузер", max_length=16, blank=True, editable=False, db_index=True)
+
     # Дополнительно сохраняем UTM (если потом добавишь)
     utm_source = models.CharField(max_length=128, blank=True)
     utm_medium = models.CharField(max_length=128, blank=True)
@@ -23,9 +135,19 @@ class VisitorSession(models.Model):
     utm_content = models.CharField(max_length=128, blank=True)
     utm_term = models.CharField(max_length=128, blank=True)
 
+    objects = VisitorSessionManager()
+
     def __str__(self):
         return self.session_key
 
+    def save(self, *args, **kwargs):
+        for name, value in parse_user_agent(self.user_agent)._asdict().items():
+            setattr(self, name, value)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "user_agent" in update_fields:
+            kwargs["update_fields"] = {*update_fields, *USER_AGENT_FIELDS}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Сессия пользователя"
         verbose_name_plural = "Сессии пользователей"
@@ -42,7 +164,8 @@ class PageView(models.Model):
     """
     session = models.ForeignKey(
         VisitorSession,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,  # события в отдельной базе, см. analytics/routers.py
         related_name="page_views",
     )
     page_path = models.CharField(max_length=255, db_index=True)
@@ -67,7 +190,8 @@ class SectionView(models.Model):
     """
     session = models.ForeignKey(
         VisitorSession,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,  # события в отдельной базе, см. analytics/routers.py
         related_name="section_views",
     )
     page_path = models.CharField(max_length=255, db_index=True)
@@ -100,7 +224,8 @@ class ClickEvent(models.Model):
     """
     session = models.ForeignKey(
         VisitorSession,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,  # события в отдельной базе, см. analytics/routers.py
         related_name="click_events",
     )
     page_path = models.CharField(max_length=255, db_index=True)
@@ -121,6 +246,43 @@ class ClickEvent(models.Model):
         return f"{self.event_id} @ {self.created_at:%Y-%m-%d %H:%M}"
 
 
+class FreeLessonLeadManager(models.Manager):
+
+    def original_id_for(self, phone_normalized, *, before=None):
+        """
+        id первой заявки с этим номером за ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS
+        (одна выборка по индексу phone_normalized + created_at) или None.
+        """
+        if not phone_normalized:
+            return None
+        return self._original_id(self._first_with_phone(phone_normalized, before).first())
+
+    async def aoriginal_id_for(self, phone_normalized, *, before=None):
+        if not phone_normalized:
+            return None
+        return self._original_id(await self._first_with_phone(phone_normalized, before).afirst())
+
+    def _first_with_phone(self, phone_normalized, before):
+        window = datetime.timedelta(days=getattr(settings, "ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS", 30))
+        before = before or timezone.now()
+        return (
+            self.filter(
+                phone_normalized=phone_normalized,
+                created_at__gte=before - window,
+                created_at__lt=before,
+            )
+            .order_by("created_at")
+            .values_list("pk", "duplicate_of_id")
+        )
+
+    @staticmethod
+    def _original_id(first):
+        if first is None:
+            return None
+        pk, duplicate_of_id = first
+        return duplicate_of_id or pk
+
+
 class FreeLessonLead(models.Model):
     """
     Лид из попапа бесплатного урока.
@@ -145,17 +307,38 @@ class FreeLessonLead(models.Model):
     # полезно для аналитики
     is_valid_number = models.BooleanField(default=True)
 
+    objects = FreeLessonLeadManager()
+
+    # телефон в E.164 (analytics/phones.py), заполняется в save()
+    phone_normalized = models.CharField(max_length=16, blank=True, editable=False)
+    # первая заявка с тем же номером за ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS
+    duplicate_of = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="duplicates",
+    )
+
     class Meta:
         verbose_name = "Лид бесплатного урока"
         verbose_name_plural = "Лиды бесплатного урока"
         ordering = ("-created_at",)
         indexes = [
             models.Index(fields=["phone", "created_at"]),
+            models.Index(fields=["phone_normalized", "created_at"]),
         ]
 
     def __str__(self):
         return f"{self.full_name} – {self.phone}"
 
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_normalized"}
+        super().save(*args, **kwargs)
+
 
 class FailedLead(models.Model):
     """
@@ -179,13 +362,118 @@ class FailedLead(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    # тот же E.164, что и у FreeLessonLead — чтобы найти, кто потом всё-таки оставил заявку
+    phone_normalized = models.CharField(max_length=16, blank=True, editable=False)
+
     class Meta:
         verbose_name = "Незавершённый лид"
         verbose_name_plural = "Незавершённые лиды"
         ordering = ("-created_at",)
         indexes = [
             models.Index(fields=["event", "created_at"]),
+            models.Index(fields=["phone_normalized", "created_at"]),
         ]
 
     def __str__(self):
         return f"Failed lead – {self.full_name} / {self.phone}"
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_normalized"}
+        super().save(*args, **kwargs)
+
+
+# ===== ROLLUPS =====
+# Почасовые агрегаты по событиям для дашбордов и отчётов.
+# Живут в базе событий рядом с сырыми таблицами и пересчитываются
+# командами update_rollups (по чекпоинту) и rebuild_rollups (бэкфилл),
+# см. analytics/rollups.py. Час — в UTC.
+
+
+class HourlyPageStat(models.Model):
+    hour = models.DateTimeField(db_index=True)
+    page_path = models.CharField(max_length=255)
+    views = models.PositiveIntegerField(default=0)
+    # уникальные сессии за этот час
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Просмотры страниц по часам"
+        verbose_name_plural = "Просмотры страниц по часам"
+        ordering = ("-hour",)
+        constraints = [
+            models.UniqueConstraint(fields=["hour", "page_path"], name="uniq_hourly_page"),
+        ]
+        indexes = [
+            models.Index(fields=["page_path", "hour"]),
+        ]
+
+    def __str__(self):
+        return f"{self.page_path} @ {self.hour:%Y-%m-%d %H}:00 – {self.views}"
+
+
+class HourlySectionStat(models.Model):
+    hour = models.DateTimeField(db_index=True)
+    page_path = models.CharField(max_length=255)
+    section_id = models.CharField(max_length=64)
+    views = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Просмотры секций по часам"
+        verbose_name_plural = "Просмотры секций по часам"
+        ordering = ("-hour",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "page_path", "section_id"], name="uniq_hourly_section"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["section_id", "hour"]),
+        ]
+
+    def __str__(self):
+        return f"{self.section_id} @ {self.hour:%Y-%m-%d %H}:00 – {self.views}"
+
+
+class HourlyClickStat(models.Model):
+    hour = models.DateTimeField(db_index=True)
+    page_path = models.CharField(max_length=255)
+    event_id = models.CharField(max_length=64)
+    clicks = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Клики по часам"
+        verbose_name_plural = "Клики по часам"
+        ordering = ("-hour",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "page_path", "event_id"], name="uniq_hourly_click"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["event_id", "hour"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} @ {self.hour:%Y-%m-%d %H}:00 – {self.clicks}"
+
+
+class RollupCheckpoint(models.Model):
+    """
+    До какого id сырой таблицы агрегаты уже посчитаны.
+    name — model_name исходной таблицы (pageview, sectionview, clickevent).
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Чекпоинт агрегатов"
+        verbose_name_plural = "Чекпоинты агрегатов"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
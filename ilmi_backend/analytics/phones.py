@@ -0,0 +1,42 @@
+"""
+Нормализация телефонов лидов.
+
+intl-tel-input и ручной ввод дают "+998 90 123-45-67", "998901234567",
+"90 123 45 67", "00998 ..." — всё это один номер. Храним его в виде
+E.164 ("+998901234567") в phone_normalized с индексом: дубли и связь
+FailedLead -> FreeLessonLead ищутся точным совпадением по индексу.
+"""
+import re
+
+from django.conf import settings
+
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def default_country_code():
+    return str(getattr(settings, "ANALYTICS_DEFAULT_COUNTRY_CODE", "998"))
+
+
+def normalize_phone(raw):
+    """
+    E.164 или "" если цифр слишком мало/много для номера.
+    Номер без кода страны (национальный формат) дополняем
+    ANALYTICS_DEFAULT_COUNTRY_CODE.
+    """
+    digits = NON_DIGITS.sub("", raw or "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+
+    country = default_country_code()
+    national_length = getattr(settings, "ANALYTICS_NATIONAL_NUMBER_LENGTH", 9)
+    if len(digits) == national_length:
+        # и когда номер сам начинается с кода страны: "99 812 34 56" (код оператора 99)
+        digits = country + digits
+    elif len(digits) == national_length + 1 and digits.startswith("0"):
+        # национальный префикс 0 (в т.ч. старый "8" не трогаем — он неоднозначен)
+        digits = country + digits[1:]
+
+    if not 8 <= len(digits) <= 15:
+        return ""
+    return "+" + digits
@@ -0,0 +1,308 @@
+"""
+Отчёт по воронке лендинга.
+
+- секции по порядку ANALYTICS_FUNNEL_SECTIONS (hero -> ... -> форма лида):
+  просмотры, сессии, доля от первой секции и от предыдущей
+- клики ANALYTICS_FUNNEL_CLICKS (free_lesson_click, buy_click) -> FreeLessonLead
+
+Без UTM-фильтров всё читается из почасовых агрегатов (analytics/rollups.py).
+С UTM-фильтром агрегаты не подходят: считаем по сырым событиям сессий
+с нужными UTM — тем же GROUP BY (час, ключ), что и агрегаты, в базе.
+
+Все «sessions» в отчёте — сессии-часы (SESSIONS_UNIT): уникальные сессии
+за каждый час, сложенные по часам. Так их дают агрегаты, и так же
+их считает сырой путь и лиды — доли между полями и между источниками
+сравнимы. Сессия, которая вернулась через день, считается дважды.
+
+Результат кэшируется на набор параметров. В ключ входит версия данных
+(data_version): для отчёта по агрегатам — их чекпоинты, которые двигает
+только update_rollups, а не каждый хит трекинга; для UTM-отчёта по сырым
+событиям — последние id событий. И в обоих — последний лид.
+
+Там же — отчёты по дублям лидов (по phone_normalized, см. analytics/phones.py).
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Count, Exists, Max, Min, OuterRef, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import (
+    UTM_FIELDS,
+    VisitorSession,
+    PageView,
+    SectionView,
+    ClickEvent,
+    FreeLessonLead,
+    FailedLead,
+    HourlyPageStat,
+    HourlySectionStat,
+    HourlyClickStat,
+    RollupCheckpoint,
+)
+
+
+DEFAULT_FUNNEL_SECTIONS = ("hero-video", "benefits", "program", "lead-form")
+DEFAULT_FUNNEL_CLICKS = ("free_lesson_click", "buy_click")
+
+CACHE_PREFIX = "analytics:funnel"
+
+SESSIONS_UNIT = "session_hours"
+
+# лимит переменных в одном IN (...) для SQLite
+ID_CHUNK = 5000
+
+
+def funnel_sections():
+    return tuple(getattr(settings, "ANALYTICS_FUNNEL_SECTIONS", DEFAULT_FUNNEL_SECTIONS))
+
+
+def funnel_clicks():
+    return tuple(getattr(settings, "ANALYTICS_FUNNEL_CLICKS", DEFAULT_FUNNEL_CLICKS))
+
+
+def day_range(date_from, date_to):
+    """Дни включительно -> [start, end) в локальной зоне проекта."""
+    start = timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min))
+    end = timezone.make_aware(
+        datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min)
+    )
+    return start, end
+
+
+def data_version(raw=False):
+    """
+    Дешёвый отпечаток данных: всё по индексам, по одному запросу на таблицу.
+    raw — отчёт читает сырые события (UTM): тогда версия — их последние id.
+    """
+    if raw:
+        events = [model.objects.aggregate(last=Max("pk"))["last"] for model in (PageView, SectionView, ClickEvent)]
+    else:
+        events = list(RollupCheckpoint.objects.order_by("name").values_list("name", "last_id"))
+    parts = [events, FreeLessonLead.objects.aggregate(last=Max("created_at"))["last"]]
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def cache_key(params, raw=False):
+    key = json.dumps(params, sort_keys=True, default=str)
+    return f"{CACHE_PREFIX}:{hashlib.sha1(key.encode()).hexdigest()}:{data_version(raw)}"
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), ID_CHUNK):
+        yield ids[i:i + ID_CHUNK]
+
+
+def _session_filters(session_ids):
+    """
+    Значения для session_id__in по запросу id сессий (values_list).
+    События в одной базе с сессиями — подзапрос; в отдельной базе
+    (analytics/routers.py) JOIN невозможен — пачки id. Пачки не пересекаются,
+    поэтому уникальные сессии по пачкам можно складывать.
+    """
+    if router.db_for_read(session_ids.model) == router.db_for_read(PageView):
+        yield session_ids
+    else:
+        yield from _chunks(list(session_ids))
+
+
+def _per_hour(queryset, key=None):
+    """Строки (key, count, sessions) — GROUP BY (час, key), как в агрегатах."""
+    keys = (key,) if key else ()
+    return (
+        queryset
+        .annotate(hour=TruncHour("created_at", tzinfo=datetime.timezone.utc))
+        .values("hour", *keys)
+        .annotate(count=Count("id"), sessions=Count("session_id", distinct=True))
+        .order_by()
+    )
+
+
+def _add(stats, row, count_field):
+    stats[count_field] = stats.get(count_field, 0) + row["count"]
+    stats["sessions"] = stats.get("sessions", 0) + row["sessions"]
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+# ----- источники: агрегаты или сырые события -----
+
+def _from_rollups(start, end, sections, clicks):
+    pages = HourlyPageStat.objects.filter(hour__gte=start, hour__lt=end).aggregate(
+        views=Sum("views"), sessions=Sum("sessions")
+    )
+    section_rows = (
+        HourlySectionStat.objects
+        .filter(hour__gte=start, hour__lt=end, section_id__in=sections)
+        .values("section_id")
+        .annotate(views=Sum("views"), sessions=Sum("sessions"))
+        .order_by()
+    )
+    click_rows = (
+        HourlyClickStat.objects
+        .filter(hour__gte=start, hour__lt=end, event_id__in=clicks)
+        .values("event_id")
+        .annotate(clicks=Sum("clicks"), sessions=Sum("sessions"))
+        .order_by()
+    )
+    return (
+        {"views": pages["views"] or 0, "sessions": pages["sessions"] or 0},
+        {row["section_id"]: row for row in section_rows},
+        {row["event_id"]: row for row in click_rows},
+    )
+
+
+def _from_raw(start, end, sections, clicks, session_ids):
+    pages = {"views": 0, "sessions": 0}
+    section_stats = {}
+    click_stats = {}
+
+    for sessions in _session_filters(session_ids):
+        events = dict(created_at__gte=start, created_at__lt=end, session_id__in=sessions)
+        for row in _per_hour(PageView.objects.filter(**events)):
+            _add(pages, row, "views")
+        for row in _per_hour(SectionView.objects.filter(**events, section_id__in=sections), "section_id"):
+            _add(section_stats.setdefault(row["section_id"], {}), row, "views")
+        for row in _per_hour(ClickEvent.objects.filter(**events, event_id__in=clicks), "event_id"):
+            _add(click_stats.setdefault(row["event_id"], {}), row, "clicks")
+
+    return pages, section_stats, click_stats
+
+
+# ----- отчёт -----
+
+def build_funnel(date_from, date_to, utm=None):
+    utm = {name: value for name, value in (utm or {}).items() if name in UTM_FIELDS and value}
+    start, end = day_range(date_from, date_to)
+    sections = funnel_sections()
+    clicks = funnel_clicks()
+
+    leads = FreeLessonLead.objects.filter(created_at__gte=start, created_at__lt=end)
+    if utm:
+        session_ids = (
+            VisitorSession.objects
+            .filter(**utm, first_visit__lt=end)
+            .values_list("pk", flat=True)
+        )
+        pages, section_stats, click_stats = _from_raw(start, end, sections, clicks, session_ids)
+        leads = leads.filter(**{f"session__{name}": value for name, value in utm.items()})
+        source = "raw"
+    else:
+        pages, section_stats, click_stats = _from_rollups(start, end, sections, clicks)
+        source = "rollups"
+
+    steps = []
+    first = previous = None
+    for section_id in sections:
+        stats = section_stats.get(section_id, {})
+        sessions = stats.get("sessions", 0)
+        if first is None:
+            first = sessions
+        steps.append({
+            "section_id": section_id,
+            "views": stats.get("views", 0),
+            "sessions": sessions,
+            "from_first": _rate(sessions, first),
+            "from_previous": _rate(sessions, previous) if previous is not None else None,
+        })
+        previous = sessions
+
+    lead_count = leads.count()
+    leads_with_session = leads.exclude(session=None)
+    lead_sessions = sum(row["sessions"] for row in _per_hour(leads_with_session))
+
+    clicked_with_lead = {}
+    for sessions in _session_filters(leads_with_session.values_list("session_id", flat=True).distinct()):
+        for row in _per_hour(
+            ClickEvent.objects.filter(
+                created_at__gte=start, created_at__lt=end, event_id__in=clicks, session_id__in=sessions,
+            ),
+            "event_id",
+        ):
+            _add(clicked_with_lead.setdefault(row["event_id"], {}), row, "clicks")
+
+    conversions = []
+    for event_id in clicks:
+        stats = click_stats.get(event_id, {})
+        with_lead = clicked_with_lead.get(event_id, {}).get("sessions", 0)
+        conversions.append({
+            "event_id": event_id,
+            "clicks": stats.get("clicks", 0),
+            "sessions": stats.get("sessions", 0),
+            "sessions_with_lead": with_lead,
+            "lead_rate": _rate(with_lead, stats.get("sessions", 0)),
+        })
+
+    checkpoints = RollupCheckpoint.objects.aggregate(updated=Max("updated_at"))["updated"]
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "utm": utm,
+        "source": source,
+        "sessions_unit": SESSIONS_UNIT,
+        "rollups_updated_at": checkpoints.isoformat() if checkpoints else None,
+        "page_views": pages,
+        "sections": steps,
+        "clicks": conversions,
+        "leads": {
+            "count": lead_count,
+            "sessions": lead_sessions,
+            "from_page_sessions": _rate(lead_sessions, pages["sessions"]),
+        },
+    }
+
+
+def funnel_report(date_from, date_to, utm=None, *, use_cache=True):
+    params = {"from": date_from, "to": date_to, "utm": utm or {}}
+    raw = any(value for name, value in (utm or {}).items() if name in UTM_FIELDS)
+    key = cache_key(params, raw)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    report = build_funnel(date_from, date_to, utm)
+    cache.set(key, report, getattr(settings, "ANALYTICS_REPORT_CACHE_TTL", 600))
+    return report
+
+
+# ----- дубли лидов -----
+
+def duplicate_phone_groups(since=None):
+    """
+    Номера с несколькими заявками: GROUP BY по индексу
+    (phone_normalized, created_at), без сравнения строк в Python.
+    """
+    leads = FreeLessonLead.objects.exclude(phone_normalized="")
+    if since:
+        leads = leads.filter(created_at__gte=since)
+    return (
+        leads
+        .values("phone_normalized")
+        .annotate(leads=Count("id"), first=Min("created_at"), last=Max("created_at"))
+        .filter(leads__gt=1)
+        .order_by("-last")
+    )
+
+
+def recovered_failed_leads(since=None):
+    """
+    Незавершённые заявки, после которых с тем же номером пришёл полноценный лид.
+    EXISTS по тому же индексу у FreeLessonLead — по одному поиску на строку.
+    """
+    failed = FailedLead.objects.exclude(phone_normalized="")
+    if since:
+        failed = failed.filter(created_at__gte=since)
+    completed = FreeLessonLead.objects.filter(
+        phone_normalized=OuterRef("phone_normalized"),
+        created_at__gte=OuterRef("created_at"),
+    )
+    return failed.filter(Exists(completed))
+
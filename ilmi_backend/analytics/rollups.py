@@ -0,0 +1,155 @@
+"""
+Почасовые агрегаты: HourlyPageStat, HourlySectionStat, HourlyClickStat.
+
+Пересчёт всегда идёт целыми часами: строки агрегата за час удаляются
+и считаются заново одним GROUP BY по сырой таблице (индекс по created_at).
+Так уникальные сессии за час остаются точными, а повторный запуск безопасен.
+
+- catch_up(): берёт события с id > чекпоинта, находит задетые ими часы,
+  пересчитывает только их и двигает чекпоинт (update_rollups, по крону)
+- rebuild(): пересчитывает диапазон дат целиком (rebuild_rollups, бэкфилл)
+"""
+import datetime
+from dataclasses import dataclass
+
+from django.db import router, transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncHour
+
+from .models import (
+    PageView,
+    SectionView,
+    ClickEvent,
+    HourlyPageStat,
+    HourlySectionStat,
+    HourlyClickStat,
+    RollupCheckpoint,
+)
+
+
+UTC = datetime.timezone.utc
+HOUR = datetime.timedelta(hours=1)
+
+
+@dataclass(frozen=True)
+class Rollup:
+    source: type
+    target: type
+    keys: tuple
+    count_field: str
+
+    @property
+    def name(self):
+        return self.source._meta.model_name
+
+    def aggregate(self, start, end):
+        """Агрегаты за [start, end) — по строке на (час, ключи)."""
+        rows = (
+            self.source.objects
+            .filter(created_at__gte=start, created_at__lt=end)
+            .annotate(hour=TruncHour("created_at", tzinfo=UTC))
+            .values("hour", *self.keys)
+            .annotate(total=Count("id"), uniq=Count("session_id", distinct=True))
+            .order_by()
+        )
+        return [
+            self.target(
+                hour=row["hour"],
+                sessions=row["uniq"],
+                **{key: row[key] for key in self.keys},
+                **{self.count_field: row["total"]},
+            )
+            for row in rows
+        ]
+
+    def recompute(self, start, end):
+        """Заменяет агрегаты за [start, end) пересчитанными. Возвращает число строк."""
+        stats = self.aggregate(start, end)
+        with transaction.atomic(using=router.db_for_write(self.target)):
+            self.target.objects.filter(hour__gte=start, hour__lt=end).delete()
+            self.target.objects.bulk_create(stats, batch_size=1000)
+        return len(stats)
+
+
+ROLLUPS = (
+    Rollup(PageView, HourlyPageStat, ("page_path",), "views"),
+    Rollup(SectionView, HourlySectionStat, ("page_path", "section_id"), "views"),
+    Rollup(ClickEvent, HourlyClickStat, ("page_path", "event_id"), "clicks"),
+)
+
+
+def floor_hour(value):
+    return value.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_ranges(hours):
+    """Склеивает набор часов в непрерывные диапазоны [start, end)."""
+    ranges = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + HOUR
+        else:
+            ranges.append([hour, hour + HOUR])
+    return ranges
+
+
+def _recompute_range(rollup, start, end, step=datetime.timedelta(days=1)):
+    """Пересчёт длинного диапазона кусками, чтобы не держать всё в памяти и в одной транзакции."""
+    total = 0
+    cursor = start
+    while cursor < end:
+        chunk_end = min(cursor + step, end)
+        total += rollup.recompute(cursor, chunk_end)
+        cursor = chunk_end
+    return total
+
+
+def catch_up(rollup):
+    """
+    Пересчитывает часы, в которые попали новые события после чекпоинта.
+    Возвращает (новый чекпоинт, сколько часов пересчитано).
+    """
+    checkpoint, _ = RollupCheckpoint.objects.get_or_create(name=rollup.name)
+    new_events = rollup.source.objects.filter(pk__gt=checkpoint.last_id)
+    upper = new_events.aggregate(upper=Max("pk"))["upper"]
+    if upper is None:
+        return checkpoint.last_id, 0
+
+    new_events = new_events.filter(pk__lte=upper)
+    hours = {
+        floor_hour(hour)
+        for hour in new_events
+        .annotate(hour=TruncHour("created_at", tzinfo=UTC))
+        .values_list("hour", flat=True)
+        .distinct()
+        .order_by()
+    }
+    for start, end in _hour_ranges(hours):
+        _recompute_range(rollup, start, end)
+
+    checkpoint.last_id = upper
+    checkpoint.save(update_fields=["last_id", "updated_at"])
+    return upper, len(hours)
+
+
+def rebuild(rollup, since=None, until=None, step=datetime.timedelta(days=1)):
+    """
+    Пересчитывает [since, until) кусками по step. Границы по умолчанию —
+    первое и последнее живое событие. Часы, сырые данные которых уже
+    ушли в архив (archive_events), не трогаем: since не раньше первого события.
+    """
+    bounds = rollup.source.objects.aggregate(
+        first=Min("created_at"), last=Max("created_at"), upper=Max("pk")
+    )
+    if bounds["first"] is None:
+        return 0
+
+    start = floor_hour(max(since, bounds["first"]) if since else bounds["first"])
+    end = floor_hour(until) if until else floor_hour(bounds["last"]) + HOUR
+    total = _recompute_range(rollup, start, end, step)
+
+    if since is None and until is None:
+        RollupCheckpoint.objects.update_or_create(
+            name=rollup.name, defaults={"last_id": bounds["upper"]}
+        )
+    return total
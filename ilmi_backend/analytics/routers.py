@@ -0,0 +1,71 @@
+"""
+Роутер отдельного хранилища событий.
+
+Сырые события (PageView, SectionView, ClickEvent) пишутся много и часто,
+поэтому живут вместе со своими почасовыми агрегатами в своей базе ANALYTICS_EVENT_DATABASE (по умолчанию "events"),
+а админка, auth, сессии Django, VisitorSession и лиды остаются в default.
+
+Связь событие -> сессия держится через session_id без FK-констрейнта:
+JOIN между файлами SQLite невозможен, но session / session_id в ORM работают.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+EVENT_MODELS = {
+    "pageview",
+    "sectionview",
+    "clickevent",
+    # почасовые агрегаты считаются из событий и лежат рядом с ними
+    "hourlypagestat",
+    "hourlysectionstat",
+    "hourlyclickstat",
+    "rollupcheckpoint",
+}
+
+
+def event_database():
+    alias = getattr(settings, "ANALYTICS_EVENT_DATABASE", "events")
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def is_event_model(model):
+    opts = model._meta
+    return opts.app_label == "analytics" and opts.model_name in EVENT_MODELS
+
+
+class EventStoreRouter:
+
+    def _db_for(self, model):
+        if is_event_model(model):
+            return event_database()
+        if model._meta.app_label == "analytics":
+            # явно, иначе pageview.session пойдёт по хинту instance в базу событий
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # событие -> VisitorSession через базы разрешаем: держим только session_id
+        if is_event_model(type(obj1)) or is_event_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        events_db = event_database()
+        if events_db == DEFAULT_DB_ALIAS:
+            return None
+
+        is_event = app_label == "analytics" and (
+            model_name in EVENT_MODELS or hints.get("target_db") == events_db
+        )
+        if db == events_db:
+            return is_event
+        if is_event:
+            return False
+        return None
@@ -0,0 +1,214 @@
+"""
+Полнотекстовый индекс (SQLite FTS5, токенизатор trigram) для поиска в админке.
+
+icontains по user_agent / full_name / phone — это LIKE '%...%', то есть
+полный проход по таблице. trigram индексирует все тройки символов,
+поэтому поиск подстроки от 3 символов идёт по индексу, без учёта регистра.
+
+- VisitorSession  -> analytics_visitorsession_fts (rowid = id сессии)
+- FreeLessonLead  -> analytics_freelessonlead_fts (pk UUID в колонке pk)
+- FailedLead      -> analytics_failedlead_fts
+
+Телефон дополнительно кладём одними цифрами (колонка digits), так что
+"+7 (999) 123" и "999123" находят один и тот же номер.
+
+Индекс держат в актуальном состоянии триггеры (создаются миграцией 0004).
+Если индекса нет (не SQLite, старая версия SQLite) — поиск в админке
+остаётся обычным LIKE. Пересборка: python manage.py rebuild_search_index
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import VisitorSession, FreeLessonLead, FailedLead
+
+
+# символы, которые вырезаем из телефона (в SQL — вложенными replace)
+PHONE_PUNCTUATION = " -()+./"
+
+PHONE_QUERY_RE = re.compile(r"^[\d\s()+\-./]+$")
+
+MIN_TERM = 3  # короче trigram по индексу не ищет
+
+
+@dataclass(frozen=True)
+class SearchIndex:
+    model: type
+    columns: tuple
+    phone_column: str = None
+
+    @property
+    def table(self):
+        return f"{self.model._meta.db_table}_fts"
+
+    @property
+    def source(self):
+        return self.model._meta.db_table
+
+    @property
+    def rowid_key(self):
+        """Целый pk — он же rowid FTS (удаление по индексу), иначе pk храним колонкой."""
+        return self.model._meta.pk.get_internal_type() in ("AutoField", "BigAutoField")
+
+    @property
+    def key(self):
+        return "rowid" if self.rowid_key else "pk"
+
+    def fts_columns(self):
+        return [*self.columns, *(["digits"] if self.phone_column else [])]
+
+    def values_sql(self, prefix):
+        values = [f"{prefix}{column}" for column in self.columns]
+        if self.phone_column:
+            values.append(digits_sql(f"{prefix}{self.phone_column}"))
+        return values
+
+    def create_sql(self):
+        pk = self.model._meta.pk.column
+        columns = ", ".join(self.fts_columns())
+        key_column = "" if self.rowid_key else "pk UNINDEXED, "
+        insert = (
+            f"INSERT INTO {self.table}({self.key}, {columns}) "
+            f"VALUES (new.{pk}, {', '.join(self.values_sql('new.'))});"
+        )
+        delete = f"DELETE FROM {self.table} WHERE {self.key} = old.{pk};"
+        watched = [*self.columns, *([self.phone_column] if self.phone_column else [])]
+        watched = list(dict.fromkeys(watched))
+        changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in watched)
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5({key_column}{columns}, tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {self.source} "
+            f"BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {self.source} "
+            f"BEGIN {delete} END",
+            # upsert сессии трогает user_agent / ip_address на каждом хите —
+            # переиндексируем только при реальном изменении
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF {', '.join(watched)} "
+            f"ON {self.source} WHEN {changed} BEGIN {delete} {insert} END",
+        ]
+
+    def drop_sql(self):
+        return [
+            f"DROP TRIGGER IF EXISTS {self.table}_ai",
+            f"DROP TRIGGER IF EXISTS {self.table}_ad",
+            f"DROP TRIGGER IF EXISTS {self.table}_au",
+            f"DROP TABLE IF EXISTS {self.table}",
+        ]
+
+    def rebuild_sql(self):
+        pk = self.model._meta.pk.column
+        return [
+            f"DELETE FROM {self.table}",
+            f"INSERT INTO {self.table}({self.key}, {', '.join(self.fts_columns())}) "
+            f"SELECT {pk}, {', '.join(self.values_sql(''))} FROM {self.source}",
+            f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')",
+        ]
+
+
+SEARCH_INDEXES = {
+    index.model: index
+    for index in (
+        SearchIndex(VisitorSession, ("session_key", "user_agent", "ip_address")),
+        SearchIndex(FreeLessonLead, ("full_name", "phone"), phone_column="phone"),
+        SearchIndex(FailedLead, ("full_name", "phone"), phone_column="phone"),
+    )
+}
+
+
+def digits_sql(expression):
+    for char in PHONE_PUNCTUATION:
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+def supported(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5'), sqlite_version()")
+        fts5, version = cursor.fetchone()
+    # trigram появился в 3.34
+    return bool(fts5) and tuple(int(part) for part in version.split(".")) >= (3, 34)
+
+
+def create(connection):
+    with connection.cursor() as cursor:
+        for index in SEARCH_INDEXES.values():
+            for sql in index.create_sql():
+                cursor.execute(sql)
+    _ready.clear()
+
+
+def drop(connection):
+    with connection.cursor() as cursor:
+        for index in SEARCH_INDEXES.values():
+            for sql in index.drop_sql():
+                cursor.execute(sql)
+    _ready.clear()
+
+
+def rebuild(using, models=None):
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for model, index in SEARCH_INDEXES.items():
+            if models and model not in models:
+                continue
+            for sql in index.rebuild_sql():
+                cursor.execute(sql)
+
+
+_ready = {}
+
+
+def ready(index, using):
+    """Есть ли таблица индекса в базе (запоминаем на процесс)."""
+    key = (using, index.table)
+    if key not in _ready:
+        connection = connections[using]
+        _ready[key] = connection.vendor == "sqlite" and (
+            index.table in connection.introspection.table_names()
+        )
+    return _ready[key]
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def match_expression(index, term):
+    """
+    Строка запроса FTS5 или None, если индексом искать нельзя
+    (слишком короткие слова) — тогда остаётся обычный LIKE.
+    """
+    term = term.strip()
+    if not term:
+        return None
+
+    digits = re.sub(r"\D", "", term)
+    if index.phone_column and PHONE_QUERY_RE.match(term) and len(digits) >= MIN_TERM:
+        return f"digits : {_phrase(digits)}"
+
+    words = term.split()
+    if any(len(word) < MIN_TERM for word in words):
+        return None
+    return " AND ".join(_phrase(word) for word in words)
+
+
+def matching_pks(model, term, using):
+    """
+    Подзапрос с pk подходящих строк (для filter(pk__in=...)) или None.
+    Всё остаётся одним SQL-запросом, без выгрузки id в Python.
+    """
+    index = SEARCH_INDEXES.get(model)
+    if index is None or not ready(index, using):
+        return None
+    expression = match_expression(index, term)
+    if expression is None:
+        return None
+    return RawSQL(
+        f"SELECT {index.key} FROM {index.table} WHERE {index.table} MATCH %s",
+        [expression],
+    )
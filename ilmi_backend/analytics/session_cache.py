@@ -0,0 +1,139 @@
+"""
+Кэш session_key -> VisitorSession.pk для горячих сессий.
+
+Секциям и кликам нужен только pk сессии, чтобы привязать строку.
+Кэш (LRU + TTL, в памяти воркера) позволяет не ходить за сессией в базу,
+а last_visit обновляется не чаще раза в ANALYTICS_LAST_VISIT_WINDOW секунд
+на сессию — вместо UPDATE на каждый скролл и клик.
+
+Настройки:
+- ANALYTICS_SESSION_CACHE_SIZE — сколько сессий держим (LRU)
+- ANALYTICS_SESSION_CACHE_TTL — сколько секунд запись живёт в кэше
+- ANALYTICS_LAST_VISIT_WINDOW — окно склейки обновлений last_visit
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import VisitorSession
+
+
+class SessionCache:
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_key):
+        """Возвращает (pk, touched_at) или None. touched_at — time.monotonic()."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(session_key)
+            if entry is None:
+                return None
+            pk, touched_at, stored_at = entry
+            if now - stored_at > self.ttl:
+                del self._data[session_key]
+                return None
+            self._data.move_to_end(session_key)
+            return pk, touched_at
+
+    def put(self, session_key, pk, touched_at=None):
+        now = time.monotonic()
+        with self._lock:
+            self._data[session_key] = (pk, now if touched_at is None else touched_at, now)
+            self._data.move_to_end(session_key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, session_key):
+        with self._lock:
+            self._data.pop(session_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SessionCache(
+                    max_size=getattr(settings, "ANALYTICS_SESSION_CACHE_SIZE", 10_000),
+                    ttl=getattr(settings, "ANALYTICS_SESSION_CACHE_TTL", 1800),
+                )
+    return _cache
+
+
+def remember(session):
+    """Запоминаем сессию, которую только что создали или обновили upsert'ом."""
+    if session is not None:
+        get_cache().put(session.session_key, session.pk)
+
+
+def session_pk(session_key):
+    """
+    pk сессии по session_key без лишних запросов:
+    - свежая запись в кэше -> 0 запросов
+    - запись есть, но окно last_visit прошло -> 1 UPDATE last_visit
+    - в кэше нет -> 1 upsert (создаёт сессию, если её ещё нет)
+    """
+    if not session_key:
+        return None
+
+    cache = get_cache()
+    window = getattr(settings, "ANALYTICS_LAST_VISIT_WINDOW", 60)
+    entry = cache.get(session_key)
+
+    if entry is not None:
+        pk, touched_at = entry
+        now = time.monotonic()
+        if now - touched_at < window:
+            return pk
+        if VisitorSession.objects.filter(pk=pk).update(last_visit=timezone.now()):
+            cache.put(session_key, pk, now)
+            return pk
+        # сессию удалили (например, из админки) — забываем и создаём заново
+        cache.discard(session_key)
+
+    session = VisitorSession.objects.upsert(session_key)
+    remember(session)
+    return session.pk
+
+
+async def asession_pk(session_key):
+    """session_pk() для async-вьюх: кэш тот же, в базу — только async ORM."""
+    if not session_key:
+        return None
+
+    cache = get_cache()
+    window = getattr(settings, "ANALYTICS_LAST_VISIT_WINDOW", 60)
+    entry = cache.get(session_key)
+
+    if entry is not None:
+        pk, touched_at = entry
+        now = time.monotonic()
+        if now - touched_at < window:
+            return pk
+        if await VisitorSession.objects.filter(pk=pk).aupdate(last_visit=timezone.now()):
+            cache.put(session_key, pk, now)
+            return pk
+        cache.discard(session_key)
+
+    session = await VisitorSession.objects.aupsert(session_key)
+    remember(session)
+    return session.pk
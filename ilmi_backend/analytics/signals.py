@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import session_cache
+from .models import VisitorSession, PageView, SectionView, ClickEvent
+
+
+@receiver(post_delete, sender=VisitorSession)
+def delete_session_events(sender, instance, **kwargs):
+    """
+    События лежат в отдельной базе без FK-констрейнта,
+    поэтому каскад при удалении сессии делаем сами.
+    """
+    for model in (PageView, SectionView, ClickEvent):
+        model.objects.filter(session_id=instance.pk).delete()
+    session_cache.get_cache().discard(instance.session_key)
@@ -0,0 +1,476 @@
+"""
+Синтетические данные для нагрузки админки и отчётов: python manage.py generate_data
+
+Генерация потоком, пачками по batch_size сессий: сессии (с id) -> их
+просмотры, секции, клики и лиды -> executemany на таблицу (insert_rows).
+В памяти только текущая пачка, так что миллионы строк идут при
+постоянной памяти. Всё определяется seed: тот же seed и профиль — те же
+строки (кроме автоинкрементных id, если база не пустая).
+
+Распределения — профиль (DEFAULT_PROFILE, поверх него
+ANALYTICS_SYNTHETIC_PROFILE из settings, поверх — JSON из --profile):
+
+- utm_sources: вес источника ("" — прямой заход), у каждого medium и кампании
+- return_visits: вес числа визитов сессии (каждый визит — PageView)
+- funnel: вероятность дойти до секции при условии, что видел предыдущую
+  (ключи — ANALYTICS_FUNNEL_SECTIONS по порядку)
+- clicks: вероятность клика на визит по event_id
+- lead_rate / failed_lead_rate: доля сессий, дошедших до последней секции
+  воронки, с заявкой / брошенной формой; repeat_phone_rate — заявка
+  с уже встречавшимся номером (дубль)
+- hours: вес часа суток (локального), weekdays: вес дня недели, 0 — понедельник
+
+Сессии идут по времени: i-я сессия попадает в i/N долю периода
+(день выбирается по весам weekdays внутри недели), так что id растут
+вместе с created_at, как в живой базе — на этом держатся архив и чекпоинты
+агрегатов.
+
+defer_indexes(): на время загрузки снимает неуникальные индексы таблиц
+(и триггеры полнотекстового поиска) и возвращает их одним проходом в конце —
+на больших объёмах это в разы быстрее, чем обновлять индексы построчно.
+"""
+import bisect
+import datetime
+import functools
+import itertools
+import random
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import search
+from .models import (
+    USER_AGENT_FIELDS,
+    UTM_FIELDS,
+    ClickEvent,
+    FailedLead,
+    FreeLessonLead,
+    PageView,
+    SectionView,
+    VisitorSession,
+)
+from .phones import normalize_phone
+from .useragents import parse_user_agent
+from .utils import keep_timestamps
+
+
+GENERATED_MODELS = (VisitorSession, PageView, SectionView, ClickEvent, FreeLessonLead, FailedLead)
+
+DEFAULT_PROFILE = {
+    "utm_sources": {
+        "": {"weight": 35},
+        "instagram": {"weight": 30, "medium": "social", "campaigns": ["reels_oct", "stories_promo", "bio_link"]},
+        "telegram": {"weight": 15, "medium": "social", "campaigns": ["channel_post", "bot"]},
+        "google": {"weight": 10, "medium": "cpc", "campaigns": ["brand", "finance_course"]},
+        "facebook": {"weight": 7, "medium": "cpc", "campaigns": ["lookalike", "retargeting"]},
+        "youtube": {"weight": 3, "medium": "video", "campaigns": ["preroll"]},
+    },
+    "user_agents": {
+        "Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.6099.144 Mobile Safari/537.36": 30,
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1": 15,
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Mobile/15E148 Instagram 312.0.0.32.112": 25,
+        "Mozilla/5.0 (Linux; Android 12; Redmi Note 11) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Version/4.0 Chrome/119.0.6045.193 Mobile Safari/537.36 Telegram-Android/10.5.0": 15,
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36": 15,
+    },
+    "return_visits": {"1": 78, "2": 14, "3": 5, "5": 3},
+    "funnel": {"hero-video": 0.97, "benefits": 0.62, "program": 0.55, "lead-form": 0.45},
+    "clicks": {"free_lesson_click": 0.12, "buy_click": 0.03, "trailer_play": 0.2, "appstore_click": 0.02},
+    "lead_rate": 0.18,
+    "failed_lead_rate": 0.08,
+    "failed_lead_events": {"abandoned": 70, "filled_name_only": 30},
+    "repeat_phone_rate": 0.04,
+    "invalid_number_rate": 0.03,
+    "course_slug": "pulni-boshqarish-sanhati",
+    "page_path": "/",
+    "hours": [1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 8, 8, 9, 9, 8, 8, 8, 9, 10, 12, 13, 12, 8, 4],
+    "weekdays": [10, 10, 10, 10, 9, 8, 8],
+}
+
+FIRST_NAMES = (
+    "Азиз", "Дилноза", "Жасур", "Малика", "Шахзод", "Нилуфар", "Бобур", "Зарина",
+    "Sardor", "Madina", "Jamshid", "Gulnora", "Otabek", "Shahnoza",
+)
+LAST_NAMES = ("Каримов", "Юсупова", "Рахимов", "Тошматова", "Алиев", "Эргашева", "Xolmatov", "Nazarova")
+
+# номера для повторных заявок: держим последние, память постоянная
+RECENT_PHONES = 2000
+
+
+def load_profile(overrides=None):
+    """DEFAULT_PROFILE <- ANALYTICS_SYNTHETIC_PROFILE <- overrides (верхний уровень ключей)."""
+    return {
+        **DEFAULT_PROFILE,
+        **getattr(settings, "ANALYTICS_SYNTHETIC_PROFILE", {}),
+        **(overrides or {}),
+    }
+
+
+class Weighted:
+    """Выбор по весам через накопленные суммы: bisect вместо choices() на каждый вызов."""
+
+    def __init__(self, weights):
+        self.values = list(weights)
+        self.cumulative = list(itertools.accumulate(float(weight) for weight in weights.values()))
+        if not self.values or self.cumulative[-1] <= 0:
+            raise ValueError("нужен хотя бы один положительный вес")
+
+    def pick(self, rng):
+        return self.values[bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+@dataclass
+class Totals:
+    sessions: int = 0
+    page_views: int = 0
+    section_views: int = 0
+    clicks: int = 0
+    leads: int = 0
+    failed_leads: int = 0
+
+    @property
+    def rows(self):
+        return (
+            self.sessions + self.page_views + self.section_views
+            + self.clicks + self.leads + self.failed_leads
+        )
+
+
+class Generator:
+
+    def __init__(self, sessions, days, seed=0, end=None, profile=None):
+        self.total = sessions
+        self.rng = random.Random(seed)
+        self.profile = profile or load_profile()
+        self.end = end or timezone.now()
+        self.start = self.end - datetime.timedelta(days=days)
+        self.weeks = max(1, -(-days // 7))
+        self.day_count = days
+        self.local_tz = timezone.get_current_timezone()
+        self.first_day = timezone.localtime(self.start, self.local_tz).date()
+
+        p = self.profile
+        self.sources = Weighted({name: spec["weight"] for name, spec in p["utm_sources"].items()})
+        self.user_agents = Weighted(p["user_agents"])
+        self.visits = Weighted({int(count): weight for count, weight in p["return_visits"].items()})
+        self.hours = Weighted(dict(enumerate(p["hours"])))
+        self.weekdays = Weighted(dict(enumerate(p["weekdays"])))
+        self.failed_events = Weighted(p["failed_lead_events"])
+        self.funnel = list(p["funnel"].items())
+        self.clicks = list(p["clicks"].items())
+        self.recent_phones = []
+        self.first_leads = {}   # phone_normalized -> (id, created_at) первой заявки
+        self.window = datetime.timedelta(days=getattr(settings, "ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS", 30))
+
+    # ----- время -----
+
+    def session_time(self, index):
+        """Неделя — по доле index/N периода, день недели и час — по весам."""
+        week = min(self.weeks - 1, index * self.weeks // max(self.total, 1))
+        day = week * 7 + (self.weekdays.pick(self.rng) - self.first_day.weekday()) % 7
+        day = min(day, self.day_count - 1)
+        local = datetime.datetime.combine(
+            self.first_day + datetime.timedelta(days=day),
+            datetime.time(self.hours.pick(self.rng), self.rng.randrange(60), self.rng.randrange(60)),
+        )
+        moment = timezone.make_aware(local, self.local_tz)
+        # первый и последний день периода неполные: час вне периода сдвигаем на сутки
+        if moment < self.start:
+            moment += datetime.timedelta(days=1)
+        if moment > self.end:
+            moment -= datetime.timedelta(days=1)
+        return moment
+
+    # ----- строки -----
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def ip(self):
+        rng = self.rng
+        return f"{rng.choice((84, 90, 185, 213, 37))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+    def phone(self):
+        rng = self.rng
+        if self.recent_phones and rng.random() < self.profile["repeat_phone_rate"]:
+            return rng.choice(self.recent_phones)
+        phone = f"+998 {rng.choice((90, 91, 93, 94, 97, 99, 33, 88))} {rng.randrange(100, 1000)}-{rng.randrange(10, 100)}-{rng.randrange(10, 100)}"
+        if len(self.recent_phones) < RECENT_PHONES:
+            self.recent_phones.append(phone)
+        else:
+            slot = rng.randrange(RECENT_PHONES)
+            self.first_leads.pop(normalize_phone(self.recent_phones[slot]), None)
+            self.recent_phones[slot] = phone
+        return phone
+
+    def link_duplicates(self, leads):
+        """
+        duplicate_of — как во вьюхе: первая заявка с тем же номером за
+        ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS. Повторяются только номера из
+        recent_phones, поэтому первые заявки держим в памяти, без запросов к базе.
+        """
+        leads.sort(key=lambda lead: lead["created_at"])
+        for lead in leads:
+            first = self.first_leads.get(lead["phone_normalized"])
+            if first is not None and first[1] <= lead["created_at"] < first[1] + self.window:
+                lead["duplicate_of_id"] = first[0]
+            elif lead["phone_normalized"]:
+                self.first_leads[lead["phone_normalized"]] = (lead["id"], lead["created_at"])
+
+    def session(self, index):
+        rng = self.rng
+        source = self.sources.pick(rng)
+        spec = self.profile["utm_sources"][source]
+        first_visit = self.session_time(index)
+        visits = self.visits.pick(rng)
+        offsets = sorted(rng.uniform(0, 14 * 86400) for _ in range(visits - 1))
+        visit_times = [first_visit] + [first_visit + datetime.timedelta(seconds=s) for s in offsets]
+        visit_times = [moment for moment in visit_times if moment <= self.end] or [first_visit]
+        user_agent = self.user_agents.pick(rng)
+        session = {
+            "id": None,
+            "session_key": str(self.uuid()),
+            "first_visit": first_visit,
+            "last_visit": visit_times[-1],
+            "visit_count": len(visit_times),
+            "user_agent": user_agent,
+            **parse_user_agent(user_agent)._asdict(),
+            "ip_address": self.ip(),
+            "utm_source": source,
+            "utm_medium": spec.get("medium", "") if source else "",
+            "utm_campaign": rng.choice(spec["campaigns"]) if spec.get("campaigns") else "",
+            "utm_content": "",
+            "utm_term": "",
+        }
+        return session, visit_times
+
+    def events(self, session, visit_times, batch):
+        """Просмотры, секции, клики и лиды одной сессии — кортежами в порядке ROW_FIELDS."""
+        rng = self.rng
+        page_path = self.profile["page_path"]
+        session_id = session["id"]
+        reached_end = False
+        for moment in visit_times:
+            batch[PageView].append((session_id, page_path, moment))
+            at = moment
+            depth = 0
+            for section_id, probability in self.funnel:
+                if rng.random() >= probability:
+                    break
+                at += datetime.timedelta(seconds=rng.uniform(2, 40))
+                batch[SectionView].append(
+                    (session_id, page_path, section_id, round(rng.uniform(0.5, 1.0), 2), at)
+                )
+                depth += 1
+            reached_end = reached_end or depth == len(self.funnel)
+            for event_id, probability in self.clicks:
+                if rng.random() < probability:
+                    batch[ClickEvent].append(
+                        (session_id, page_path, event_id, at + datetime.timedelta(seconds=rng.uniform(1, 30)))
+                    )
+        if not reached_end:
+            return
+
+        at = visit_times[-1] + datetime.timedelta(seconds=rng.uniform(60, 300))
+        lead = {
+            "id": self.uuid(),
+            "session_id": session_id,
+            "course_slug": self.profile["course_slug"],
+            "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "created_at": at,
+        }
+        roll = rng.random()
+        if roll < self.profile["lead_rate"]:
+            lead["phone"] = self.phone()
+            lead["is_valid_number"] = rng.random() >= self.profile["invalid_number_rate"]
+            lead["source"] = "free_lesson_popup"
+            lead["duplicate_of_id"] = None
+            batch[FreeLessonLead].append(lead)
+        elif roll < self.profile["lead_rate"] + self.profile["failed_lead_rate"]:
+            lead["event"] = self.failed_events.pick(rng)
+            lead["phone"] = self.phone() if lead["event"] != "filled_name_only" else ""
+            batch[FailedLead].append(lead)
+        else:
+            return
+        lead["phone_normalized"] = normalize_phone(lead["phone"])
+
+    # ----- запись -----
+
+    def run(self, batch_size=5000, progress=None):
+        totals = Totals()
+        for offset in range(0, self.total, batch_size):
+            pairs = [self.session(index) for index in range(offset, min(offset + batch_size, self.total))]
+            sessions = [session for session, _ in pairs]
+            insert_sessions(sessions)
+
+            batch = {model: [] for model in ROW_FIELDS if model is not VisitorSession}
+            for session, visit_times in pairs:
+                self.events(session, visit_times, batch)
+            self.link_duplicates(batch[FreeLessonLead])
+            for model in (FreeLessonLead, FailedLead):
+                batch[model] = [tuple(lead[name] for name in ROW_FIELDS[model]) for lead in batch[model]]
+
+            with transaction.atomic(using=router.db_for_write(PageView)):
+                for model in (PageView, SectionView, ClickEvent):
+                    insert_rows(model, batch[model])
+            with transaction.atomic(using=router.db_for_write(FreeLessonLead)):
+                for model in (FreeLessonLead, FailedLead):
+                    insert_rows(model, batch[model])
+
+            totals.sessions += len(sessions)
+            totals.page_views += len(batch[PageView])
+            totals.section_views += len(batch[SectionView])
+            totals.clicks += len(batch[ClickEvent])
+            totals.leads += len(batch[FreeLessonLead])
+            totals.failed_leads += len(batch[FailedLead])
+            if progress:
+                progress(totals)
+        return totals
+
+
+# ----- вставка событий -----
+# bulk_create на каждой пачке заново компилирует INSERT и готовит каждое
+# значение через поле — на событиях это 2/3 времени генерации. События и лиды
+# пишем одним executemany с подготовленным один раз SQL; значения готовим
+# тем же get_db_prep_save, но только для колонок, которым это нужно.
+
+ROW_FIELDS = {
+    VisitorSession: (
+        "id", "session_key", "first_visit", "last_visit", "visit_count", "user_agent",
+        *USER_AGENT_FIELDS, "ip_address", *UTM_FIELDS,
+    ),
+    PageView: ("session_id", "page_path", "created_at"),
+    SectionView: ("session_id", "page_path", "section_id", "visible_ratio", "created_at"),
+    ClickEvent: ("session_id", "page_path", "event_id", "created_at"),
+    FreeLessonLead: (
+        "id", "session_id", "course_slug", "full_name", "phone", "phone_normalized",
+        "is_valid_number", "source", "duplicate_of_id", "created_at",
+    ),
+    FailedLead: (
+        "id", "session_id", "course_slug", "full_name", "phone", "phone_normalized",
+        "event", "created_at",
+    ),
+}
+
+# строки и числа база принимает как есть
+PLAIN_TYPES = {
+    "CharField", "TextField", "FloatField", "IntegerField", "PositiveIntegerField",
+    "BooleanField", "AutoField", "BigAutoField",
+}
+
+
+def _sqlite_datetime(value):
+    # то же, что DatabaseOperations.adapt_datetimefield_value у SQLite, без проверок на каждое значение
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None).isoformat(" ")
+
+
+def _converter(field, connection):
+    if connection.vendor == "sqlite" and field.get_internal_type() == "DateTimeField":
+        return _sqlite_datetime
+    return functools.partial(field.get_db_prep_save, connection=connection)
+
+
+def insert_rows(model, rows):
+    if not rows:
+        return
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in ROW_FIELDS[model]]
+    # у ForeignKey тип значения — тип поля, на которое он ссылается
+    prepared = [
+        index for index, field in enumerate(fields)
+        if (field.target_field if field.is_relation else field).get_internal_type() not in PLAIN_TYPES
+    ]
+    if prepared:
+        converters = [(index, _converter(fields[index], connection)) for index in prepared]
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for index, convert in converters:
+                row[index] = convert(row[index])
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def insert_sessions(sessions):
+    """
+    Проставляет сессиям id. На SQLite — сами, с MAX(id) + 1: транзакция
+    IMMEDIATE (профиль SQLite в settings) держит лок на запись с BEGIN, так что
+    id никто не займёт. Иначе — bulk_create с возвратом pk.
+    """
+    alias = router.db_for_write(VisitorSession)
+    with transaction.atomic(using=alias):
+        if connections[alias].vendor == "sqlite":
+            next_id = (VisitorSession.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+            for offset, session in enumerate(sessions):
+                session["id"] = next_id + offset
+            fields = ROW_FIELDS[VisitorSession]
+            insert_rows(VisitorSession, [tuple(session[name] for name in fields) for session in sessions])
+            return
+        with keep_timestamps(VisitorSession):
+            created = VisitorSession.objects.bulk_create(
+                [VisitorSession(**{k: v for k, v in session.items() if k != "id"}) for session in sessions]
+            )
+        for session, instance in zip(sessions, created):
+            session["id"] = instance.pk
+
+
+# ----- отложенные индексы -----
+
+def _table_indexes(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+            [table],
+        )
+        return cursor.fetchall()
+
+
+@contextmanager
+def defer_indexes(log=None):
+    """
+    Снимает неуникальные индексы GENERATED_MODELS (уникальные — sqlite_autoindex
+    без sql — остаются, на них держится session_key) и триггеры FTS, в конце
+    создаёт их заново тем же SQL и пересобирает поисковый индекс. Только SQLite.
+    """
+    dropped = []   # (alias, sql)
+    search_aliases = set()
+    for model in GENERATED_MODELS:
+        alias = router.db_for_write(model)
+        connection = connections[alias]
+        if connection.vendor != "sqlite":
+            raise ValueError("defer_indexes работает только с SQLite")
+        if model in search.SEARCH_INDEXES and search.SEARCH_INDEXES[model].table in connection.introspection.table_names():
+            search_aliases.add(alias)
+        for name, sql in _table_indexes(connection, model._meta.db_table):
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            dropped.append((alias, sql))
+    for alias in search_aliases:
+        search.drop(connections[alias])
+    if log:
+        log(f"Индексов снято: {len(dropped)}, поиск FTS отключён: {', '.join(sorted(search_aliases)) or 'нет'}")
+    try:
+        yield
+    finally:
+        for alias, sql in dropped:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(sql)
+        for alias in search_aliases:
+            search.create(connections[alias])
+            search.rebuild(alias)
+        if log:
+            log("Индексы восстановлены")
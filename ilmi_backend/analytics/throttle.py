@@ -0,0 +1,312 @@
+"""
+Дешёвая защита /api/track/* и /api/leads/* от флуда и ботов.
+
+Эндпоинты открыты для любых origin (CORS_ALLOW_ALL_ORIGINS) и без CSRF,
+а каждая запись — транзакция SQLite. ThrottleMiddleware стоит до вьюх и
+отсекает мусор, не трогая базу:
+
+1. User-Agent ботов и скриптов (классификатор с lru_cache) — 403
+2. token bucket на IP (тот же IP, что пишем в сессию: utils.client_ip),
+   для лидов — отдельный, строже — 429 + Retry-After
+3. размер тела (ANALYTICS_MAX_PAYLOAD_BYTES) — 413
+4. форма JSON: объект, не больше ANALYTICS_MAX_PAYLOAD_KEYS ключей,
+   вложенность до ANALYTICS_MAX_PAYLOAD_DEPTH, session_id — строка
+   до 64 символов — 400
+5. token bucket на session_id — 429
+
+Разобранный JSON остаётся на запросе (request.analytics_json), вьюхи
+второй раз его не парсят. Бакеты живут в памяти воркера (LRU, не больше
+ANALYTICS_THROTTLE_CACHE_SIZE ключей), лимиты — на воркер, а не на сервер.
+
+Счётчики (stats()) — по воркеру, для подбора порогов:
+GET /api/throttle/stats/ (только staff).
+"""
+import functools
+import json
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.http import JsonResponse
+
+from .utils import client_ip
+
+
+PROTECTED_PREFIXES = ("/api/track/", "/api/leads/")
+LEAD_PREFIX = "/api/leads/"
+
+SESSION_KEY_MAX_LENGTH = 64  # VisitorSession.session_key
+
+# (запросов в секунду, запас на всплеск)
+DEFAULT_RATES = {
+    "ip": (5, 60),
+    "lead_ip": (0.05, 5),
+    "session": (2, 30),
+}
+
+BOT_UA_RE = re.compile(
+    r"bot/|\bbot\b|crawl|spider|slurp|scrap|externalhit|headless|phantomjs|puppeteer"
+    r"|playwright|selenium|curl/|wget/|httpie|python-requests|python-urllib|aiohttp|httpx"
+    r"|go-http-client|java/|libwww|axios/|node-fetch|postman|insomnia|^mozilla/[0-4]\.0$",
+    re.IGNORECASE,
+)
+
+
+def enabled():
+    return getattr(settings, "ANALYTICS_THROTTLE_ENABLED", True)
+
+
+def rates():
+    return {**DEFAULT_RATES, **getattr(settings, "ANALYTICS_THROTTLE_RATES", {})}
+
+
+# ----- token bucket -----
+
+class TokenBuckets:
+    """
+    Бакет на ключ: rate токенов в секунду, не больше burst.
+    Храним только (токены, время) в OrderedDict — самые давние ключи
+    вытесняются (LRU), память ограничена max_size.
+    """
+
+    def __init__(self, rate, burst, max_size):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def take(self, key, now=None):
+        """0, если запрос пропускаем, иначе через сколько секунд появится токен."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._data.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._data[key] = (tokens, now)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evicted += 1
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ----- боты -----
+
+@functools.lru_cache(maxsize=4096)
+def classify_user_agent(user_agent):
+    """None — похож на браузер, иначе причина отказа."""
+    user_agent = user_agent.strip()
+    if not user_agent:
+        return "empty-user-agent"
+    if BOT_UA_RE.search(user_agent):
+        return "bot-user-agent"
+    return None
+
+
+# ----- форма payload -----
+
+class BadPayload(Exception):
+    pass
+
+
+def _depth(value, limit, level=1):
+    if level > limit:
+        return False
+    if isinstance(value, dict):
+        return all(_depth(item, limit, level + 1) for item in value.values())
+    if isinstance(value, list):
+        return all(_depth(item, limit, level + 1) for item in value)
+    return True
+
+
+def check_payload(body):
+    """Разбирает и проверяет тело запроса, возвращает dict или BadPayload."""
+    if len(body) > getattr(settings, "ANALYTICS_MAX_PAYLOAD_BYTES", 64 * 1024):
+        raise BadPayload("payload-too-large")
+    try:
+        data = json.loads(body.decode("utf-8")) if body else {}
+    except (UnicodeDecodeError, ValueError):
+        raise BadPayload("invalid-json")
+    if not isinstance(data, dict):
+        raise BadPayload("not-an-object")
+    if len(data) > getattr(settings, "ANALYTICS_MAX_PAYLOAD_KEYS", 32):
+        raise BadPayload("too-many-keys")
+    if not _depth(data, getattr(settings, "ANALYTICS_MAX_PAYLOAD_DEPTH", 6)):
+        raise BadPayload("too-deep")
+    session_id = data.get("session_id")
+    if session_id is not None and (
+        not isinstance(session_id, str) or len(session_id) > SESSION_KEY_MAX_LENGTH
+    ):
+        raise BadPayload("bad-session-id")
+    return data
+
+
+# ----- состояние воркера -----
+
+class Throttle:
+
+    def __init__(self):
+        max_size = getattr(settings, "ANALYTICS_THROTTLE_CACHE_SIZE", 50_000)
+        self.buckets = {
+            name: TokenBuckets(rate, burst, max_size) for name, (rate, burst) in rates().items()
+        }
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        ua_cache = classify_user_agent.cache_info()
+        return {
+            "counters": counters,
+            "buckets": {
+                name: {
+                    "rate": bucket.rate,
+                    "burst": bucket.burst,
+                    "keys": len(bucket),
+                    "evicted": bucket.evicted,
+                }
+                for name, bucket in self.buckets.items()
+            },
+            "user_agent_cache": {
+                "hits": ua_cache.hits,
+                "misses": ua_cache.misses,
+                "size": ua_cache.currsize,
+            },
+        }
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_throttle():
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                _throttle = Throttle()
+    return _throttle
+
+
+def reset():
+    """Новые бакеты и счётчики (после смены настроек, в тестах)."""
+    global _throttle
+    with _throttle_lock:
+        _throttle = None
+    classify_user_agent.cache_clear()
+
+
+def stats():
+    return get_throttle().stats()
+
+
+# ----- middleware -----
+
+def _reject(status, reason, retry_after=None):
+    response = JsonResponse({"success": False, "error": reason}, status=status)
+    if retry_after:
+        response["Retry-After"] = str(max(1, round(retry_after)))
+    return response
+
+
+class ThrottleMiddleware:
+    """
+    Ставится после CorsMiddleware (отказы тоже получают CORS-заголовки),
+    но до CSRF и вьюх. Отключается ANALYTICS_THROTTLE_ENABLED = False.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.precheck(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # проверки — только память и уже прочитанное тело, базы нет: прямо в event loop
+        response = self.precheck(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def precheck(self, request):
+        if (
+            request.method == "POST"
+            and request.path_info.startswith(PROTECTED_PREFIXES)
+            and enabled()
+        ):
+            return self.check(request, get_throttle())
+        return None
+
+    def check(self, request, throttle):
+        reason = classify_user_agent(request.META.get("HTTP_USER_AGENT", ""))
+        if reason:
+            throttle.count(reason)
+            return _reject(403, reason)
+
+        ip = client_ip(request) or ""
+        bucket = "lead_ip" if request.path_info.startswith(LEAD_PREFIX) else "ip"
+        wait = throttle.buckets[bucket].take(ip)
+        if wait:
+            throttle.count(f"rate-limited-{bucket}")
+            return _reject(429, "rate-limited", wait)
+
+        # до чтения тела: честный Content-Length сразу отсекает большие запросы
+        try:
+            declared = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            declared = 0
+        if declared > getattr(settings, "ANALYTICS_MAX_PAYLOAD_BYTES", 64 * 1024):
+            throttle.count("payload-too-large")
+            return _reject(413, "payload-too-large")
+
+        try:
+            data = check_payload(request.body)
+        except RequestDataTooBig:
+            throttle.count("payload-too-large")
+            return _reject(413, "payload-too-large")
+        except BadPayload as exc:
+            reason = str(exc)
+            throttle.count(reason)
+            return _reject(413 if reason == "payload-too-large" else 400, reason)
+
+        session_id = data.get("session_id")
+        if session_id:
+            wait = throttle.buckets["session"].take(session_id)
+            if wait:
+                throttle.count("rate-limited-session")
+                return _reject(429, "rate-limited", wait)
+
+        request.analytics_json = data
+        throttle.count("accepted")
+        return None
@@ -1,37 +1,67 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+
+def tracking_patterns(module):
+    """Трекинг и лиды: sync-вьюхи (WSGI) или их async-версии (ASGI), см. ANALYTICS_ASYNC_VIEWS."""
+    return [
+        path(
+            "api/track/register-session/",
+            module.api_register_session,
+            name="api_register_session",
+        ),
+
+        path(
+            "api/track/page-view/",
+            module.api_page_view,
+            name="api_page_view",
+        ),
+        path(
+            "api/track/section-view/",
+            module.api_section_view,
+            name="api_section_view",
+        ),
+        path(
+            "api/track/event/",
+            module.api_click_event,
+            name="api_click_event",
+        ),
+        path(
+            "api/track/batch/",
+            module.api_batch,
+            name="api_batch",
+        ),
+
+        path(
+            "api/leads/free-lesson/",
+            module.api_free_lesson_lead,
+            name="api_free_lesson_lead",
+        ),
+        path(
+            "api/leads/failed/",
+            module.api_failed_lead,
+            name="api_failed_lead",
+        ),
+    ]
+
 
 urlpatterns = [
-    path(
-        "api/track/register-session/",
-        views.api_register_session,
-        name="api_register_session",
-    ),
+    *tracking_patterns(async_views if getattr(settings, "ANALYTICS_ASYNC_VIEWS", False) else views),
 
     path(
-        "api/track/page-view/",
-        views.api_page_view,
-        name="api_page_view",
-    ),
-    path(
-        "api/track/section-view/",
-        views.api_section_view,
-        name="api_section_view",
+        "api/reports/funnel/",
+        views.api_funnel_report,
+        name="api_funnel_report",
     ),
     path(
-        "api/track/event/",
-        views.api_click_event,
-        name="api_click_event",
-    ),
-
-    path(
-        "api/leads/free-lesson/",
-        views.api_free_lesson_lead,
-        name="api_free_lesson_lead",
+        "api/throttle/stats/",
+        views.api_throttle_stats,
+        name="api_throttle_stats",
     ),
     path(
-        "api/leads/failed/",
-        views.api_failed_lead,
-        name="api_failed_lead",
+        "api/export/<str:model_name>/",
+        views.export_view,
+        name="export",
     ),
 ]
@@ -0,0 +1,96 @@
+"""
+Разбор User-Agent сессии в категории: устройство, ОС, браузер, in-app браузер.
+
+Сырой user_agent годится только для LIKE-поиска, а разбивки «мобильные
+против десктопа» или «Instagram / Telegram in-app» нужны отчётам и фильтрам.
+Поэтому разбираем UA один раз — в VisitorSession.objects.upsert() (им пишут
+и вьюхи, и write-behind буфер) — и храним результат в индексированных
+колонках сессии (USER_AGENT_FIELDS). Старые сессии дозаполняет
+manage.py backfill_user_agents.
+
+Разных UA намного меньше, чем хитов, так что разбор закэширован (lru_cache):
+на горячем пути это поиск в словаре.
+
+Значения — короткие слаги; "" — UA пустой, "other" — не распознали.
+browser_family — движок/бренд браузера (во in-app на iOS это WebKit,
+то есть safari), само приложение — в in_app_browser.
+"""
+import functools
+import re
+from typing import NamedTuple
+
+
+OTHER = "other"
+
+# порядок важен: первое совпадение выигрывает
+IN_APP_RULES = (
+    ("instagram", re.compile(r"Instagram", re.IGNORECASE)),
+    ("facebook", re.compile(r"FBAN|FBAV|FB_IAB|FBIOS", re.IGNORECASE)),
+    ("telegram", re.compile(r"Telegram", re.IGNORECASE)),
+    ("tiktok", re.compile(r"TikTok|musical_ly|BytedanceWebview", re.IGNORECASE)),
+    ("snapchat", re.compile(r"Snapchat", re.IGNORECASE)),
+    ("line", re.compile(r"\bLine/", re.IGNORECASE)),
+    ("webview", re.compile(r"; wv\)")),
+)
+
+OS_RULES = (
+    ("ios", re.compile(r"iPhone|iPad|iPod", re.IGNORECASE)),
+    ("android", re.compile(r"Android", re.IGNORECASE)),
+    ("windows", re.compile(r"Windows", re.IGNORECASE)),
+    ("chromeos", re.compile(r"CrOS")),
+    ("macos", re.compile(r"Macintosh|Mac OS X", re.IGNORECASE)),
+    ("linux", re.compile(r"Linux|X11", re.IGNORECASE)),
+)
+
+BROWSER_RULES = (
+    ("edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("opera", re.compile(r"OPR/|Opera|OPX/")),
+    ("yandex", re.compile(r"YaBrowser/")),
+    ("samsung", re.compile(r"SamsungBrowser/")),
+    ("firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("chrome", re.compile(r"Chrome/|CriOS/")),
+    ("safari", re.compile(r"Safari/|AppleWebKit/")),
+)
+
+TABLET_RE = re.compile(r"iPad|Tablet", re.IGNORECASE)
+MOBILE_RE = re.compile(r"Mobi|iPhone|iPod|Android", re.IGNORECASE)
+DESKTOP_OS = {"windows", "macos", "linux", "chromeos"}
+
+
+class UserAgent(NamedTuple):
+    device_type: str = ""
+    os_family: str = ""
+    browser_family: str = ""
+    in_app_browser: str = ""
+
+
+def _first(rules, user_agent, default=OTHER):
+    for name, pattern in rules:
+        if pattern.search(user_agent):
+            return name
+    return default
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_user_agent(user_agent):
+    """UserAgent с категориями; для пустой строки — все поля пустые."""
+    user_agent = (user_agent or "").strip()
+    if not user_agent:
+        return UserAgent()
+
+    os_family = _first(OS_RULES, user_agent)
+    if TABLET_RE.search(user_agent) or (os_family == "android" and "Mobile" not in user_agent):
+        device_type = "tablet"
+    elif MOBILE_RE.search(user_agent):
+        device_type = "mobile"
+    elif os_family in DESKTOP_OS:
+        device_type = "desktop"
+    else:
+        device_type = OTHER
+
+    return UserAgent(
+        device_type=device_type,
+        os_family=os_family,
+        browser_family=_first(BROWSER_RULES, user_agent),
+        in_app_browser=_first(IN_APP_RULES, user_agent, default=""),
+    )
@@ -0,0 +1,30 @@
+from contextlib import contextmanager
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """
+    Отключает auto_now / auto_now_add у моделей на время блока,
+    чтобы bulk_create сохранил заранее выставленные created_at и т.п.
+    Нужно для восстановления архива и генерации данных, только в командах.
+    """
+    patched = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                patched.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in patched:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def client_ip(request):
+    # Если будешь за nginx — лучше смотреть HTTP_X_FORWARDED_FOR
+    xff = request.META.get("HTTP_X_FORWARDED_FOR")
+    if xff:
+        return xff.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR")
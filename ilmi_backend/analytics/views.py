@@ -1,9 +1,14 @@
+import datetime
 import json
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 
 from .models import (
+    UTM_FIELDS,
     VisitorSession,
     PageView,
     SectionView,
@@ -11,11 +16,26 @@ from .models import (
     FreeLessonLead,
     FailedLead,
 )
+from . import buffer, exports, reports, session_cache, throttle
+from .phones import normalize_phone
+from .utils import client_ip
+from .ingest import (
+    PAGE_VIEW,
+    SECTION_VIEW,
+    CLICK_EVENT,
+    InvalidEvent,
+    build_event,
+    bulk_write,
+    max_batch_size,
+)
 
 
 # ===== UTILS =====
 
 def get_json(request):
+    # уже разобран и проверен в ThrottleMiddleware
+    if hasattr(request, "analytics_json"):
+        return request.analytics_json
     try:
         return json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -23,41 +43,167 @@ def get_json(request):
         return {}
 
 
-def get_session(session_key: str, *, increment_visit: bool = False):
+def get_session(session_key: str, *, increment_visit: bool = False, **fields):
     """
-    Создаёт или обновляет VisitorSession.
+    Создаёт или обновляет VisitorSession одним upsert-запросом.
 
     visit_count увеличиваем ТОЛЬКО там, где это реально визит:
     - register_session
     - page_view
+
+    Остальные поля (user_agent, ip_address, utm) пробрасываются
+    в VisitorSession.objects.upsert, чтобы не делать отдельный save().
     """
     if not session_key:
         return None
 
-    session, created = VisitorSession.objects.get_or_create(
-        session_key=session_key,
-        defaults={"visit_count": 1}
+    session = VisitorSession.objects.upsert(
+        session_key,
+        increment_visit=increment_visit,
+        **fields,
     )
+    session_cache.remember(session)
+    return session
 
-    # Увеличиваем счётчик посещений только при нужных вызовах
-    if not created and increment_visit:
-        session.visit_count += 1
 
-    # last_visit обновляем при любом обращении
-    update_fields = ["last_visit"]
-    if created or increment_visit:
-        update_fields.append("visit_count")
+def create_for_session(model, session_key: str, **fields):
+    """
+    Создаёт строку события, зная только pk сессии (через session_cache).
+    """
+    pk = session_cache.session_pk(session_key)
+    if pk is None:
+        return None
+    return model.objects.create(session_id=pk, **fields)
+
+
+def _queued(session_id, objects=(), **session_fields):
+    """
+    Write-behind: кладём запись в буфер и отвечаем 202 не дожидаясь базы.
+    """
+    if session_id:
+        buffer.submit(session_id, objects, **session_fields)
+    return queued_response()
+
+
+def queued_response():
+    return JsonResponse({"success": True, "queued": True}, status=202)
+
+
+def _invalid(exc):
+    return JsonResponse({"success": False, "error": str(exc)}, status=400)
+
+
+# ===== PAYLOAD -> ПОЛЯ =====
+# Разбор запроса и ответы — общие с async-версиями (async_views.py),
+# там остаются только обращения к базе.
+
+def register_session_fields(request, data):
+    return dict(
+        increment_visit=True,
+        user_agent=data.get("user_agent", ""),
+        replace_user_agent=True,
+        ip_address=client_ip(request),
+        utm={name: data.get(name, "") for name in UTM_FIELDS},
+    )
+
+
+def page_view_fields(data):
+    """(page_path, поля сессии) для page-view."""
+    return data.get("page_path", "/"), dict(increment_visit=True, user_agent=data.get("user_agent", ""))
+
+
+def section_view_fields(data):
+    return dict(
+        page_path=data.get("page_path", "/"),
+        section_id=data.get("section_id", ""),
+        visible_ratio=data.get("visible_ratio"),
+    )
+
+
+def click_event_fields(data):
+    return dict(
+        page_path=data.get("page_path", "/"),
+        event_id=data.get("event_id", ""),
+        meta=data.get("meta") or {},  # всегда dict, а не None
+    )
+
+
+def buffered_event(data, kind):
+    """([событие], None) для буфера или (None, ответ 400), если build_event его не принял."""
+    try:
+        return [build_event(None, {**data, "type": kind})], None
+    except InvalidEvent as exc:
+        return None, _invalid(exc)
+
+
+def batch_error(session_id, events):
+    """Ответ 400 для api_batch или None, если пачку можно принимать."""
+    if not session_id or not isinstance(events, list):
+        return JsonResponse(
+            {"success": False, "error": "session_id и events обязательны"},
+            status=400,
+        )
+    if len(events) > max_batch_size():
+        return JsonResponse(
+            {"success": False, "error": f"не больше {max_batch_size()} событий за раз"},
+            status=400,
+        )
+    return None
+
+
+def batch_session_fields(events):
+    """Визит — если в пачке есть page_view; user_agent — из первого такого."""
+    page_views = [
+        item for item in events
+        if isinstance(item, dict) and item.get("type") == PAGE_VIEW
+    ]
+    user_agent = next(
+        (item["user_agent"] for item in page_views if isinstance(item.get("user_agent"), str)),
+        "",
+    )
+    return dict(increment_visit=bool(page_views), user_agent=user_agent)
+
+
+def build_batch(session, events):
+    """(объекты для записи, статус по каждому элементу в том же порядке)."""
+    objects = []
+    results = []
+    for item in events:
+        try:
+            objects.append(build_event(session, item))
+        except InvalidEvent as exc:
+            results.append({"accepted": False, "error": str(exc)})
+        else:
+            results.append({"accepted": True})
+    return objects, results
+
+
+def batch_response(results, queued=False):
+    if queued:
+        return JsonResponse({"success": True, "queued": True, "results": results}, status=202)
+    return JsonResponse({"success": True, "results": results})
+
+
+def lead_fields(data):
+    return dict(
+        course_slug=data.get("course_slug", "unknown"),
+        full_name=(data.get("full_name") or "").strip(),
+        phone=(data.get("phone") or "").strip(),
+        is_valid_number=data.get("is_valid_number", True),
+    )
 
-    session.save(update_fields=update_fields)
-    return session
 
+def lead_response(lead):
+    return JsonResponse({"success": True, "id": str(lead.id), "duplicate": lead.duplicate_of_id is not None})
 
-def _get_ip(request):
-    # Если будешь за nginx — лучше смотреть HTTP_X_FORWARDED_FOR
-    xff = request.META.get("HTTP_X_FORWARDED_FOR")
-    if xff:
-        return xff.split(",")[0].strip()
-    return request.META.get("REMOTE_ADDR")
+
+def failed_lead_fields(data):
+    return dict(
+        course_slug=data.get("course_slug", "unknown"),
+        full_name=(data.get("full_name") or "").strip(),
+        phone=(data.get("phone") or "").strip(),
+        event=data.get("event", "unknown"),
+    )
 
 
 # ===== API: REGISTRATION OF SESSION =====
@@ -78,30 +224,12 @@ def api_register_session(request):
     """
     data = get_json(request)
     session_id = data.get("session_id")
-    user_agent = data.get("user_agent", "")
-    ip = _get_ip(request)
+    session_fields = register_session_fields(request, data)
 
-    session = get_session(session_id, increment_visit=True)
-    if session:
-        session.user_agent = user_agent
-        session.ip_address = ip
-        session.utm_source = data.get("utm_source", "") or session.utm_source
-        session.utm_medium = data.get("utm_medium", "") or session.utm_medium
-        session.utm_campaign = data.get("utm_campaign", "") or session.utm_campaign
-        session.utm_content = data.get("utm_content", "") or session.utm_content
-        session.utm_term = data.get("utm_term", "") or session.utm_term
-        session.save(
-            update_fields=[
-                "user_agent",
-                "ip_address",
-                "utm_source",
-                "utm_medium",
-                "utm_campaign",
-                "utm_content",
-                "utm_term",
-                "last_visit",
-            ]
-        )
+    if buffer.enabled():
+        return _queued(session_id, **session_fields)
+
+    get_session(session_id, **session_fields)
 
     return JsonResponse({"success": True})
 
@@ -120,15 +248,14 @@ def api_page_view(request):
     """
     data = get_json(request)
     session_id = data.get("session_id")
-    page = data.get("page_path", "/")
-    user_agent = data.get("user_agent", "")
+    page, session_fields = page_view_fields(data)
 
-    session = get_session(session_id, increment_visit=True)
-    if session:
-        if user_agent and not session.user_agent:
-            session.user_agent = user_agent
-            session.save(update_fields=["user_agent", "last_visit"])
+    if buffer.enabled():
+        objects, error = buffered_event(data, PAGE_VIEW)
+        return error or _queued(session_id, objects, **session_fields)
 
+    session = get_session(session_id, **session_fields)
+    if session:
         PageView.objects.create(session=session, page_path=page)
 
     return JsonResponse({"success": True})
@@ -149,15 +276,12 @@ def api_section_view(request):
     """
     data = get_json(request)
     session_id = data.get("session_id")
-    session = get_session(session_id, increment_visit=False)
 
-    if session:
-        SectionView.objects.create(
-            session=session,
-            page_path=data.get("page_path", "/"),
-            section_id=data.get("section_id", ""),
-            visible_ratio=data.get("visible_ratio"),
-        )
+    if buffer.enabled():
+        objects, error = buffered_event(data, SECTION_VIEW)
+        return error or _queued(session_id, objects)
+
+    create_for_session(SectionView, session_id, **section_view_fields(data))
 
     return JsonResponse({"success": True})
 
@@ -177,19 +301,58 @@ def api_click_event(request):
     """
     data = get_json(request)
     session_id = data.get("session_id")
-    session = get_session(session_id, increment_visit=False)
 
-    if session:
-        ClickEvent.objects.create(
-            session=session,
-            page_path=data.get("page_path", "/"),
-            event_id=data.get("event_id", ""),
-            meta=data.get("meta") or {},  # всегда dict, а не None
-        )
+    if buffer.enabled():
+        objects, error = buffered_event(data, CLICK_EVENT)
+        return error or _queued(session_id, objects)
+
+    create_for_session(ClickEvent, session_id, **click_event_fields(data))
 
     return JsonResponse({"success": True})
 
 
+# ===== API: BATCH =====
+
+@csrf_exempt
+@require_POST
+def api_batch(request):
+    """
+    Пачка событий одной сессии за один запрос.
+
+    Фронт: safeFetch(`${ANALYTICS_BASE}/batch/`, {
+        session_id,
+        events: [
+            {type: "page_view", page_path, user_agent},
+            {type: "section_view", page_path, section_id, visible_ratio},
+            {type: "event", page_path, event_id, meta: {...}}
+        ]
+    })
+
+    Сессию ищем один раз, каждую модель пишем одним bulk_create.
+    В ответе статус по каждому элементу в том же порядке:
+    {"success": true, "results": [{"accepted": true}, {"accepted": false, "error": "..."}]}
+    """
+    data = get_json(request)
+    session_id = data.get("session_id")
+    events = data.get("events")
+
+    error = batch_error(session_id, events)
+    if error:
+        return error
+
+    session_fields = batch_session_fields(events)
+    session = None if buffer.enabled() else get_session(session_id, **session_fields)
+    objects, results = build_batch(session, events)
+
+    if buffer.enabled():
+        buffer.submit(session_id, objects, **session_fields)
+        return batch_response(results, queued=True)
+
+    bulk_write(objects)
+
+    return batch_response(results)
+
+
 # ===== API: FREE LESSON LEAD =====
 
 @csrf_exempt
@@ -210,15 +373,13 @@ def api_free_lesson_lead(request):
     if data.get("session_id"):
         session = get_session(data["session_id"], increment_visit=False)
 
-    lead = FreeLessonLead.objects.create(
-        session=session,
-        course_slug=data.get("course_slug", "unknown"),
-        full_name=(data.get("full_name") or "").strip(),
-        phone=(data.get("phone") or "").strip(),
-        is_valid_number=data.get("is_valid_number", True),
-    )
+    fields = lead_fields(data)
+    # повторная заявка с тем же номером в любом формате — одна выборка по индексу
+    original_id = FreeLessonLead.objects.original_id_for(normalize_phone(fields["phone"]))
 
-    return JsonResponse({"success": True, "id": str(lead.id)})
+    lead = FreeLessonLead.objects.create(session=session, duplicate_of_id=original_id, **fields)
+
+    return lead_response(lead)
 
 
 # ===== API: FAILED LEAD =====
@@ -235,12 +396,66 @@ def api_failed_lead(request):
     if data.get("session_id"):
         session = get_session(data["session_id"], increment_visit=False)
 
-    FailedLead.objects.create(
-        session=session,
-        course_slug=data.get("course_slug", "unknown"),
-        full_name=(data.get("full_name") or "").strip(),
-        phone=(data.get("phone") or "").strip(),
-        event=data.get("event", "unknown"),
-    )
+    FailedLead.objects.create(session=session, **failed_lead_fields(data))
 
     return JsonResponse({"success": True})
+
+
+# ===== REPORTS: FUNNEL =====
+
+@staff_member_required
+@require_GET
+def api_funnel_report(request):
+    """
+    Воронка лендинга (только для staff):
+    GET /api/reports/funnel/?from=2025-11-01&to=2025-11-30&utm_source=instagram
+
+    from / to — дни включительно, по умолчанию последние 7 дней.
+    utm_* — необязательные фильтры по сессии.
+    """
+    today = timezone.localdate()
+    date_to = parse_date(request.GET.get("to", "")) or today
+    date_from = parse_date(request.GET.get("from", "")) or date_to - datetime.timedelta(days=6)
+    if date_from > date_to:
+        return JsonResponse({"success": False, "error": "from позже to"}, status=400)
+
+    utm = {name: request.GET[name] for name in UTM_FIELDS if request.GET.get(name)}
+    report = reports.funnel_report(date_from, date_to, utm)
+    return JsonResponse({"success": True, "report": report})
+
+
+# ===== EXPORT =====
+
+@staff_member_required
+@require_GET
+def export_view(request, model_name):
+    """
+    Потоковая выгрузка (только для staff):
+    GET /api/export/freelessonlead/?format=csv&from=2025-11-01&to=2025-11-30
+        &columns=created_at,full_name,phone,utm_source
+
+    columns — через запятую, по умолчанию все (см. analytics/exports.py).
+    """
+    try:
+        model = exports.get_model(model_name)
+        columns = exports.parse_columns(request.GET.get("columns"))
+        queryset = exports.filter_dates(
+            model.objects.order_by("created_at"),
+            parse_date(request.GET.get("from", "")),
+            parse_date(request.GET.get("to", "")),
+        )
+        return exports.streaming_response(queryset, columns, request.GET.get("format", "csv"))
+    except exports.ExportError as exc:
+        return JsonResponse({"success": False, "error": str(exc)}, status=400)
+
+
+# ===== THROTTLE =====
+
+@staff_member_required
+@require_GET
+def api_throttle_stats(request):
+    """
+    Счётчики ThrottleMiddleware этого воркера (только для staff):
+    сколько пропущено / отсечено и по какой причине, заполненность бакетов.
+    """
+    return JsonResponse({"success": True, "stats": throttle.stats()})
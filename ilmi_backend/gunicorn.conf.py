@@ -0,0 +1,29 @@
+"""
+Конфиг gunicorn.
+
+Запуск из /opt/kurs/ilmi_backend:
+    gunicorn ilmi_backend.wsgi:application -c gunicorn.conf.py
+
+ASGI — трекинг и лиды через async-вьюхи (analytics/async_views.py):
+    gunicorn ilmi_backend.asgi:application -c gunicorn.conf.py \\
+        -k uvicorn_worker.UvicornWorker -w 2 --keep-alive 75 --backlog 4096
+
+- asgi.py сам включает ILMI_ASGI: async-вьюхи и CONN_MAX_AGE = 0
+- воркер — один процесс с event loop: медленные клиенты и keep-alive
+  соединения стоят корутину, а не поток, так что тысячи открытых соединений
+  трекинга держит один воркер; -w — по ядрам, не по числу соединений
+- в базу async ORM ходит из потока на запрос (asgiref), писатель SQLite
+  всё равно один, очередь на лок — через busy_timeout, как и под WSGI
+- --keep-alive дольше интервала отправки событий со страницы, чтобы
+  браузер не переоткрывал соединение; --backlog — под всплески
+- тот же worker_exit ниже дописывает write-behind буфер
+- сравнить с sync-путём: python manage.py bench_ingest --asgi (см. analytics/bench.py)
+"""
+
+
+def worker_exit(server, worker):
+    # перед остановкой воркера дописываем write-behind буфер аналитики,
+    # чтобы рестарт gunicorn ничего не терял
+    from analytics import buffer
+
+    buffer.drain()
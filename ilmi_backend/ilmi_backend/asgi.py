@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ilmi_backend.settings')
+# async-вьюхи трекинга и CONN_MAX_AGE = 0 (см. settings.ASGI_MODE)
+os.environ.setdefault('ILMI_ASGI', '1')
 
 application = get_asgi_application()
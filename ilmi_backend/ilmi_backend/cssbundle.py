@@ -0,0 +1,429 @@
+"""
+Сборка CSS лендинга: один минифицированный бандл + критический CSS.
+
+Исходники — CSS_BUNDLE_SOURCES (по порядку подключения), результат —
+static/build/css/ (в git не лежит, collectstatic забирает его вместе
+с остальной статикой):
+
+    css/manifest.json
+    css/bundle.3f9a0c1b2d4e.css     все исходники подряд, минифицированы
+    css/critical.3f9a0c1b2d4e.css   правила для первого экрана
+
+Критический CSS — правила, селекторы которых целиком покрываются
+разметкой секций CSS_CRITICAL_SECTIONS из index.html (и их предков:
+.page-wrapper, body, :root), плюс @font-face и @keyframes, на которые
+они ссылаются. Он инлайнится в <head>, бандл грузится без блокировки
+отрисовки ({% css_bundle %} из templatetags/bundles.py). Если шрифты
+собраны (build_fonts), src у @font-face указывает на подмножества WOFF2.
+
+Хэш в имени — от содержимого исходников, шаблона, настроек и манифеста шрифтов: если он
+не изменился и файлы на месте, сборка ничего не делает. Результат
+детерминирован (без дат и случайных значений).
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from . import fonts
+from .images import build_root, source_root, static_name
+
+
+PREFIX = "css"
+MANIFEST_NAME = "manifest.json"
+
+# меняется при изменении алгоритма — пересобираем всё
+BUILDER_VERSION = 1
+
+TEMPLATE_NAME = "index.html"
+
+# селекторы, которые относятся ко всему документу
+DOCUMENT_TAGS = {"html", "body"}
+
+# @-правила, внутри которых обычные правила (остальные копируются как есть)
+GROUPING_AT_RULES = ("@media", "@supports", "@layer", "@container")
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+
+
+def sources():
+    return list(getattr(settings, "CSS_BUNDLE_SOURCES", ()))
+
+
+def critical_sections():
+    return list(getattr(settings, "CSS_CRITICAL_SECTIONS", ()))
+
+
+def manifest_path():
+    return build_root() / PREFIX / MANIFEST_NAME
+
+
+# ----- разбор CSS -----
+
+STRING_OR_COMMENT_RE = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?\*/", re.S)
+URL_RE = re.compile(r"url\(\s*([\"']?)(.*?)\1\s*\)", re.S)
+
+
+def strip_comments(css):
+    return STRING_OR_COMMENT_RE.sub(lambda match: match.group(1) or "", css)
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == "\\" else 1
+    return i + 1
+
+
+def _block_end(css, i):
+    """Индекс парной '}' для '{' на позиции i."""
+    depth = 0
+    while i < len(css):
+        char = css[i]
+        if char in "\"'":
+            i = _skip_string(css, i)
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(css)
+
+
+def parse(css):
+    """
+    CSS без комментариев -> список узлов:
+    ("rule", prelude, body) — правило или @-правило с телом как есть,
+    ("group", prelude, [узлы]) — @media / @supports,
+    ("statement", text, None) — @import / @charset.
+    """
+    nodes = []
+    start = i = 0
+    while i < len(css):
+        char = css[i]
+        if char in "\"'":
+            i = _skip_string(css, i)
+        elif char == ";":
+            text = css[start:i].strip()
+            if text:
+                nodes.append(("statement", text, None))
+            start = i = i + 1
+        elif char == "{":
+            end = _block_end(css, i)
+            prelude, body = css[start:i].strip(), css[i + 1:end]
+            if prelude.lower().startswith(GROUPING_AT_RULES):
+                nodes.append(("group", prelude, parse(body)))
+            else:
+                nodes.append(("rule", prelude, body))
+            start = i = end + 1
+        else:
+            i += 1
+    return nodes
+
+
+# ----- минификация -----
+
+PROTECTED_RE = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|url\([^)]*\)", re.S)
+
+
+def minify_text(text):
+    """Пробелы и лишние ';' (строки и url() не трогаем)."""
+    protected = []
+
+    def protect(match):
+        protected.append(match.group(0))
+        return f"\0{len(protected) - 1}\0"
+
+    text = PROTECTED_RE.sub(protect, text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r" ?([{};,>]) ?", r"\1", text)
+    # пробел перед ':' в селекторе значимый ("a :hover"), после — нет
+    text = re.sub(r": ", ":", text)
+    text = re.sub(r";+}", "}", text).strip().rstrip(";")
+    return re.sub(r"\0(\d+)\0", lambda match: protected[int(match.group(1))], text)
+
+
+def serialize(nodes):
+    out = []
+    for kind, prelude, body in nodes:
+        if kind == "statement":
+            out.append(minify_text(prelude) + ";")
+        elif kind == "group":
+            inner = serialize(body)
+            if inner:
+                out.append(f"{minify_text(prelude)}{{{inner}}}")
+        else:
+            body = minify_text(body)
+            if body:
+                out.append(f"{minify_text(prelude)}{{{body}}}")
+    return "".join(out)
+
+
+def minify(css):
+    return serialize(parse(strip_comments(css)))
+
+
+# ----- url() -----
+
+def is_relative_url(url):
+    return bool(url) and not url.startswith(("data:", "#", "/")) and "://" not in url
+
+
+def rewrite_urls(css, replace):
+    """replace(url) -> новый url; абсолютные, data: и #id не трогаем."""
+    def substitute(match):
+        quote, url = match.groups()
+        if not is_relative_url(url):
+            return match.group(0)
+        return f"url({quote}{replace(url)}{quote})"
+    return URL_RE.sub(substitute, css)
+
+
+def rebase_urls(css, from_dir, to_dir):
+    """Пути url() относительно from_dir -> относительно to_dir (имена статики)."""
+    def replace(url):
+        path, suffix = re.match(r"([^?#]*)(.*)", url, re.S).groups()
+        target = posixpath.normpath(posixpath.join(from_dir, path))
+        return posixpath.relpath(target, to_dir) + suffix
+    return rewrite_urls(css, replace)
+
+
+# ----- критический CSS -----
+
+class SectionScanner(HTMLParser):
+    """Теги, классы и id внутри секций (и у их предков)."""
+
+    def __init__(self, section_ids):
+        super().__init__(convert_charrefs=True)
+        self.section_ids = set(section_ids)
+        self.stack = []
+        self.inside = 0  # глубина стека, на которой началась секция
+        self.tags, self.classes, self.ids = set(DOCUMENT_TAGS), set(), set()
+
+    def collect(self, tag, attrs):
+        self.tags.add(tag)
+        self.classes.update((attrs.get("class") or "").split())
+        if attrs.get("id"):
+            self.ids.add(attrs["id"])
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.inside:
+            self.collect(tag, attrs)
+        elif attrs.get("id") in self.section_ids:
+            self.inside = len(self.stack) + 1
+            for parent_tag, parent_attrs in self.stack:
+                self.collect(parent_tag, parent_attrs)
+            self.collect(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.inside:
+            self.collect(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        # незакрытые теги закрываем вместе с родителем
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] == tag:
+                del self.stack[depth:]
+                break
+        if self.inside and len(self.stack) < self.inside:
+            self.inside = 0
+
+
+def scan_sections(html, section_ids):
+    scanner = SectionScanner(section_ids)
+    scanner.feed(html)
+    scanner.close()
+    return scanner
+
+
+PSEUDO_RE = re.compile(r"::?[\w-]+(\((?:[^()]|\([^()]*\))*\))?|\[[^\]]*\]")
+COMBINATOR_RE = re.compile(r"\s*[\s>+~]\s*")
+COMPOUND_RE = re.compile(r"([#.]?)(-?[\w-]+|\*)")
+
+
+def selector_matches(selector, scan):
+    """Покрывается ли селектор разметкой (по множествам, без точного DOM)."""
+    selector = PSEUDO_RE.sub("", selector).strip()
+    for compound in filter(None, COMBINATOR_RE.split(selector)):
+        for kind, name in COMPOUND_RE.findall(compound):
+            if name == "*":
+                continue
+            if kind == "." and name not in scan.classes:
+                return False
+            if kind == "#" and name not in scan.ids:
+                return False
+            if not kind and name.lower() not in scan.tags:
+                return False
+    return True
+
+
+def split_selectors(prelude):
+    return [part.strip() for part in prelude.split(",") if part.strip()]
+
+
+ANIMATION_RE = re.compile(r"animation(?:-name)?\s*:\s*([^;]+)")
+
+
+def critical_nodes(nodes, scan, animations):
+    keep = []
+    for kind, prelude, body in nodes:
+        if kind == "group":
+            children = critical_nodes(body, scan, animations)
+            if children:
+                keep.append((kind, prelude, children))
+        elif kind == "rule" and prelude.startswith("@"):
+            if prelude.lower().startswith("@font-face"):
+                keep.append((kind, prelude, body))
+        elif kind == "rule":
+            selectors = [s for s in split_selectors(prelude) if selector_matches(s, scan)]
+            if selectors:
+                keep.append((kind, ", ".join(selectors), body))
+                for value in ANIMATION_RE.findall(body):
+                    animations.update(re.findall(r"[\w-]+", value))
+    return keep
+
+
+def keyframes_nodes(nodes, animations):
+    keep = []
+    for kind, prelude, body in nodes:
+        if kind == "group":
+            children = keyframes_nodes(body, animations)
+            if children:
+                keep.append((kind, prelude, children))
+        elif kind == "rule" and re.match(r"@(-\w+-)?keyframes\s", prelude, re.I):
+            if prelude.split()[-1] in animations:
+                keep.append((kind, prelude, body))
+    return keep
+
+
+def extract_critical(nodes, html, section_ids):
+    scan = scan_sections(html, section_ids)
+    animations = set()
+    critical = critical_nodes(nodes, scan, animations)
+    return critical + keyframes_nodes(nodes, animations)
+
+
+# ----- сборка -----
+
+def template_source():
+    return Path(get_template(TEMPLATE_NAME).origin.name).read_text(encoding="utf-8")
+
+
+def build_digest(source_texts, html):
+    digest = hashlib.sha256(json.dumps({
+        "version": BUILDER_VERSION,
+        "sources": sources(),
+        "sections": critical_sections(),
+    }, sort_keys=True).encode())
+    for name, text in source_texts.items():
+        digest.update(name.encode() + b"\0" + text.encode("utf-8") + b"\0")
+    digest.update(html.encode("utf-8"))
+    # собранные шрифты меняют src у @font-face
+    if fonts.manifest_path().exists():
+        digest.update(fonts.manifest_path().read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def load_manifest(path=None):
+    path = path or manifest_path()
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def write_file(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def is_fresh(manifest, digest):
+    if manifest.get("digest") != digest:
+        return False
+    return all((build_root() / manifest[key]).exists() for key in ("bundle", "critical"))
+
+
+def build(force=False, log=None):
+    """Собирает бандл и критический CSS. Возвращает манифест и флаг «пересобрано»."""
+    log = log or (lambda message: None)
+    root = source_root()
+    source_texts = {name: (root / name).read_text(encoding="utf-8") for name in sources()}
+    html = template_source()
+    digest = build_digest(source_texts, html)
+
+    manifest = load_manifest()
+    if not force and is_fresh(manifest, digest):
+        return manifest, False
+
+    out_dir = static_name(PREFIX)
+    bundle_nodes = []
+    for name, text in source_texts.items():
+        text = rebase_urls(strip_comments(text), posixpath.dirname(name), out_dir)
+        text = fonts.rewrite_font_faces(text, out_dir, out_dir)
+        bundle_nodes.extend(parse(text))
+    critical = extract_critical(bundle_nodes, html, critical_sections())
+
+    bundle_css = serialize(bundle_nodes) + "\n"
+    critical_css = serialize(critical) + "\n"
+
+    new = {
+        "digest": digest,
+        "bundle": f"{PREFIX}/bundle.{digest}.css",
+        "critical": f"{PREFIX}/critical.{digest}.css",
+        "sources": sources(),
+        "bytes": {
+            "sources": sum(len(text.encode("utf-8")) for text in source_texts.values()),
+            "bundle": len(bundle_css.encode("utf-8")),
+            "critical": len(critical_css.encode("utf-8")),
+        },
+    }
+    write_file(build_root() / new["bundle"], bundle_css)
+    write_file(build_root() / new["critical"], critical_css)
+    for key in ("bundle", "critical"):
+        if manifest.get(key) and manifest[key] != new[key]:
+            (build_root() / manifest[key]).unlink(missing_ok=True)
+    write_file(manifest_path(), json.dumps(new, indent=2, sort_keys=True))
+    log(f"CSS: {new['bytes']['sources']} -> {new['bytes']['bundle']} байт, "
+        f"критический {new['bytes']['critical']} байт")
+    return new, True
+
+
+# ----- чтение при рендере -----
+
+_cache = {"mtime": None, "manifest": None, "critical": ""}
+
+
+def current():
+    """(манифест, текст критического CSS) или (None, "") если сборки нет."""
+    path = manifest_path()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None, ""
+    if _cache["mtime"] != mtime:
+        manifest = load_manifest(path)
+        try:
+            critical = (build_root() / manifest["critical"]).read_text(encoding="utf-8")
+        except (KeyError, FileNotFoundError):
+            manifest, critical = None, ""
+        _cache.update(mtime=mtime, manifest=manifest, critical=critical)
+    return _cache["manifest"], _cache["critical"]
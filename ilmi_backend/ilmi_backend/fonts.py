@@ -0,0 +1,411 @@
+"""
+Подмножества шрифтов лендинга в WOFF2.
+
+Полные SF Pro Text / Bebas Neue весят сотни КБ на начертание, а странице
+нужны латиница, узбекская кириллица, цифры и немного знаков. Сборка:
+
+1. по CSS (CSS_BUNDLE_SOURCES) — какие @font-face реально используются:
+   семейство встречается в font-family / font, а начертание подходит
+   под font-weight / font-style из правил и из style="..." в разметке
+   (подбор веса как у браузера) и под <b>, <h1>…, <i>
+2. по отрендеренному index.html и FONT_SUBSET_SCRIPTS — какие символы
+   нужны (плюс FONT_SUBSET_BASE — латиница, кириллица, знаки; у букв
+   берём оба регистра из-за text-transform)
+3. для каждого используемого начертания — WOFF2 с этими символами:
+
+    fonts/manifest.json
+    fonts/SFProText-Bold.9c1d2e3f4a5b.woff2
+    ...
+
+build_css потом переписывает src у этих @font-face на WOFF2 (rewrite_font_faces).
+Имя содержит хэш исходника, набора символов и настроек; сборка
+инкрементальная, как у картинок. fontTools (и Brotli для WOFF2) нужны
+только там, где запускается сборка (build_fonts / collectstatic).
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from . import cssbundle
+from .images import build_root, source_root, static_name
+
+
+PREFIX = "fonts"
+MANIFEST_NAME = "manifest.json"
+
+TEMPLATE_NAME = "index.html"
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".woff", ".woff2")
+
+WEIGHT_KEYWORDS = {"normal": 400, "bold": 700}
+
+# элементы, у которых браузер по умолчанию ставит bold / italic
+BOLD_TAGS = {"b", "strong", "th", "h1", "h2", "h3", "h4", "h5", "h6"}
+ITALIC_TAGS = {"i", "em", "cite", "var", "address"}
+
+# font: italic 700 16px/1.4 "SF Pro Text", sans-serif — семейства после размера
+FONT_SHORTHAND_RE = re.compile(
+    r"(?:^|\s)(?:[\d.]+[a-z%]*|(?:xx?-)?(?:small|large)|medium|larger|smaller)"
+    r"(?:\s*/\s*\S+)?\s+(.+)$"
+)
+
+# атрибуты, текст которых тоже рисуется шрифтом страницы
+TEXT_ATTRIBUTES = {"placeholder", "value", "title", "alt", "aria-label"}
+
+
+class FontBuildError(Exception):
+    """Сборку шрифтов запустить нельзя (нет fontTools / Brotli)."""
+
+
+def manifest_path():
+    return build_root() / PREFIX / MANIFEST_NAME
+
+
+def subset_options():
+    return {
+        "base": getattr(settings, "FONT_SUBSET_BASE", ""),
+        "hinting": getattr(settings, "FONT_SUBSET_HINTING", False),
+    }
+
+
+# ----- что используется в CSS -----
+
+def _declarations(body):
+    for declaration in body.split(";"):
+        name, _, value = declaration.partition(":")
+        if value:
+            yield name.strip().lower(), value.strip()
+
+
+def _families(value):
+    return {part.strip().strip("\"'").lower() for part in value.split(",") if part.strip()}
+
+
+def _walk(nodes):
+    for kind, prelude, body in nodes:
+        if kind == "group":
+            yield from _walk(body)
+        else:
+            yield kind, prelude, body
+
+
+def parse_weight(value):
+    value = value.strip().lower()
+    if value in WEIGHT_KEYWORDS:
+        return WEIGHT_KEYWORDS[value]
+    return int(value) if value.isdigit() else None
+
+
+def font_faces(nodes, css_dir):
+    """@font-face из CSS: семейство, диапазон весов, стиль, исходный файл (имя статики)."""
+    faces = []
+    for kind, prelude, body in _walk(nodes):
+        if kind != "rule" or not prelude.lower().startswith("@font-face"):
+            continue
+        declarations = dict(_declarations(body))
+        urls = [url for _, url in cssbundle.URL_RE.findall(declarations.get("src", ""))]
+        local = [url for url in urls if cssbundle.is_relative_url(url)]
+        if "font-family" not in declarations or not local:
+            continue
+        weights = [parse_weight(part) for part in declarations.get("font-weight", "400").split()]
+        weights = [weight for weight in weights if weight] or [400]
+        path = re.match(r"[^?#]*", local[0]).group(0)
+        faces.append({
+            "family": _families(declarations["font-family"]).pop(),
+            "weight": (min(weights), max(weights)),
+            "style": "italic" if "italic" in declarations.get("font-style", "") else "normal",
+            "source": posixpath.normpath(posixpath.join(css_dir, path)),
+        })
+    return faces
+
+
+def used_styles(nodes, markup):
+    """(семейства, веса, стили), которые встречаются в правилах и разметке."""
+    families, weights, styles = set(), {400}, {"normal"}
+    bodies = [body for kind, prelude, body in _walk(nodes) if kind == "rule" and not prelude.startswith("@")]
+    for body in bodies + markup.styles:
+        for name, value in _declarations(body):
+            if name == "font-family":
+                families |= _families(value)
+            elif name == "font-weight":
+                weight = parse_weight(value)
+                if weight:
+                    weights.add(weight)
+                elif value in ("bolder", "lighter"):
+                    weights.update((300, 700))
+            elif name == "font-style" and value in ("italic", "oblique"):
+                styles.add("italic")
+            elif name == "font":
+                match = FONT_SHORTHAND_RE.search(value)
+                if not match:
+                    continue
+                families |= _families(match.group(1))
+                for token in value[:match.start()].split():
+                    if parse_weight(token):
+                        weights.add(parse_weight(token))
+                    elif token in ("italic", "oblique"):
+                        styles.add("italic")
+    if markup.tags & BOLD_TAGS:
+        weights.add(700)
+    if markup.tags & ITALIC_TAGS:
+        styles.add("italic")
+    return families, weights, styles
+
+
+def match_weight(weight, available):
+    """Какой из доступных весов возьмёт браузер (CSS Fonts, font matching)."""
+    if weight in available:
+        return weight
+    below = sorted((w for w in available if w < weight), reverse=True)
+    above = sorted(w for w in available if w > weight)
+    if 400 <= weight <= 500:
+        within = [w for w in above if w <= 500]
+        order = within + below + [w for w in above if w > 500]
+    elif weight < 400:
+        order = below + above
+    else:
+        order = above + below
+    return order[0] if order else None
+
+
+def used_faces(faces, nodes, markup):
+    families, weights, styles = used_styles(nodes, markup)
+    used = []
+    for face in faces:
+        if face["family"] not in families or face["style"] not in styles:
+            continue
+        available = {
+            other["weight"][0] for other in faces
+            if other["family"] == face["family"] and other["style"] == face["style"]
+        }
+        low, high = face["weight"]
+        if any(low <= weight <= high or match_weight(weight, available) == low for weight in weights):
+            used.append(face)
+    return used
+
+
+# ----- какие символы нужны -----
+
+class TextCollector(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks, self.tags = [], set()
+        # style="..." — тело правила для used_styles (font-family прямо в разметке)
+        self.styles = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag)
+        if tag in ("script", "style"):
+            self._skip += 1
+        self.chunks.extend(value for name, value in attrs if name in TEXT_ATTRIBUTES and value)
+        self.styles.extend(value for name, value in attrs if name == "style" and value)
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.chunks.append(data)
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+def collect_markup():
+    collector = TextCollector()
+    collector.feed(render_to_string(TEMPLATE_NAME))
+    collector.close()
+    return collector
+
+
+def glyph_text(markup):
+    """Отсортированная строка нужных символов (детерминированно для хэша)."""
+    text = markup.text + subset_options()["base"]
+    root = source_root()
+    for name in getattr(settings, "FONT_SUBSET_SCRIPTS", ()):
+        text += (root / name).read_text(encoding="utf-8")
+    chars = set()
+    for char in text:
+        if char.isspace() and char != " ":
+            continue
+        chars.update((char, char.upper(), char.lower()))
+    return "".join(sorted(char for char in chars if len(char) == 1))
+
+
+# ----- подмножество (выполняется в дочерних процессах) -----
+
+def subset_face(job):
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.hinting = job["hinting"]
+    options.desubroutinize = True
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    options.drop_tables += ["FFTM"]
+
+    font = subset.load_font(job["path"], options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=job["text"])
+    subsetter.subset(font)
+
+    path = Path(job["out_root"]) / job["name"]
+    tmp = path.with_name(path.name + ".tmp")
+    subset.save_font(font, str(tmp), options)
+    os.replace(tmp, path)
+    return {
+        "digest": job["digest"],
+        "woff2": job["name"],
+        "bytes": {"source": os.path.getsize(job["path"]), "woff2": os.path.getsize(path)},
+    }
+
+
+def check_dependencies():
+    try:
+        import fontTools.subset  # noqa: F401
+    except ImportError:
+        raise FontBuildError("fontTools не установлен: pip install fonttools")
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        raise FontBuildError("для WOFF2 нужен Brotli: pip install Brotli")
+
+
+# ----- манифест и сборка -----
+
+def load_manifest(path=None):
+    path = path or manifest_path()
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_manifest(data):
+    path = manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False))
+    os.replace(tmp, path)
+
+
+def face_digest(path, text, options):
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode() + text.encode("utf-8"))
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def css_faces():
+    """(все @font-face, используемые, разметка) по исходникам CSS_BUNDLE_SOURCES."""
+    root = source_root()
+    faces, nodes = [], []
+    for name in cssbundle.sources():
+        parsed = cssbundle.parse(cssbundle.strip_comments((root / name).read_text(encoding="utf-8")))
+        faces += font_faces(parsed, posixpath.dirname(name))
+        nodes += parsed
+    markup = collect_markup()
+    return faces, used_faces(faces, nodes, markup), markup
+
+
+def build(force=False, workers=None, log=None):
+    """
+    Собирает WOFF2 для используемых начертаний.
+    Возвращает (манифест, собрано, без изменений, не используются).
+    """
+    check_dependencies()
+    log = log or (lambda message: None)
+    faces, used, markup = css_faces()
+    text = glyph_text(markup)
+    options = subset_options()
+
+    (build_root() / PREFIX).mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    sources = {face["source"] for face in used}
+    log(f"Шрифты: {len(sources)} из {len(faces)} @font-face используются, {len(text)} символов")
+
+    jobs = []
+    for source in sorted(sources):
+        path = source_root() / source
+        digest = face_digest(path, text, options)
+        entry = manifest.get(source)
+        if not force and entry and entry["digest"] == digest and (build_root() / entry["woff2"]).exists():
+            continue
+        jobs.append({
+            "source": source,
+            "path": str(path),
+            "name": f"{PREFIX}/{posixpath.splitext(posixpath.basename(source))[0]}.{digest}.woff2",
+            "digest": digest,
+            "text": text,
+            "out_root": str(build_root()),
+            **options,
+        })
+
+    stale = set()
+    if jobs:
+        workers = workers or getattr(settings, "FONT_SUBSET_WORKERS", None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for job, entry in zip(jobs, pool.map(subset_face, jobs)):
+                source = job["source"]
+                old = manifest.get(source)
+                if old and old["woff2"] != entry["woff2"]:
+                    stale.add(old["woff2"])
+                manifest[source] = entry
+
+    for source in set(manifest) - sources:
+        stale.add(manifest.pop(source)["woff2"])
+    for name in stale:
+        (build_root() / name).unlink(missing_ok=True)
+
+    save_manifest(manifest)
+    # не используемые @font-face и файлы рядом, на которые CSS не ссылается вовсе
+    unused = {face["source"] for face in faces}
+    for directory in {posixpath.dirname(source) for source in unused}:
+        unused.update(
+            posixpath.join(directory, path.name)
+            for path in (source_root() / directory).iterdir()
+            if path.suffix.lower() in FONT_EXTENSIONS
+        )
+    unused = sorted(unused - sources)
+    return manifest, len(jobs), len(sources) - len(jobs), unused
+
+
+# ----- переписывание @font-face (из build_css) -----
+
+def rewrite_font_faces(css, css_dir, out_dir):
+    """
+    src у @font-face с собранным WOFF2 -> url(WOFF2) format("woff2").
+    css — текст с путями url() относительно css_dir (имена статики),
+    новые пути — относительно out_dir. Без манифеста текст не меняется.
+    """
+    manifest = load_manifest()
+    if not manifest:
+        return css
+
+    def replace(match):
+        body = match.group(2)
+        urls = [url for _, url in cssbundle.URL_RE.findall(body) if cssbundle.is_relative_url(url)]
+        if not urls:
+            return match.group(0)
+        source = posixpath.normpath(posixpath.join(css_dir, re.match(r"[^?#]*", urls[0]).group(0)))
+        entry = manifest.get(source)
+        if entry is None:
+            return match.group(0)
+        url = posixpath.relpath(static_name(entry["woff2"]), out_dir)
+        body = re.sub(r"src\s*:[^;}]*", f'src:url("{url}") format("woff2")', body, count=1)
+        return match.group(1) + body + "}"
+
+    return re.sub(r"(@font-face\s*\{)([^}]*)\}", replace, css, flags=re.I)
@@ -0,0 +1,246 @@
+"""
+Адаптивные версии картинок лендинга (AVIF / WebP в нескольких ширинах).
+
+Исходники — RESPONSIVE_IMAGE_SOURCES (glob'ы относительно static/),
+результат — static/build/responsive/ (в git не лежит, collectstatic
+забирает его вместе с остальной статикой):
+
+    responsive/manifest.json
+    responsive/lesson-1.3f9a0c1b2d4e.184w.avif
+    responsive/lesson-1.3f9a0c1b2d4e.184w.webp
+    ...
+
+В имени — хэш содержимого исходника и настроек кодирования, поэтому
+файлы можно кэшировать навсегда. Сборка инкрементальная: исходник
+перекодируется, только если изменился хэш или пропал какой-то вариант.
+Кодирование идёт в ProcessPoolExecutor — по процессу на исходник.
+
+Pillow нужен только на машине, где запускается сборка (build_images /
+collectstatic). AVIF — если Pillow собран с ним (Pillow 11.2+ или
+pillow-avif-plugin), иначе только WebP.
+"""
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+
+PREFIX = "responsive"
+MANIFEST_NAME = "manifest.json"
+
+MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+}
+
+
+class ImageBuildError(Exception):
+    """Сборку картинок запустить нельзя (нет Pillow, нет кодеков)."""
+
+
+def source_root():
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+def build_root():
+    return Path(getattr(settings, "STATIC_BUILD_DIR", source_root() / "build"))
+
+
+def manifest_path():
+    return build_root() / PREFIX / MANIFEST_NAME
+
+
+def static_name(name):
+    """Имя файла сборки (относительно build_root) -> путь для {% static %}."""
+    return (build_root() / name).relative_to(source_root()).as_posix()
+
+
+def encode_options():
+    return {
+        "widths": sorted(getattr(settings, "RESPONSIVE_IMAGE_WIDTHS", [320, 640, 1280])),
+        "formats": list(getattr(settings, "RESPONSIVE_IMAGE_FORMATS", ["avif", "webp"])),
+        "quality": dict(getattr(settings, "RESPONSIVE_IMAGE_QUALITY", {"avif": 50, "webp": 75})),
+    }
+
+
+def find_sources():
+    """Относительные пути исходников (как в {% static %}), без дублей, по порядку."""
+    root = source_root()
+    found = {}
+    for pattern in getattr(settings, "RESPONSIVE_IMAGE_SOURCES", ()):
+        for path in sorted(root.glob(pattern)):
+            if path.is_file() and build_root() not in path.parents:
+                found[path.relative_to(root).as_posix()] = path
+    return found
+
+
+def source_digest(path, options):
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", Path(name).stem.lower()).strip("-")
+
+
+def supported_formats(formats):
+    try:
+        from PIL import features
+    except ImportError:
+        raise ImageBuildError("Pillow не установлен: pip install Pillow")
+
+    available = []
+    for fmt in formats:
+        if fmt == "avif" and not features.check("avif"):
+            try:
+                import pillow_avif  # noqa: F401 — регистрирует кодек в Pillow
+            except ImportError:
+                continue
+        if fmt == "webp" and not features.check("webp"):
+            continue
+        available.append(fmt)
+    if not available:
+        raise ImageBuildError(f"Pillow собран без кодеков {', '.join(formats)}")
+    return available
+
+
+# ----- кодирование (выполняется в дочерних процессах) -----
+
+def encode_source(job):
+    """Один исходник -> все ширины и форматы. Возвращает запись манифеста."""
+    from PIL import Image
+
+    if "avif" in job["formats"]:
+        try:
+            import pillow_avif  # noqa: F401
+        except ImportError:
+            pass
+
+    out_root = Path(job["out_root"])
+    with Image.open(job["path"]) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        width, height = image.size
+
+        targets = sorted({min(w, width) for w in job["widths"]})
+        variants = {fmt: [] for fmt in job["formats"]}
+        for target in targets:
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            for fmt in job["formats"]:
+                name = f"{PREFIX}/{slug(job['name'])}.{job['digest']}.{target}w.{fmt}"
+                path = out_root / name
+                tmp = path.with_name(path.name + ".tmp")
+                resized.save(tmp, format=fmt.upper(), quality=job["quality"].get(fmt, 75))
+                os.replace(tmp, path)
+                variants[fmt].append([target, name])
+
+    return {
+        "digest": job["digest"],
+        "width": width,
+        "height": height,
+        "variants": variants,
+    }
+
+
+# ----- манифест и сборка -----
+
+def load_manifest(path=None):
+    path = path or manifest_path()
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_manifest(data):
+    path = manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False))
+    os.replace(tmp, path)
+
+
+def variant_files(entry):
+    return {name for variants in entry.get("variants", {}).values() for _, name in variants}
+
+
+def is_fresh(entry, digest):
+    if not entry or entry.get("digest") != digest:
+        return False
+    return all((build_root() / name).exists() for name in variant_files(entry))
+
+
+def build(force=False, workers=None, log=None):
+    """
+    Перекодирует изменившиеся исходники и чистит устаревшие варианты.
+    Возвращает (перекодировано, без изменений).
+    """
+    log = log or (lambda message: None)
+    options = encode_options()
+    options["formats"] = supported_formats(options["formats"])
+
+    (build_root() / PREFIX).mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    sources = find_sources()
+
+    jobs = []
+    for name, path in sources.items():
+        digest = source_digest(path, options)
+        if not force and is_fresh(manifest.get(name), digest):
+            continue
+        jobs.append({
+            "name": name,
+            "path": str(path),
+            "digest": digest,
+            "out_root": str(build_root()),
+            **options,
+        })
+
+    stale = set()
+    if jobs:
+        workers = workers or getattr(settings, "RESPONSIVE_IMAGE_WORKERS", None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for job, entry in zip(jobs, pool.map(encode_source, jobs)):
+                old = manifest.get(job["name"])
+                if old:
+                    stale |= variant_files(old) - variant_files(entry)
+                manifest[job["name"]] = entry
+                log(f"{job['name']}: {entry['width']}x{entry['height']} -> "
+                    f"{sum(len(v) for v in entry['variants'].values())} вариантов")
+
+    for name in set(manifest) - set(sources):
+        stale |= variant_files(manifest.pop(name))
+
+    for name in stale:
+        (build_root() / name).unlink(missing_ok=True)
+
+    save_manifest(manifest)
+    return len(jobs), len(sources) - len(jobs)
+
+
+# ----- чтение манифеста при рендере -----
+
+_cache = {"key": None, "data": {}}
+
+
+def manifest_entry(name):
+    """Запись манифеста для исходника или None (манифест перечитывается при изменении)."""
+    path = manifest_path()
+    try:
+        key = (path, path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    if _cache["key"] != key:
+        _cache["data"] = load_manifest(path)
+        _cache["key"] = key
+    return _cache["data"].get(name)
@@ -0,0 +1,118 @@
+"""
+Кэш отрендеренного лендинга (index.html).
+
+Шаблон почти не меняется, поэтому рендерим его один раз на процесс
+и отдаём готовые байты. Версия страницы — отпечаток (mtime, размер)
+шаблона и статики:
+- есть манифест collectstatic (ManifestStaticFilesStorage) — только он,
+  collectstatic переписывает его при любом изменении статики
+- нет манифеста (разработка) — все файлы из STATICFILES_DIRS
+
+Отпечаток перепроверяем не чаще LANDING_CHECK_INTERVAL секунд.
+ETag — sha256 самого HTML (сильный), Last-Modified — самый свежий
+из исходных файлов.
+"""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template.loader import get_template, render_to_string
+
+
+TEMPLATE_NAME = "index.html"
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    body: bytes
+    etag: str
+    last_modified: float
+    fingerprint: tuple
+
+
+def check_interval():
+    return getattr(settings, "LANDING_CHECK_INTERVAL", 5)
+
+
+def template_path():
+    return Path(get_template(TEMPLATE_NAME).origin.name)
+
+
+def manifest_path():
+    name = getattr(staticfiles_storage, "manifest_name", None)
+    if not name or not getattr(settings, "STATIC_ROOT", None):
+        return None
+    path = Path(staticfiles_storage.path(name))
+    return path if path.exists() else None
+
+
+def source_files():
+    """Файлы, от которых зависит HTML лендинга."""
+    files = [template_path()]
+    manifest = manifest_path()
+    if manifest:
+        files.append(manifest)
+        return files
+    for directory in getattr(settings, "STATICFILES_DIRS", ()):
+        for root, _, names in os.walk(directory):
+            files.extend(Path(root) / name for name in names)
+    return files
+
+
+def fingerprint():
+    stats = []
+    for path in source_files():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        stats.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stats))
+
+
+def render_page(current_fingerprint=None):
+    current_fingerprint = current_fingerprint or fingerprint()
+    body = render_to_string(TEMPLATE_NAME).encode("utf-8")
+    last_modified = max((mtime for _, mtime, _ in current_fingerprint), default=0) / 1e9
+    return RenderedPage(
+        body=body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        last_modified=last_modified,
+        fingerprint=current_fingerprint,
+    )
+
+
+class PageCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._page = None
+        self._checked_at = 0.0
+
+    def get(self):
+        page = self._page
+        if page is not None and time.monotonic() - self._checked_at < check_interval():
+            return page
+
+        with self._lock:
+            current = fingerprint()
+            self._checked_at = time.monotonic()
+            if self._page is None or self._page.fingerprint != current:
+                self._page = render_page(current)
+            return self._page
+
+    def clear(self):
+        with self._lock:
+            self._page = None
+
+
+page_cache = PageCache()
+
+
+def get_page():
+    return page_cache.get()
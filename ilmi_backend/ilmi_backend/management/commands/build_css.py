@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ilmi_backend import cssbundle
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает CSS лендинга в один минифицированный бандл и выделяет "
+        "критический CSS первого экрана. Запускается и из collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересобрать, даже если исходники не менялись")
+
+    def handle(self, *args, force, **options):
+        manifest, rebuilt = cssbundle.build(force=force, log=self.stdout.write)
+        if not rebuilt:
+            self.stdout.write(f"CSS: без изменений ({manifest['bundle']})")
+            return
+        self.stdout.write(self.style.SUCCESS(f"CSS: {manifest['bundle']}, {manifest['critical']}"))
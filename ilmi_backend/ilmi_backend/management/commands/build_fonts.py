@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ilmi_backend import fonts
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает подмножества используемых шрифтов в WOFF2 (только символы "
+        "лендинга). Запускается и из collectstatic, перед build_css."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересобрать все начертания")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов (по умолчанию — ядер)")
+
+    def handle(self, *args, force, workers, **options):
+        try:
+            manifest, built, skipped, unused = fonts.build(
+                force=force, workers=workers, log=self.stdout.write
+            )
+        except fonts.FontBuildError as exc:
+            raise CommandError(str(exc))
+
+        total_source = total_woff2 = 0
+        for source, entry in sorted(manifest.items()):
+            size, subset = entry["bytes"]["source"], entry["bytes"]["woff2"]
+            total_source += size
+            total_woff2 += subset
+            self.stdout.write(
+                f"  {source}: {size} -> {subset} байт "
+                f"(-{size - subset}, {100 * (size - subset) / size:.0f}%)"
+            )
+        for source in unused:
+            self.stdout.write(f"  {source}: не используется, оставлен как есть")
+        self.stdout.write(self.style.SUCCESS(
+            f"Шрифты: собрано {built}, без изменений {skipped}; "
+            f"{total_source} -> {total_woff2} байт, сэкономлено {total_source - total_woff2}"
+        ))
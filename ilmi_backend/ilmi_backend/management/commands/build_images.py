@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ilmi_backend import images
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает AVIF/WebP-версии картинок лендинга в нескольких ширинах "
+        "(только изменившиеся исходники). Запускается и из collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Перекодировать всё")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов (по умолчанию — ядер)")
+
+    def handle(self, *args, force, workers, **options):
+        try:
+            built, skipped = images.build(force=force, workers=workers, log=self.stdout.write)
+        except images.ImageBuildError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Картинки: перекодировано {built}, без изменений {skipped}"
+        ))
@@ -0,0 +1,35 @@
+from django.contrib.staticfiles.management.commands.collectstatic import (
+    Command as CollectStaticCommand,
+)
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+
+# шаги сборки статики, которые идут перед копированием (их результат — в static/build/)
+BUILD_STEPS = (
+    "build_images",
+    "build_fonts",
+    "build_css",
+)
+
+
+class Command(CollectStaticCommand):
+    help = CollectStaticCommand.help + " Перед этим выполняет шаги сборки (build_images, build_fonts, build_css)."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--skip-build",
+            action="store_true",
+            help="Не запускать шаги сборки, только собрать статику",
+        )
+
+    def handle(self, **options):
+        if not options["skip_build"]:
+            for step in BUILD_STEPS:
+                try:
+                    call_command(step, stdout=self.stdout, stderr=self.stderr)
+                except CommandError as exc:
+                    # без Pillow и т.п. лендинг работает на исходниках — не валим деплой
+                    self.stderr.write(self.style.WARNING(f"{step} пропущен: {exc}"))
+        return super().handle(**options)
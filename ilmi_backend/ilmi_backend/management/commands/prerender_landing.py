@@ -0,0 +1,45 @@
+import gzip
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ilmi_backend.landing import render_page
+
+
+class Command(BaseCommand):
+    help = (
+        "Рендерит лендинг в готовый index.html (и index.html.gz) для nginx. "
+        "Запускать при деплое после collectstatic, например:\n"
+        "    location = / { root /opt/kurs/prerendered; try_files /index.html @django; "
+        "gzip_static on; }"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir",
+            default=str(getattr(settings, "LANDING_PRERENDER_DIR", settings.BASE_DIR.parent / "prerendered")),
+        )
+        parser.add_argument("--no-gzip", action="store_true")
+
+    def handle(self, *args, output_dir, no_gzip, **options):
+        page = render_page()
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        path = output_dir / "index.html"
+        self._write(path, page.body, page.last_modified)
+        if not no_gzip:
+            self._write(path.with_name("index.html.gz"), gzip.compress(page.body, 9, mtime=0), page.last_modified)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: {len(page.body)} байт, ETag {page.etag}"
+        ))
+
+    def _write(self, path, data, mtime):
+        # атомарно: nginx не должен увидеть полузаписанный файл
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.utime(tmp, (mtime, mtime))
+        os.replace(tmp, path)
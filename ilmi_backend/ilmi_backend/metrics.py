@@ -0,0 +1,342 @@
+"""
+Метрики по эндпоинтам: время ответа, запросы к базе, размер ответа, ошибки.
+
+MetricsMiddleware стоит первым в MIDDLEWARE и на время запроса считает
+запросы к базе (recording(): execute_wrapper на каждом подключении смотрит
+в contextvar, так что счёт идёт и под ASGI, где async ORM ходит в базу
+из другого потока). На каждое имя URL
+(request.resolver_match.view_name; статика — "static", не нашлось — "unmatched")
+копятся:
+
+- ilmi_http_request_duration_seconds — гистограмма времени ответа
+  (без отдачи тела у потоковых ответов)
+- ilmi_http_requests_total{status} / ilmi_http_request_errors_total — 5xx и исключения
+- ilmi_http_response_bytes_total — Content-Length или длина тела
+- ilmi_db_queries_total / ilmi_db_query_seconds_total
+
+Счётчики без блокировок: у каждого потока свой dict (шард), пишет в него
+только он сам; /metrics складывает шарды. Шарды завершившихся потоков
+(runserver создаёт поток на запрос) вливаются в общий при появлении нового.
+
+Всё — на воркер: у series есть метка worker (pid), чтобы значения разных
+процессов gunicorn не выглядели как сброс счётчика.
+
+/metrics (Prometheus text format, views.metrics) выключен по умолчанию:
+METRICS_ENDPOINT_ENABLED, доступ — с METRICS_ALLOWED_IPS или для staff.
+
+Медленные запросы (дольше METRICS_SLOW_REQUEST_MS) пишутся в лог со списком
+SQL — каждый, или доля METRICS_SLOW_SAMPLE_RATE.
+"""
+import contextvars
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+# границы гистограммы, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# сколько SQL из медленного запроса показываем в логе
+SLOW_LOG_QUERIES = 20
+
+METRICS = (
+    ("ilmi_http_request_duration_seconds", "histogram", "Время ответа по имени URL"),
+    ("ilmi_http_requests_total", "counter", "Ответы по имени URL и статусу"),
+    ("ilmi_http_request_errors_total", "counter", "Ответы 5xx и исключения"),
+    ("ilmi_http_response_bytes_total", "counter", "Байт в ответах"),
+    ("ilmi_db_queries_total", "counter", "SQL-запросов"),
+    ("ilmi_db_query_seconds_total", "counter", "Время SQL-запросов, секунды"),
+)
+
+
+def enabled():
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+# ----- шарды счётчиков -----
+
+class Registry:
+    """
+    Ключ шарда — (метрика, метки...), значение — число.
+    Гистограмма хранит попадания в каждую корзину отдельно
+    (ключ с индексом корзины), накопительные суммы — при выводе.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []        # (поток, dict)
+        self._retired = {}       # сумма по завершившимся потокам
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                alive = []
+                for thread, other in self._shards:
+                    if thread.is_alive():
+                        alive.append((thread, other))
+                    else:
+                        _merge(self._retired, other)
+                alive.append((threading.current_thread(), shard))
+                self._shards = alive
+        return shard
+
+    def observe(self, view, status, duration, size, queries, query_time, error):
+        shard = self.shard()
+        for key, value in (
+            (("requests", view, status), 1),
+            (("duration_sum", view), duration),
+            (("duration_count", view), 1),
+            (("duration_bucket", view, _bucket_index(duration)), 1),
+            (("response_bytes", view), size),
+            (("queries", view), queries),
+            (("query_seconds", view), query_time),
+            (("errors", view), int(error)),
+        ):
+            shard[key] = shard.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            total = dict(self._retired)
+            shards = [dict(shard) for _, shard in self._shards]
+        for shard in shards:
+            _merge(total, shard)
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._retired.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+
+def _merge(target, source):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+def _bucket_index(duration):
+    for index, bound in enumerate(DURATION_BUCKETS):
+        if duration <= bound:
+            return index
+    return len(DURATION_BUCKETS)
+
+
+registry = Registry()
+
+
+# ----- Prometheus text format -----
+
+def _labels(**labels):
+    parts = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(parts) + "}"
+
+
+def render(snapshot=None):
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    worker = os.getpid()
+    views = sorted({key[1] for key in snapshot})
+    lines = []
+
+    def header(name):
+        kind, help_text = next((kind, text) for metric, kind, text in METRICS if metric == name)
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    name = "ilmi_http_request_duration_seconds"
+    header(name)
+    for view in views:
+        cumulative = 0
+        for index, bound in enumerate((*DURATION_BUCKETS, "+Inf")):
+            cumulative += snapshot.get(("duration_bucket", view, index), 0)
+            lines.append(f"{name}_bucket{_labels(view=view, le=bound, worker=worker)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(view=view, worker=worker)} {snapshot.get(('duration_sum', view), 0):.6f}")
+        lines.append(f"{name}_count{_labels(view=view, worker=worker)} {snapshot.get(('duration_count', view), 0)}")
+
+    header("ilmi_http_requests_total")
+    for key in sorted(key for key in snapshot if key[0] == "requests"):
+        _, view, status = key
+        lines.append(f"ilmi_http_requests_total{_labels(view=view, status=status, worker=worker)} {snapshot[key]}")
+
+    for name, key_name in (
+        ("ilmi_http_request_errors_total", "errors"),
+        ("ilmi_http_response_bytes_total", "response_bytes"),
+        ("ilmi_db_queries_total", "queries"),
+        ("ilmi_db_query_seconds_total", "query_seconds"),
+    ):
+        header(name)
+        for view in views:
+            value = snapshot.get((key_name, view), 0)
+            value = f"{value:.6f}" if isinstance(value, float) else value
+            lines.append(f"{name}{_labels(view=view, worker=worker)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+# ----- учёт запросов к базе -----
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы и время, SQL запоминает для лога медленных."""
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.keep_sql:
+                self.queries.append((elapsed, context["connection"].alias, sql))
+
+
+# contextvar, а не thread-local: asgiref копирует контекст в поток
+# sync_to_async, и запросы async ORM попадают в счёт своего HTTP-запроса
+_recorders = contextvars.ContextVar("ilmi_metrics_recorders", default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    for recorder in _recorders.get():
+        execute = functools.partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+def install():
+    """Вешает _dispatch на все будущие и уже открытые в этом потоке подключения."""
+    connection_created.connect(_install, dispatch_uid="ilmi_metrics_dispatch")
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+@contextmanager
+def recording(recorder):
+    """Все запросы к базе в этом контексте (и в его sync_to_async) идут через recorder."""
+    token = _recorders.set((*_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+# ----- middleware -----
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is not None:
+        return match.view_name or match.url_name or "unnamed"
+    if request.path_info.startswith(settings.STATIC_URL):
+        return "static"
+    return "unmatched"
+
+
+def response_size(response):
+    if response.has_header("Content-Length"):
+        try:
+            return int(response["Content-Length"])
+        except ValueError:
+            return 0
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+def slow_threshold():
+    threshold = getattr(settings, "METRICS_SLOW_REQUEST_MS", None)
+    return None if threshold is None else threshold / 1000
+
+
+def log_slow(request, view, duration, recorder):
+    if random.random() >= getattr(settings, "METRICS_SLOW_SAMPLE_RATE", 1.0):
+        return
+    queries = sorted(recorder.queries, key=lambda query: query[0], reverse=True)
+    lines = [
+        f"  {elapsed * 1000:8.1f} ms  [{alias}] {sql[:500]}"
+        for elapsed, alias, sql in queries[:SLOW_LOG_QUERIES]
+    ]
+    logger.warning(
+        "slow request %s %s (%s): %.0f ms, %d queries, %.0f ms in SQL\n%s",
+        request.method, request.path, view, duration * 1000,
+        recorder.count, recorder.seconds * 1000, "\n".join(lines),
+    )
+
+
+class MetricsMiddleware:
+    """Первый в MIDDLEWARE, чтобы мерить всё, включая статику и другие middleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        threshold = slow_threshold()
+        recorder = QueryRecorder(keep_sql=threshold is not None)
+        start = time.perf_counter()
+        response = None
+        try:
+            with recording(recorder):
+                response = self.get_response(request)
+        finally:
+            self.observe(request, response, start, recorder, threshold)
+        return response
+
+    async def __acall__(self, request):
+        threshold = slow_threshold()
+        recorder = QueryRecorder(keep_sql=threshold is not None)
+        start = time.perf_counter()
+        response = None
+        try:
+            with recording(recorder):
+                response = await self.get_response(request)
+        finally:
+            self.observe(request, response, start, recorder, threshold)
+        return response
+
+    def observe(self, request, response, start, recorder, threshold):
+        """response None — вьюха или middleware ниже бросили исключение."""
+        duration = time.perf_counter() - start
+        view = view_label(request)
+        if response is None:
+            status, size, error = 500, 0, True
+        else:
+            status, size = response.status_code, response_size(response)
+            error = status >= 500
+        registry.observe(view, status, duration, size, recorder.count, recorder.seconds, error)
+        if threshold is not None and duration >= threshold:
+            log_slow(request, view, duration, recorder)
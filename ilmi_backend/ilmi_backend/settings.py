@@ -2,6 +2,7 @@
 Django settings for ilmi_backend project.
 """
 
+import os
 from pathlib import Path
 
 # ==========================================
@@ -30,6 +31,9 @@ ALLOWED_HOSTS = [
 # ==========================================
 
 INSTALLED_APPS = [
+    # выше staticfiles: свой collectstatic со сборкой (ilmi_backend/management)
+    'ilmi_backend',
+
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -46,10 +50,16 @@ INSTALLED_APPS = [
 # ==========================================
 
 MIDDLEWARE = [
+    # время ответа и SQL по эндпоинтам — первым, чтобы мерить всё (ilmi_backend/metrics.py)
+    'ilmi_backend.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # статика из STATIC_ROOT до роутинга (ilmi_backend/staticserve.py)
+    'ilmi_backend.staticserve.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
     'corsheaders.middleware.CorsMiddleware',
+    # флуд и боты на /api/track/ и /api/leads/ — до вьюх и базы (analytics/throttle.py)
+    'analytics.throttle.ThrottleMiddleware',
 
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -102,13 +112,119 @@ WSGI_APPLICATION = 'ilmi_backend.wsgi.application'
 # DATABASE
 # ==========================================
 
+# Продакшн-профиль SQLite под несколько воркеров gunicorn:
+# - WAL: читатели не блокируют писателя и наоборот
+# - synchronous=NORMAL: в WAL безопасно и намного быстрее FULL
+# - busy_timeout: писатель ждёт освобождения лока, а не падает с "database is locked"
+# - transaction_mode IMMEDIATE: транзакция берёт лок на запись сразу на BEGIN,
+#   поэтому писатели выстраиваются в очередь через busy_timeout
+#   вместо взаимной блокировки при апгрейде read -> write
+# - CONN_MAX_AGE: соединение (и его PRAGMA) живёт между запросами.
+#   Под ASGI (asgi.py выставляет ILMI_ASGI=1) — 0: ORM там ходит в базу
+#   из потока, который asgiref заводит на запрос, и постоянное соединение
+#   осталось бы висеть в завершившемся потоке
+ASGI_MODE = os.environ.get('ILMI_ASGI') == '1'
+
+SQLITE_PRAGMAS = ";".join([
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=20000",        # мс
+    "PRAGMA cache_size=-20000",         # ~20 МБ кэша страниц
+    "PRAGMA mmap_size=134217728",       # 128 МБ
+    "PRAGMA temp_store=MEMORY",
+])
+
+SQLITE_PRODUCTION_PROFILE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'OPTIONS': {
+        'init_command': SQLITE_PRAGMAS,
+        'transaction_mode': 'IMMEDIATE',
+    },
+    'CONN_MAX_AGE': 0 if ASGI_MODE else 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        **SQLITE_PRODUCTION_PROFILE,
         'NAME': BASE_DIR.parent / 'db.sqlite3',
         # db.sqlite лежит в /opt/kurs/db.sqlite3
-    }
+    },
+    # сырые события трекинга (PageView, SectionView, ClickEvent)
+    # python manage.py migrate --database=events
+    'events': {
+        **SQLITE_PRODUCTION_PROFILE,
+        'NAME': BASE_DIR.parent / 'events.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = ['analytics.routers.EventStoreRouter']
+
+# ==========================================
+# ANALYTICS
+# ==========================================
+
+# alias базы для сырых событий (см. analytics/routers.py)
+ANALYTICS_EVENT_DATABASE = 'events'
+
+# месячные архивы старых событий (archive_events / restore_events)
+ANALYTICS_ARCHIVE_DIR = BASE_DIR.parent / 'archive'
+
+# воронка лендинга: секции по порядку и клики, которые ведут к лиду
+ANALYTICS_FUNNEL_SECTIONS = ['hero-video', 'benefits', 'program', 'lead-form']
+ANALYTICS_FUNNEL_CLICKS = ['free_lesson_click', 'buy_click']
+ANALYTICS_REPORT_CACHE_TTL = 600        # сек, кэш отчётов на набор параметров
+ANALYTICS_EXPORT_CHUNK_SIZE = 2000      # строк на запрос при выгрузке CSV / NDJSON
+ANALYTICS_ADMIN_CHOICES_TTL = 3600      # сек, кэш вариантов фильтров в админке событий
+
+# телефоны лидов: номер без кода страны дополняем кодом Узбекистана
+ANALYTICS_DEFAULT_COUNTRY_CODE = '998'
+ANALYTICS_NATIONAL_NUMBER_LENGTH = 9
+ANALYTICS_LEAD_DUPLICATE_WINDOW_DAYS = 30   # повторная заявка в этот срок = дубль
+
+# максимум событий в одном запросе /api/track/batch/
+ANALYTICS_BATCH_MAX_EVENTS = 100
+
+# async-версии трекинга и лидов (analytics/async_views.py) — под ASGI,
+# под WSGI остаются синхронные вьюхи
+ANALYTICS_ASYNC_VIEWS = ASGI_MODE
+
+# write-behind: трекинг отвечает 202, запись уходит в базу фоновым потоком
+ANALYTICS_WRITE_BEHIND = False
+ANALYTICS_BUFFER_MAX_SIZE = 10_000      # записей в очереди на воркер
+ANALYTICS_BUFFER_PUT_TIMEOUT = 0.5      # сек ждём место в очереди, потом пишем сами
+ANALYTICS_FLUSH_INTERVAL_MS = 500
+ANALYTICS_FLUSH_BATCH = 500
+# записи, которые буфер так и не смог записать (replay_dead_letters)
+ANALYTICS_BUFFER_DEAD_LETTER = BASE_DIR.parent / 'analytics-dead-letter.ndjson'
+
+# кэш session_key -> pk для секций и кликов
+ANALYTICS_SESSION_CACHE_SIZE = 10_000
+ANALYTICS_SESSION_CACHE_TTL = 1800      # сек
+ANALYTICS_LAST_VISIT_WINDOW = 60        # last_visit трогаем не чаще раза в минуту
+
+# защита трекинга и лидов (analytics/throttle.py), лимиты — на воркер
+ANALYTICS_THROTTLE_ENABLED = True
+ANALYTICS_THROTTLE_RATES = {            # (запросов в секунду, запас на всплеск)
+    'ip': (5, 60),
+    'lead_ip': (0.05, 5),               # заявки: 5 подряд, потом одна в 20 сек
+    'session': (2, 30),
 }
+ANALYTICS_THROTTLE_CACHE_SIZE = 50_000  # ключей в каждом бакете (LRU)
+ANALYTICS_MAX_PAYLOAD_BYTES = 64 * 1024
+ANALYTICS_MAX_PAYLOAD_KEYS = 32
+ANALYTICS_MAX_PAYLOAD_DEPTH = 6     # batch: объект -> events -> событие -> meta -> ...
+
+# bench_ingest: максимум SQL на запрос (в среднем) по имени URL, больше — прогон падает
+ANALYTICS_BENCH_QUERY_BUDGETS = {
+    'api_page_view': 2,                 # upsert сессии + PageView
+    'api_section_view': 1,              # сессия из кэша, только INSERT
+    'api_click_event': 1,
+    'api_free_lesson_lead': 3,          # сессия, поиск дубля, INSERT
+}
+
+# generate_data: распределения синтетических данных поверх analytics.synthetic.DEFAULT_PROFILE
+ANALYTICS_SYNTHETIC_PROFILE = {}
 
 # ==========================================
 # PASSWORD VALIDATION
@@ -147,6 +263,86 @@ STATICFILES_DIRS = [
 ]
 # /opt/kurs/static
 
+# collectstatic: имена с хэшем + .gz/.br рядом (ilmi_backend/storage.py)
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "ilmi_backend.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# раздавать STATIC_ROOT из процесса (False — если статику отдаёт nginx)
+STATIC_SERVE_IN_PROCESS = True
+STATIC_MAX_AGE = 60     # сек, для файлов без хэша в имени
+
+# результат шагов сборки (build_images и др.), лежит внутри static/,
+# поэтому collectstatic и runserver видят его без отдельной настройки
+STATIC_BUILD_DIR = BASE_DIR.parent / "static" / "build"
+
+# адаптивные картинки: AVIF/WebP в нескольких ширинах (build_images)
+RESPONSIVE_IMAGE_SOURCES = [
+    "media/lesson *.png",
+    "media/logo.png",
+    "media/trailer.jpg",
+]
+RESPONSIVE_IMAGE_WIDTHS = [184, 400, 800, 1280]   # превью уроков 92px -> 184 для retina
+RESPONSIVE_IMAGE_FORMATS = ["avif", "webp"]
+RESPONSIVE_IMAGE_QUALITY = {"avif": 50, "webp": 75}
+RESPONSIVE_IMAGE_WORKERS = None                 # по числу ядер
+
+# CSS лендинга: один минифицированный бандл + критический CSS в <head> (build_css)
+CSS_BUNDLE_SOURCES = [
+    "css/style.css",
+    "css/accordion.css",
+    "css/3steps.css",
+    "css/phones.css",
+    "css/buttons.css",
+    "css/form.css",
+    "css/reviews.css",
+]
+# id секций первого экрана, их правила инлайнятся
+CSS_CRITICAL_SECTIONS = ["section-welcome", "section-hero"]
+# "bundle" — бандл + критический CSS, "files" — по файлу на исходник
+CSS_BUNDLE_MODE = "files" if DEBUG else "bundle"
+
+# подмножества шрифтов в WOFF2 (build_fonts, нужен fonttools): символы из
+# отрендеренного index.html и скриптов + базовый набор ниже
+FONT_SUBSET_SCRIPTS = ["js/script.js"]
+FONT_SUBSET_BASE = (
+    "".join(chr(code) for code in range(0x20, 0x7F))      # латиница, цифры, знаки
+    + "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+    + "ЎўҚқҒғҲҳ"                                           # узбекская кириллица
+    + "«»“”„‘’–—…№ ₽"
+)
+FONT_SUBSET_HINTING = False
+FONT_SUBSET_WORKERS = None                      # по числу ядер
+
+# ==========================================
+# METRICS
+# ==========================================
+
+# счётчики по эндпоинтам (MetricsMiddleware), в памяти воркера
+METRICS_ENABLED = True
+# /metrics в формате Prometheus — только если включить явно
+METRICS_ENDPOINT_ENABLED = False
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# запросы дольше порога пишутся в лог со списком SQL (None — не писать)
+METRICS_SLOW_REQUEST_MS = 1000
+METRICS_SLOW_SAMPLE_RATE = 1.0          # доля медленных запросов, которые логируем
+
+# ==========================================
+# LANDING PAGE
+# ==========================================
+
+# как часто (сек) проверять, не изменились ли index.html и статика;
+# при DEBUG — на каждый запрос
+LANDING_CHECK_INTERVAL = 0 if DEBUG else 5
+
+# куда prerender_landing кладёт готовый HTML для nginx
+LANDING_PRERENDER_DIR = BASE_DIR.parent / "prerendered"
+
 # ==========================================
 # DEFAULT PRIMARY KEY
 # ==========================================
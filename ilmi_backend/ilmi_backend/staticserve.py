@@ -0,0 +1,426 @@
+"""
+Раздача статики из STATIC_ROOT прямо в процессе (gunicorn / uvicorn),
+до URL-роутинга и остальных middleware.
+
+- индекс файлов строится один раз на процесс: на запрос — поиск в dict,
+  без stat и без обхода диска
+- из .br / .gz рядом с файлом (ilmi_backend/storage.py) выбирается лучший,
+  который клиент принимает в Accept-Encoding
+- имена с хэшем из манифеста collectstatic кэшируются навсегда (immutable),
+  остальные — ненадолго с ревалидацией по ETag
+- Range (один или несколько диапазонов) и If-Range — для перемотки
+  видео (trailer, right.mp4 и т.п.): 206 / multipart/byteranges / 416
+
+Файлы отдаются FileResponse: под gunicorn это wsgi.file_wrapper + sendfile,
+в том числе для одного диапазона (RangeFile отдаёт fileno() и нужную длину).
+После деплоя (collectstatic) воркеры нужно перезапустить — индекс не обновляется сам.
+"""
+import json
+import mimetypes
+import os
+import secrets
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.http import http_date, parse_http_date_safe
+
+
+# в порядке предпочтения
+ENCODINGS = (
+    ("br", ".br"),
+    ("gzip", ".gz"),
+)
+ENCODED_SUFFIXES = tuple(suffix for _, suffix in ENCODINGS)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# больше диапазонов в одном запросе не обслуживаем (отдаём файл целиком)
+MAX_RANGES = 16
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class StaticFile:
+    path: str
+    size: int
+    mtime: float
+    content_type: str
+    etag: str
+    immutable: bool
+    # кодировка -> (путь, размер)
+    encoded: dict = field(default_factory=dict)
+
+    def variant(self, accepted):
+        """(путь, размер, кодировка или None) — лучший вариант для клиента."""
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.encoded:
+                path, size = self.encoded[encoding]
+                return path, size, encoding
+        return self.path, self.size, None
+
+    @property
+    def cache_control(self):
+        if self.immutable:
+            return IMMUTABLE_CACHE_CONTROL
+        return f"public, max-age={getattr(settings, 'STATIC_MAX_AGE', 60)}"
+
+
+def content_type_for(path):
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def hashed_names(root):
+    """Имена файлов с хэшем из манифеста collectstatic."""
+    manifest = Path(root) / "staticfiles.json"
+    if not manifest.exists():
+        return set()
+    return set(json.loads(manifest.read_text()).get("paths", {}).values())
+
+
+class StaticIndex:
+
+    def __init__(self, files):
+        self.files = files
+
+    @classmethod
+    def build(cls, root, url_prefix):
+        root = Path(root)
+        files = {}
+        if not root.is_dir():
+            return cls(files)
+
+        immutable = hashed_names(root)
+        for directory, _, names in os.walk(root):
+            present = set(names)
+            for name in names:
+                if name.endswith(ENCODED_SUFFIXES) and os.path.splitext(name)[0] in present:
+                    continue
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                relative = Path(path).relative_to(root).as_posix()
+                encoded = {
+                    encoding: (path + suffix, os.stat(path + suffix).st_size)
+                    for encoding, suffix in ENCODINGS
+                    if name + suffix in present
+                }
+                files[url_prefix + relative] = StaticFile(
+                    path=path,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime,
+                    content_type=content_type_for(name),
+                    etag=f"{int(stat.st_mtime):x}-{stat.st_size:x}",
+                    immutable=relative in immutable,
+                    encoded=encoded,
+                )
+        return cls(files)
+
+    def get(self, url_path):
+        return self.files.get(url_path)
+
+    def __len__(self):
+        return len(self.files)
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из Accept-Encoding с q > 0. "*" добавляет наши кодировки,
+    кроме явно запрещённых (br;q=0, *).
+    """
+    weights = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding] = q
+    accepted = {coding for coding, q in weights.items() if q > 0}
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS if encoding not in weights)
+    return accepted
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+# ----- Range -----
+
+def parse_range(header, size):
+    """
+    Range: bytes=0-99,200-,-500 -> [(start, end), ...] (end включительно),
+    пересекающиеся диапазоны склеиваются.
+    None — заголовок не разобрать (отдаём файл целиком),
+    [] — ни один диапазон не попадает в файл (416).
+    """
+    units, _, spec = (header or "").partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last):
+            return None
+        if any(value and not value.isdigit() for value in (first, last)):
+            return None
+
+        if not first:
+            # суффикс: последние N байт
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else None
+            if end is not None and end < start:
+                return None
+            if start >= size:
+                continue
+            end = size - 1 if end is None else min(end, size - 1)
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(header, etag, mtime):
+    """If-Range: сильный ETag или дата. Не совпало — Range игнорируем, отдаём 200."""
+    if not header:
+        return True
+    header = header.strip()
+    if header.startswith(("\"", "W/")):
+        return header == etag
+    since = parse_http_date_safe(header)
+    return since is not None and since == int(mtime)
+
+
+class RangeFile:
+    """
+    Окно [start, start + length) открытого файла.
+    fileno() отдаём как есть, позиция файла уже стоит на start:
+    gunicorn делает sendfile с текущей позиции на Content-Length байт.
+    Без sendfile read() не выходит за конец окна.
+    """
+
+    def __init__(self, fh, start, length):
+        self.fh = fh
+        self.remaining = length
+        fh.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def _read_slice(fh, start, end):
+    fh.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = fh.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def multipart_ranges(path, ranges, size, content_type, boundary):
+    """(генератор тела, Content-Length) для multipart/byteranges."""
+    heads = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("ascii")
+        for start, end in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode("ascii")
+    length = sum(len(head) + (end - start + 1) + 2 for head, (start, end) in zip(heads, ranges))
+    length += len(tail)
+
+    def body():
+        with open(path, "rb") as fh:
+            for head, (start, end) in zip(heads, ranges):
+                yield head
+                yield from _read_slice(fh, start, end)
+                yield b"\r\n"
+        yield tail
+
+    return body(), length
+
+
+def partial_response(static_file, ranges):
+    size = static_file.size
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(open(static_file.path, "rb"), start, length),
+            status=206,
+            content_type=static_file.content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(length)
+        return response
+
+    boundary = secrets.token_hex(16)
+    body, length = multipart_ranges(static_file.path, ranges, size, static_file.content_type, boundary)
+    response = StreamingHttpResponse(
+        body, status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+    )
+    response["Content-Length"] = str(length)
+    return response
+
+
+def range_not_satisfiable(static_file):
+    response = HttpResponse(status=416)
+    response["Content-Range"] = f"bytes */{static_file.size}"
+    return response
+
+
+# ----- ответ -----
+
+def serve(request, static_file):
+    identity_etag = f'"{static_file.etag}"'
+    range_header = request.META.get("HTTP_RANGE")
+    ranges = None
+    if range_header and request.method == "GET" and if_range_matches(
+        request.META.get("HTTP_IF_RANGE"), identity_etag, static_file.mtime
+    ):
+        ranges = parse_range(range_header, static_file.size)
+
+    if ranges is not None:
+        # диапазоны — всегда по несжатому файлу
+        path, size, encoding = static_file.path, static_file.size, None
+    else:
+        path, size, encoding = static_file.variant(
+            accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING"))
+        )
+    etag = f'"{static_file.etag}-{encoding}"' if encoding else identity_etag
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(static_file.mtime),
+        "Cache-Control": static_file.cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if static_file.encoded:
+        headers["Vary"] = "Accept-Encoding"
+
+    if etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), etag):
+        response = HttpResponseNotModified()
+    elif ranges == []:
+        response = range_not_satisfiable(static_file)
+    elif ranges:
+        response = partial_response(static_file, ranges)
+    elif request.method == "HEAD":
+        response = HttpResponse(content_type=static_file.content_type)
+        response["Content-Length"] = str(size)
+    else:
+        response = FileResponse(open(path, "rb"), content_type=static_file.content_type)
+        response["Content-Length"] = str(size)
+        if "Content-Disposition" in response:
+            del response["Content-Disposition"]
+
+    if encoding and response.status_code == 200:
+        response["Content-Encoding"] = encoding
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+class StaticFilesMiddleware:
+    """
+    Ставится сразу после SecurityMiddleware. Отключается через
+    STATIC_SERVE_IN_PROCESS = False (если статику раздаёт nginx).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "STATIC_SERVE_IN_PROCESS", True) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+        self._index = None
+        self._lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = StaticIndex.build(settings.STATIC_ROOT, self.prefix)
+        return self._index
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        static_file = self.lookup(request)
+        if static_file is not None:
+            return serve(request, static_file)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        static_file = self.lookup(request)
+        if static_file is not None:
+            # open/stat файла — в потоке; само тело ASGI-сервер отдаёт из итератора FileResponse
+            return await sync_to_async(serve, thread_sensitive=False)(request, static_file)
+        return await self.get_response(request)
+
+    def lookup(self, request):
+        if request.method in ("GET", "HEAD") and request.path_info.startswith(self.prefix):
+            return self.index.get(request.path_info)
+        return None
@@ -0,0 +1,73 @@
+"""
+Хранилище статики для collectstatic: имена с хэшем содержимого
+(ManifestStaticFilesStorage) + готовые сжатые копии рядом с файлом:
+
+    css/style.3c1f0a9b2e7d.css
+    css/style.3c1f0a9b2e7d.css.gz
+    css/style.3c1f0a9b2e7d.css.br     (если установлен Brotli)
+
+Сжимаем один раз при сборке на максимальном уровне, отдаёт их
+ilmi_backend/staticserve.py (или nginx с gzip_static / brotli_static).
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # Brotli — необязательная зависимость, без неё только .gz
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".html", ".txt", ".xml",
+    ".ico", ".ttf", ".otf", ".eot",
+)
+
+# меньше — выигрыш не окупает лишний файл
+MIN_COMPRESS_SIZE = 512
+
+# сжатая копия должна быть хотя бы на 5% меньше оригинала
+MAX_COMPRESS_RATIO = 0.95
+
+
+def compressors():
+    yield ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield ".br", lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # нет записи в манифесте (файл добавили без collectstatic) — отдаём исходное имя
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # манифеста и файла в STATIC_ROOT нет (тесты, свежий checkout)
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in sorted(set(self.hashed_files.values())):
+                self.compress(name)
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        with self.open(name) as fh:
+            data = fh.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+
+        for suffix, compress in compressors():
+            target = name + suffix
+            # имя с хэшем — содержимое не меняется, уже сжатое не пересжимаем
+            if self.exists(target):
+                continue
+            compressed = compress(data)
+            if len(compressed) <= len(data) * MAX_COMPRESS_RATIO:
+                self._save(target, ContentFile(compressed))
@@ -0,0 +1,52 @@
+import posixpath
+
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from ilmi_backend import cssbundle, images
+
+
+register = template.Library()
+
+
+def _stylesheets():
+    return format_html_join(
+        "\n", '<link rel="stylesheet" href="{}">', ((static(name),) for name in cssbundle.sources())
+    )
+
+
+def _inline(css):
+    """url() критического CSS -> URL статики (с хэшем после collectstatic)."""
+    base = images.static_name(cssbundle.PREFIX)
+    css = cssbundle.rewrite_urls(
+        css, lambda url: static(posixpath.normpath(posixpath.join(base, url)))
+    )
+    return css.strip().replace("</", "<\\/")
+
+
+@register.simple_tag
+def css_bundle():
+    """
+    {% css_bundle %}
+
+    CSS_BUNDLE_MODE = "bundle": критический CSS в <style> и бандл без
+    блокировки отрисовки (preload + onload, <noscript> для браузеров без JS).
+    "files" или бандл ещё не собран (build_css) — по <link> на исходник.
+    """
+    mode = getattr(settings, "CSS_BUNDLE_MODE", "bundle")
+    manifest, critical = cssbundle.current() if mode == "bundle" else (None, "")
+    if manifest is None:
+        return _stylesheets()
+
+    href = static(images.static_name(manifest["bundle"]))
+    return format_html(
+        "<style>{}</style>\n"
+        '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        mark_safe(_inline(critical)),
+        href,
+        href,
+    )
@@ -0,0 +1,67 @@
+from django import template
+from django.templatetags.static import static as static_url
+from django.utils.encoding import iri_to_uri
+from django.utils.html import format_html, format_html_join
+
+from ilmi_backend import images
+
+
+register = template.Library()
+
+
+def static(path):
+    """
+    {% static %}, но с экранированным URL: хранилище с манифестом отдаёт
+    его unquote'нутым, а пробел в имени ("lesson 1.png") ломает srcset.
+    """
+    return iri_to_uri(static_url(path))
+
+
+def _srcset(variants):
+    return ", ".join(f"{static(images.static_name(name))} {width}w" for width, name in variants)
+
+
+@register.simple_tag
+def responsive_image(path, alt="", sizes="100vw", loading="lazy", **attrs):
+    """
+    {% responsive_image "media/lesson 1.png" alt="Дарс 1" sizes="92px" class="cp-thumb" %}
+
+    <picture> с AVIF/WebP из манифеста build_images и исходником в <img>
+    как запасным вариантом. Нет записи в манифесте — просто <img>.
+    """
+    entry = images.manifest_entry(path)
+    img_attrs = {"src": static(path), "alt": alt, "loading": loading, "decoding": "async", **attrs}
+    if entry is None:
+        return format_html("<img {}>", format_html_join(" ", '{}="{}"', img_attrs.items()))
+
+    img_attrs.update(width=entry["width"], height=entry["height"])
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (images.MIME_TYPES[fmt], _srcset(variants), sizes)
+            for fmt, variants in entry["variants"].items()
+            if variants
+        ),
+    )
+    return format_html(
+        '<picture class="responsive">{}<img {}></picture>',
+        sources,
+        format_html_join(" ", '{}="{}"', img_attrs.items()),
+    )
+
+
+@register.simple_tag
+def responsive_url(path, width, fmt="webp"):
+    """
+    URL одного варианта (для poster у <video> и т.п.): ближайшая ширина >= width.
+    Нет такого варианта — URL исходника.
+    """
+    entry = images.manifest_entry(path)
+    variants = (entry or {}).get("variants", {}).get(fmt)
+    if not variants:
+        return static(path)
+    for variant_width, name in variants:
+        if variant_width >= int(width):
+            return static(images.static_name(name))
+    return static(images.static_name(variants[-1][1]))
@@ -0,0 +1,544 @@
+import gzip
+import json
+import os
+import tempfile
+from email.parser import BytesParser
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from . import cssbundle, fonts, images, landing, metrics, staticserve, storage
+
+
+class LandingCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        landing.page_cache.clear()
+
+    def test_served_from_cache_with_validators(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{landing.get_page().etag}"')
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(response.content, landing.get_page().body)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get("/")["ETag"]
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_rerendered_when_sources_change(self):
+        first = landing.get_page()
+        changed = first.fingerprint + (("static/css/style.css", 1, 1),)
+        with self.settings(LANDING_CHECK_INTERVAL=0), \
+                mock.patch.object(landing, "fingerprint", return_value=changed):
+            self.assertIsNot(landing.get_page(), first)
+            self.assertEqual(landing.get_page().fingerprint, changed)
+
+
+class StaticRangeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.data = bytes(range(256)) * 40  # 10240 байт
+        os.makedirs(os.path.join(self.tmp.name, "media"))
+        with open(os.path.join(self.tmp.name, "media", "clip.mp4"), "wb") as fh:
+            fh.write(self.data)
+        index = staticserve.StaticIndex.build(self.tmp.name, "/static/")
+        self.static_file = index.get("/static/media/clip.mp4")
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        request = self.factory.get("/static/media/clip.mp4", **headers)
+        return staticserve.serve(request, self.static_file)
+
+    def body(self, response):
+        content = b"".join(response.streaming_content)
+        response.close()
+        return content
+
+    def test_full_response_advertises_ranges(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(self.body(response), self.data)
+
+    def test_single_ranges_are_byte_exact(self):
+        size = len(self.data)
+        cases = {
+            "bytes=0-0": (0, 0),
+            "bytes=100-4195": (100, 4195),
+            "bytes=10000-": (10000, size - 1),
+            "bytes=-300": (size - 300, size - 1),
+            "bytes=9000-99999": (9000, size - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{size}")
+                self.assertEqual(int(response["Content-Length"]), end - start + 1)
+                self.assertNotIn("Content-Encoding", response)
+                self.assertEqual(self.body(response), self.data[start:end + 1])
+
+    def test_range_file_is_sendfile_ready(self):
+        with open(self.static_file.path, "rb") as fh:
+            window = staticserve.RangeFile(fh, 500, 10)
+            # sendfile берёт текущую позицию и Content-Length
+            self.assertEqual(os.lseek(window.fileno(), 0, os.SEEK_CUR), 500)
+            self.assertEqual(window.read(4), self.data[500:504])
+            self.assertEqual(window.read(), self.data[504:510])
+            self.assertEqual(window.read(), b"")
+
+    def test_multiple_ranges_are_multipart(self):
+        response = self.get(HTTP_RANGE="bytes=0-9, 5000-5009, -5")
+        self.assertEqual(response.status_code, 206)
+        content = self.body(response)
+        self.assertEqual(int(response["Content-Length"]), len(content))
+
+        message = BytesParser().parsebytes(
+            f"Content-Type: {response['Content-Type']}\r\n\r\n".encode() + content
+        )
+        parts = message.get_payload()
+        size = len(self.data)
+        expected = [(0, 9), (5000, 5009), (size - 5, size - 1)]
+        self.assertEqual(len(parts), len(expected))
+        for part, (start, end) in zip(parts, expected):
+            self.assertEqual(part["Content-Range"], f"bytes {start}-{end}/{size}")
+            self.assertEqual(part.get_payload(decode=True), self.data[start:end + 1])
+
+    def test_overlapping_ranges_are_merged(self):
+        response = self.get(HTTP_RANGE="bytes=0-99,50-199")
+        self.assertEqual(response["Content-Range"], f"bytes 0-199/{len(self.data)}")
+        self.assertEqual(self.body(response), self.data[:200])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f"bytes={len(self.data)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+    def test_malformed_range_is_ignored(self):
+        for header in ("bytes=abc", "items=0-5", "bytes=9-2"):
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.data)
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        last_modified = http_date(self.static_file.mtime)
+        for if_range, status in (
+            (etag, 206),
+            (last_modified, 206),
+            ('"stale"', 200),
+            (f"W/{etag}", 200),
+            (http_date(self.static_file.mtime - 3600), 200),
+        ):
+            with self.subTest(if_range):
+                response = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, status)
+                content = self.body(response)
+                self.assertEqual(content, self.data[:10] if status == 206 else self.data)
+
+
+class StaticEncodingTests(SimpleTestCase):
+    """Выбор .br / .gz по Accept-Encoding и заголовки кэширования."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        files = {
+            "css/app.3c1f0a9b2e7d.css": b"body{}",
+            "css/app.3c1f0a9b2e7d.css.gz": b"gzip",
+            "css/app.3c1f0a9b2e7d.css.br": b"brotli",
+            "robots.txt": b"User-agent: *",
+            "staticfiles.json": json.dumps({"paths": {"css/app.css": "css/app.3c1f0a9b2e7d.css"}}).encode(),
+        }
+        for name, data in files.items():
+            path = os.path.join(self.tmp.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as fh:
+                fh.write(data)
+        self.index = staticserve.StaticIndex.build(self.tmp.name, "/static/")
+        self.factory = RequestFactory()
+
+    def get(self, url, **headers):
+        response = staticserve.serve(self.factory.get(url, **headers), self.index.get(url))
+        body = b"".join(response.streaming_content)
+        response.close()
+        return response, body
+
+    def test_accepted_encodings(self):
+        self.assertEqual(staticserve.accepted_encodings("gzip, deflate, br"), {"gzip", "deflate", "br"})
+        self.assertEqual(staticserve.accepted_encodings("br;q=0, gzip;q=0.5"), {"gzip"})
+        self.assertEqual(staticserve.accepted_encodings("br; q=0 , *"), {"*", "gzip"})
+        self.assertEqual(staticserve.accepted_encodings("gzip;q=oops"), set())
+        self.assertEqual(staticserve.accepted_encodings(None), set())
+
+    def test_prefers_br_over_gzip(self):
+        url = "/static/css/app.3c1f0a9b2e7d.css"
+        for accept, encoding, body in (
+            ("gzip, br", "br", b"brotli"),
+            ("gzip, br;q=0", "gzip", b"gzip"),
+            ("br;q=0, gzip;q=0", None, b"body{}"),
+            ("", None, b"body{}"),
+        ):
+            with self.subTest(accept=accept):
+                response, content = self.get(url, HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(content, body)
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+                self.assertEqual(response["Content-Length"], str(len(body)))
+                self.assertEqual(response["Vary"], "Accept-Encoding")
+                # у каждой кодировки свой ETag, иначе кэш перепутает тела
+                self.assertEqual(response["ETag"].endswith(f'-{encoding}"'), encoding is not None)
+
+    def test_cache_control(self):
+        response, _ = self.get("/static/css/app.3c1f0a9b2e7d.css")
+        self.assertEqual(response["Cache-Control"], staticserve.IMMUTABLE_CACHE_CONTROL)
+
+        with override_settings(STATIC_MAX_AGE=120):
+            response, _ = self.get("/static/robots.txt", HTTP_ACCEPT_ENCODING="br, gzip")
+        self.assertEqual(response["Cache-Control"], "public, max-age=120")
+        self.assertNotIn("Content-Encoding", response)
+        # сжатых копий нет — ответ от Accept-Encoding не зависит
+        self.assertNotIn("Vary", response)
+
+    def test_siblings_are_not_served_as_files(self):
+        self.assertIsNone(self.index.get("/static/css/app.3c1f0a9b2e7d.css.gz"))
+        self.assertIsNotNone(self.index.get("/static/robots.txt"))
+
+
+class CompressedStorageTests(SimpleTestCase):
+    """post_process: .gz / .br рядом с файлами с хэшем, кроме мелких и несжимаемых."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.storage = storage.CompressedManifestStaticFilesStorage(location=self.tmp.name, base_url="/static/")
+        self.sources = {
+            "css/app.css": b"body { color: red; }\n" * 100,
+            "css/tiny.css": b"a{}",
+            "js/random.js": os.urandom(4096),  # не сжимается на 5%
+            "img/logo.png": b"\x89PNG" + b"\0" * 4096,  # png уже сжат, расширение не из списка
+        }
+        for name, data in self.sources.items():
+            self.storage.save(name, ContentFile(data))
+
+    def collect(self):
+        paths = {name: (self.storage, name) for name in self.sources}
+        list(self.storage.post_process(paths))
+        return self.storage.hashed_files
+
+    def test_writes_siblings(self):
+        hashed = self.collect()
+        app = hashed["css/app.css"]
+        self.assertNotEqual(app, "css/app.css")
+        with self.storage.open(app + ".gz") as fh:
+            self.assertEqual(gzip.decompress(fh.read()), self.sources["css/app.css"])
+        if storage.brotli is not None:
+            with self.storage.open(app + ".br") as fh:
+                self.assertEqual(storage.brotli.decompress(fh.read()), self.sources["css/app.css"])
+
+        for name in ("css/tiny.css", "js/random.js", "img/logo.png"):
+            with self.subTest(name=name):
+                for suffix in (".gz", ".br"):
+                    self.assertFalse(self.storage.exists(hashed[name] + suffix))
+
+    def test_existing_siblings_are_kept(self):
+        hashed = self.collect()
+        target = hashed["css/app.css"] + ".gz"
+        os.utime(self.storage.path(target), (1, 1))
+        self.collect()
+        self.assertEqual(os.path.getmtime(self.storage.path(target)), 1)
+
+    def test_without_brotli_only_gzip(self):
+        with mock.patch.object(storage, "brotli", None):
+            app = self.collect()["css/app.css"]
+        self.assertTrue(self.storage.exists(app + ".gz"))
+        self.assertFalse(self.storage.exists(app + ".br"))
+
+
+class ResponsiveImageTests(SimpleTestCase):
+    """build_images: инкрементальная сборка и чистка; {% responsive_image %} и запасной <img>."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "static")
+        os.makedirs(os.path.join(self.root, "media"))
+        settings = self.settings(
+            STATICFILES_DIRS=[self.root],
+            STATIC_BUILD_DIR=os.path.join(self.root, "build"),
+            STATIC_URL="/static/",
+            RESPONSIVE_IMAGE_SOURCES=["media/*.png"],
+            RESPONSIVE_IMAGE_WIDTHS=[8, 16, 64],
+            RESPONSIVE_IMAGE_FORMATS=["webp"],
+            RESPONSIVE_IMAGE_WORKERS=1,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.image("lesson 1.png", "red")
+        self.image("logo.png", "blue")
+
+    def image(self, name, color):
+        from PIL import Image
+
+        Image.new("RGB", (32, 20), color).save(os.path.join(self.root, "media", name))
+
+    def built(self):
+        return sorted(os.listdir(os.path.join(self.root, "build", images.PREFIX)))
+
+    def render(self, source):
+        return Template("{% load responsive %}" + source).render(Context())
+
+    def test_incremental_build(self):
+        self.assertEqual(images.build(), (2, 0))
+        first = self.built()
+        self.assertIn(images.MANIFEST_NAME, first)
+        lesson = images.manifest_entry("media/lesson 1.png")
+        self.assertEqual((lesson["width"], lesson["height"]), (32, 20))
+        # 64 шире исходника — не растягиваем, берём исходную ширину
+        self.assertEqual([width for width, _ in lesson["variants"]["webp"]], [8, 16, 32])
+
+        with mock.patch.object(images, "encode_source") as encode:
+            self.assertEqual(images.build(), (0, 2))
+        encode.assert_not_called()
+        self.assertEqual(self.built(), first)
+
+        # пропавший вариант пересобирается
+        os.remove(os.path.join(self.root, "build", lesson["variants"]["webp"][0][1]))
+        self.assertEqual(images.build(), (1, 1))
+        self.assertEqual(self.built(), first)
+
+    def test_stale_variants_are_removed(self):
+        images.build()
+        old_lesson = images.variant_files(images.manifest_entry("media/lesson 1.png"))
+        logo = images.variant_files(images.manifest_entry("media/logo.png"))
+
+        self.image("lesson 1.png", "green")
+        self.assertEqual(images.build(), (1, 1))
+        new_lesson = images.variant_files(images.manifest_entry("media/lesson 1.png"))
+        self.assertFalse(old_lesson & new_lesson)
+        expected = sorted(os.path.basename(name) for name in new_lesson | logo)
+        self.assertEqual(self.built(), sorted([images.MANIFEST_NAME, *expected]))
+
+        os.remove(os.path.join(self.root, "media", "logo.png"))
+        self.assertEqual(images.build(), (0, 1))
+        self.assertIsNone(images.manifest_entry("media/logo.png"))
+        expected = sorted(os.path.basename(name) for name in new_lesson)
+        self.assertEqual(self.built(), sorted([images.MANIFEST_NAME, *expected]))
+
+    def test_picture_markup(self):
+        images.build()
+        entry = images.manifest_entry("media/lesson 1.png")
+        html = self.render(
+            '{% responsive_image "media/lesson 1.png" alt="Дарс 1" sizes="92px" class="cp-thumb" %}'
+        )
+
+        srcset = ", ".join(f"/static/build/{name} {width}w" for width, name in entry["variants"]["webp"])
+        self.assertTrue(html.startswith('<picture class="responsive"><source type="image/webp"'))
+        self.assertIn(f'srcset="{srcset}" sizes="92px">', html)
+        # пробел в имени исходника: в srcset идут слаги, в src — экранированный URL
+        self.assertIn("/responsive/lesson-1.", srcset)
+        self.assertIn('<img src="/static/media/lesson%201.png" alt="Дарс 1" loading="lazy" decoding="async" '
+                      'class="cp-thumb" width="32" height="20"></picture>', html)
+
+        self.assertEqual(
+            self.render('{% responsive_url "media/lesson 1.png" 10 %}'),
+            f"/static/build/{entry['variants']['webp'][1][1]}",
+        )
+
+    def test_plain_img_without_manifest_entry(self):
+        html = self.render('{% responsive_image "media/lesson 1.png" alt="Дарс" %}')
+        self.assertEqual(html, '<img src="/static/media/lesson%201.png" alt="Дарс" loading="lazy" decoding="async">')
+
+        images.build()
+        html = self.render('{% responsive_image "media/new.png" alt="" %}')
+        self.assertEqual(html, '<img src="/static/media/new.png" alt="" loading="lazy" decoding="async">')
+        self.assertEqual(self.render('{% responsive_url "media/new.png" 320 %}'), "/static/media/new.png")
+
+
+class CssBundleTests(SimpleTestCase):
+
+    def test_minify_keeps_strings_and_selector_spaces(self):
+        css = """
+        /* комментарий */
+        a :hover , .b > .c { content: "  a ; b  " ; background: url( "x y.png" ) ; }
+        @media (max-width: 600px) { .d { width: calc(100% - 16px); } }
+        .empty { }
+        """
+        self.assertEqual(
+            cssbundle.minify(css),
+            'a :hover,.b>.c{content:"  a ; b  ";background:url( "x y.png" )}'
+            "@media (max-width:600px){.d{width:calc(100% - 16px)}}",
+        )
+
+    def test_rebase_urls(self):
+        css = 'a{background:url("../font/a.ttf?v=1")}b{background:url(data:image/png;base64,AA)}'
+        self.assertEqual(
+            cssbundle.rebase_urls(css, "css", "build/css"),
+            'a{background:url("../../font/a.ttf?v=1")}b{background:url(data:image/png;base64,AA)}',
+        )
+
+    def test_critical_rules_follow_section_markup(self):
+        html = """
+        <div class="page-wrapper">
+          <header id="section-welcome" class="banner">Hi</header>
+          <section id="other"><p class="later">x</p></section>
+        </div>
+        """
+        css = """
+        :root { --x: 1; }
+        .page-wrapper .banner:hover { color: red; animation: pulse 1s; }
+        .later { color: blue; }
+        .banner .later { color: green; }
+        @media (max-width: 600px) { .banner { font-size: 12px; } .later { display: none; } }
+        @keyframes pulse { from { opacity: 0; } to { opacity: 1; } }
+        @keyframes unused { from { opacity: 0; } }
+        """
+        nodes = cssbundle.parse(cssbundle.strip_comments(css))
+        critical = cssbundle.serialize(cssbundle.extract_critical(nodes, html, ["section-welcome"]))
+        self.assertEqual(
+            critical,
+            ":root{--x:1}.page-wrapper .banner:hover{color:red;animation:pulse 1s}"
+            "@media (max-width:600px){.banner{font-size:12px}}"
+            "@keyframes pulse{from{opacity:0}to{opacity:1}}",
+        )
+
+    def test_build_is_deterministic_and_cached(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "css"))
+            with open(os.path.join(root, "css", "a.css"), "w") as fh:
+                fh.write(".welcome-banner { color: red; }\n.footer { color: blue; }\n")
+            with self.settings(
+                STATICFILES_DIRS=[root],
+                STATIC_BUILD_DIR=os.path.join(root, "build"),
+                CSS_BUNDLE_SOURCES=["css/a.css"],
+                CSS_CRITICAL_SECTIONS=["section-welcome"],
+            ):
+                first, rebuilt = cssbundle.build()
+                self.assertTrue(rebuilt)
+                second, rebuilt = cssbundle.build()
+                self.assertFalse(rebuilt)
+                self.assertEqual(first, second)
+                critical = os.path.join(root, "build", first["critical"])
+                with open(critical) as fh:
+                    self.assertEqual(fh.read(), ".welcome-banner{color:red}\n")
+
+
+class FontSubsetTests(SimpleTestCase):
+    CSS = """
+    @font-face { font-family: "SF Pro Text"; src: url("../font/R.ttf"); font-weight: 400; }
+    @font-face { font-family: "SF Pro Text"; src: url("../font/B.ttf"); font-weight: 700; }
+    @font-face { font-family: "SF Pro Text"; src: url("../font/H.ttf"); font-weight: 900; }
+    @font-face { font-family: "SF Pro Text"; src: url("../font/I.ttf"); font-style: italic; }
+    @font-face { font-family: Other; src: url(../font/O.otf); }
+    body { font: 16px/1.4 "SF Pro Text", sans-serif; }
+    .price { font-weight: 800; }
+    """
+
+    def markup(self, html):
+        collector = fonts.TextCollector()
+        collector.feed(html)
+        return collector
+
+    def test_match_weight_follows_browser_fallback(self):
+        self.assertEqual(fonts.match_weight(800, {400, 700}), 700)
+        self.assertEqual(fonts.match_weight(800, {400, 700, 900}), 900)
+        self.assertEqual(fonts.match_weight(400, {300, 500}), 500)
+        self.assertEqual(fonts.match_weight(300, {400, 700}), 400)
+
+    def test_used_faces(self):
+        nodes = cssbundle.parse(self.CSS)
+        faces = fonts.font_faces(nodes, "css")
+        used = fonts.used_faces(faces, nodes, self.markup("<p>text</p>"))
+        self.assertEqual([face["source"] for face in used], ["font/R.ttf", "font/H.ttf"])
+
+        used = fonts.used_faces(faces, nodes, self.markup("<h2>a</h2><i>b</i>"))
+        self.assertEqual(
+            [face["source"] for face in used],
+            ["font/R.ttf", "font/B.ttf", "font/H.ttf", "font/I.ttf"],
+        )
+
+    def test_inline_style_attributes_count(self):
+        nodes = cssbundle.parse(self.CSS)
+        faces = fonts.font_faces(nodes, "css")
+        used = fonts.used_faces(faces, nodes, self.markup(
+            '<h1 style="text-transform: uppercase; font-family: Other; font-size: 35px;">a</h1>'
+            '<p style="font-style: italic">b</p>'
+        ))
+        self.assertEqual(
+            [face["source"] for face in used],
+            ["font/R.ttf", "font/B.ttf", "font/H.ttf", "font/I.ttf", "font/O.otf"],
+        )
+
+    def test_glyph_text_skips_scripts(self):
+        markup = self.markup('<p>Салом ҳаммага</p><input placeholder="Исм"><script>var x = "Ж";</script>')
+        with self.settings(FONT_SUBSET_BASE="", FONT_SUBSET_SCRIPTS=[]):
+            text = fonts.glyph_text(markup)
+        self.assertIn("Ҳ", text)
+        self.assertIn("И", text)
+        self.assertNotIn("Ж", text)
+
+    def test_font_faces_rewritten_to_woff2(self):
+        with tempfile.TemporaryDirectory() as root:
+            with self.settings(STATICFILES_DIRS=[root], STATIC_BUILD_DIR=os.path.join(root, "build")):
+                os.makedirs(os.path.join(root, "build", "fonts"))
+                fonts.save_manifest({"font/R.ttf": {
+                    "digest": "abc", "woff2": "fonts/R.abc.woff2",
+                    "bytes": {"source": 10, "woff2": 1},
+                }})
+                css = '@font-face{font-family:X;src:url("../../font/R.ttf") format("truetype");font-weight:400}' \
+                      "@font-face{font-family:Y;src:url(../../font/O.otf)}"
+                self.assertEqual(
+                    fonts.rewrite_font_faces(css, "build/css", "build/css"),
+                    '@font-face{font-family:X;src:url("../fonts/R.abc.woff2") format("woff2");font-weight:400}'
+                    "@font-face{font-family:Y;src:url(../../font/O.otf)}",
+                )
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+
+    def test_requests_recorded_per_url_name(self):
+        self.client.get("/")
+        self.client.get("/")
+        self.client.get("/no-such-page/")
+        snapshot = metrics.registry.snapshot()
+        self.assertEqual(snapshot[("requests", "home", 200)], 2)
+        self.assertEqual(snapshot[("duration_count", "home")], 2)
+        self.assertEqual(snapshot[("response_bytes", "home")], 2 * len(landing.get_page().body))
+        self.assertEqual(snapshot[("requests", "unmatched", 404)], 1)
+
+        text = metrics.render(snapshot)
+        self.assertIn('ilmi_http_request_duration_seconds_count{view="home",worker=', text)
+        self.assertRegex(text, r'ilmi_http_request_duration_seconds_bucket\{view="home",le="\+Inf",worker="\d+"\} 2')
+
+    def test_query_recorder(self):
+        recorder = metrics.QueryRecorder(keep_sql=True)
+        context = {"connection": mock.Mock(alias="default")}
+        recorder(lambda *args: "rows", "SELECT 1", None, False, context)
+        self.assertEqual(recorder.count, 1)
+        self.assertEqual(recorder.queries[0][1:], ("default", "SELECT 1"))
+
+    def test_endpoint_is_opt_in(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with self.settings(METRICS_ENDPOINT_ENABLED=True):
+            self.client.get("/")
+            response = self.client.get("/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("# TYPE ilmi_http_request_duration_seconds histogram", response.content.decode())
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.1.1.1").status_code, 404)
+
+    def test_slow_requests_logged(self):
+        with self.settings(METRICS_SLOW_REQUEST_MS=0), \
+                self.assertLogs("ilmi_backend.metrics", "WARNING") as logs:
+            self.client.get("/")
+        self.assertIn("slow request GET / (home)", logs.output[0])
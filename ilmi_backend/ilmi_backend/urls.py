@@ -8,6 +8,9 @@ urlpatterns = [
     # Главная страница (лендинг)
     path("", views.home, name="home"),
 
+    # метрики Prometheus (выключено по умолчанию, METRICS_ENDPOINT_ENABLED)
+    path("metrics", views.metrics, name="metrics"),
+
     # API аналитики
     path("", include("analytics.urls")),
 ]
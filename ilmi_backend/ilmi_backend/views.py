@@ -1,8 +1,48 @@
-from django.shortcuts import render
+import datetime
 
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from . import landing
+from .metrics import render as render_metrics
+
+
+def _etag(request):
+    return landing.get_page().etag
+
+
+def _last_modified(request):
+    return datetime.datetime.fromtimestamp(landing.get_page().last_modified, datetime.timezone.utc)
+
+
+@require_safe
+@condition(etag_func=_etag, last_modified_func=_last_modified)
 def home(request):
     """
     Главная точка входа для фронтенда.
-    Загружает index.html из корня проекта.
+    index.html рендерится один раз и отдаётся из кэша (ilmi_backend/landing.py),
+    повторный заход с If-None-Match получает 304 без тела.
+    """
+    page = landing.get_page()
+    response = HttpResponse(page.body, content_type="text/html; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+@require_safe
+def metrics(request):
+    """
+    Метрики этого воркера в формате Prometheus (ilmi_backend/metrics.py).
+    Выключено, пока METRICS_ENDPOINT_ENABLED = False; доступ — с
+    METRICS_ALLOWED_IPS (REMOTE_ADDR, без X-Forwarded-For) или для staff.
     """
-    return render(request, "index.html")
+    if not getattr(settings, "METRICS_ENDPOINT_ENABLED", False):
+        raise Http404
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+    if request.META.get("REMOTE_ADDR") not in allowed and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(
+        render_metrics(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )